@@ -3,25 +3,37 @@
 import streamlit as st
 from typing import List
 from arcana_data import PRECEPTS, NUMEN, MODIFIERS
+import arcana_export
 from arcana_core import (
     ModifierSelection,
     Ordinance,
+    batch_evaluate,
     build_canonical_key,
     calculate_complexity,
     derive_tier,
-    load_ordinances,
-    save_ordinances,
+    load_ordinances_cached,
+    insert_ordinance,
+    count_ordinances,
+    import_ordinances,
     find_by_canonical_key,
-    next_ordinance_id,
+    grimoire_distribution,
+    grimoire_facets,
+    query_ordinance_ids,
+    reverse_search,
     suggest_mechanics,
-    export_ordinances_json_bytes
+    sync_status,
+    export_ordinances_bytes,
+    EXPORT_FORMATS,
 )
 
 
 st.set_page_config(page_title="A.R.C.A.N.A. Constructor", layout="wide")
 
-# Load DB
-ORDINANCES = load_ordinances()
+# Load DB (caché compartida por proceso; solo hace un stat() por rerun)
+ORDINANCES = load_ordinances_cached()
+
+# Ordenanzas por página en el Grimorio (solo esas se cargan completas)
+GRIMORIO_PAGE_SIZE = 50
 
 # ---------------------------------------------------------
 # ESTILOS GLOBALES PARA TARJETAS DE NUMEN (HOVER REACTIVO)
@@ -1189,10 +1201,22 @@ mode = st.sidebar.radio(
         "Explorador de Preceptos",
         "Explorador de Numen",
         "Explorador de Modificadores",
+        "Constructor Inverso",
         "Grimorio de Ordenanzas",
     ],
 )
 
+# Estado de la sincronización con GitHub (no bloquea la interfaz)
+_sync = sync_status()
+if _sync["state"] == "syncing":
+    st.sidebar.caption(f"🔄 Sincronizando con el repositorio ({_sync['pending']} cambio(s))...")
+elif _sync["state"] == "pending":
+    st.sidebar.caption(f"🕒 {_sync['pending']} cambio(s) pendientes de sincronizar")
+elif _sync["state"] == "error":
+    st.sidebar.caption(f"⚠️ Sincronización fallida, se reintentará: {_sync['last_error']}")
+elif _sync["state"] == "idle" and _sync["last_success"]:
+    st.sidebar.caption(f"✓ Repositorio sincronizado ({_sync['last_success']})")
+
 # ===================================================================
 # MODO: EXPLORADOR DE PRECEPTOS
 # ===================================================================
@@ -1237,6 +1261,22 @@ if mode == "Explorador de Preceptos":
     else:
             st.write(f"Se han encontrado **{len(filtered_ids)}** preceptos.")
 
+            # Conteo exacto por programación dinámica (cacheado por versión de reglas)
+            with st.expander("Espacio de combinaciones (un Numen por Ordenanza)"):
+                counts = count_ordinances()
+                wanted = set(filtered_ids)
+                effect_names = {"damage": "Daño", "heal": "Curación", "control": "Control", "utility": "Utilidad"}
+                rows = {tier: {"Tier": tier, **{name: 0 for name in effect_names.values()}} for tier in range(1, 5)}
+                for (pid, _, tier, effect_type), n in counts.items():
+                    if pid in wanted:
+                        rows[tier][effect_names[effect_type]] += n
+                st.table(list(rows.values()))
+                st.caption(
+                    f"{sum(n for (pid, *_), n in counts.items() if pid in wanted):,} Ordenanzas distintas "
+                    "con las restricciones del Constructor (una Forma, una Intención, "
+                    "Multiplicado hasta 3 instancias extra)."
+                )
+
             ordered_pids = sorted(
                 filtered_ids,
                 key=lambda pid: PRECEPTS[pid]["verb"].lower()
@@ -1429,6 +1469,110 @@ if mode == "Explorador de Modificadores":
 
 
 
+# ===================================================================
+# MODO: CONSTRUCTOR INVERSO
+# ===================================================================
+if mode == "Constructor Inverso":
+    st.header("Constructor Inverso")
+    st.write(
+        "Describe el resultado que buscas y te proponemos las selecciones de "
+        "modificadores más baratas que lo consiguen."
+    )
+
+    effect_names = {"damage": "Daño", "heal": "Curación", "control": "Control", "utility": "Utilidad"}
+    shape_names = {
+        "TARGET": "Objetivo único", "LINE": "Línea", "CONE": "Cono",
+        "SPHERE": "Esfera", "WALL": "Muro", "AURA": "Aura",
+    }
+    duration_names = {
+        "INSTANT": "Instantáneo", "ROUNDS": "Rondas", "MINUTES": "Minutos", "HOURS": "Horas",
+        "DAYS": "Días", "WEEKS": "Semanas", "MONTHS_YEARS": "Meses / años",
+    }
+    any_label = "Cualquiera"
+
+    col_q = st.columns(4)
+    with col_q[0]:
+        want_effect = st.selectbox(
+            "Tipo de efecto", options=[None, *effect_names],
+            format_func=lambda e: any_label if e is None else effect_names[e],
+        )
+    with col_q[1]:
+        want_tier = st.selectbox(
+            "Tier", options=[None, 1, 2, 3, 4],
+            format_func=lambda t: any_label if t is None else str(t),
+        )
+    with col_q[2]:
+        want_shape = st.selectbox(
+            "Forma", options=[None, *shape_names],
+            format_func=lambda s: any_label if s is None else shape_names[s],
+        )
+    with col_q[3]:
+        want_duration = st.selectbox(
+            "Duración", options=[None, *duration_names],
+            format_func=lambda d: any_label if d is None else duration_names[d],
+        )
+
+    col_q = st.columns(4)
+    with col_q[0]:
+        want_dice = st.number_input(
+            "Dados por instancia (0 = cualquiera)", min_value=0, max_value=12, value=0, step=1,
+            disabled=want_effect not in ("damage", "heal"),
+        )
+    with col_q[1]:
+        want_severity = st.selectbox(
+            "Severidad (control)", options=[None, 1, 2, 3, 4],
+            format_func=lambda v: any_label if v is None else str(v),
+            disabled=want_effect != "control",
+        )
+    with col_q[2]:
+        want_precept = st.selectbox(
+            "Precepto", options=[None, *PRECEPTS],
+            format_func=lambda pid: any_label if pid is None else PRECEPTS[pid]["verb"],
+        )
+    with col_q[3]:
+        want_limit = st.number_input("Resultados", min_value=1, max_value=50, value=10, step=1)
+
+    # El índice se construye una vez por proceso y versión de reglas
+    with st.spinner("Preparando el índice de resultados..."):
+        results = reverse_search(
+            effect_type=want_effect,
+            tier=want_tier,
+            dice_per_instance=want_dice or None if want_effect in ("damage", "heal") else None,
+            shape=want_shape,
+            duration_kind=want_duration,
+            severity=want_severity if want_effect == "control" else None,
+            precept_id=want_precept,
+            limit=int(want_limit),
+        )
+
+    if not results:
+        st.info("Ninguna combinación produce ese resultado con las reglas actuales.")
+    for r in results:
+        mods_text = ", ".join(
+            MODIFIERS[m.modifier_id]["name"]
+            + (f" {m.rank}" if m.rank > 1 else "")
+            + (f" (+{m.extra_instances})" if m.extra_instances else "")
+            for m in r["modifiers"]
+        ) or "Sin modificadores"
+        outcome = [effect_names[r["effect_type"]], f"Tier {r['tier']}", shape_names[r["shape"]], duration_names[r["duration_kind"]]]
+        if r["effect_type"] in ("damage", "heal"):
+            outcome.append(f"{r['dice_per_instance']} dado(s) por instancia")
+        if r["effect_type"] == "control":
+            outcome.append(f"severidad {r['severity']}")
+        st.markdown(
+            f"**Complejidad {r['complexity']}** — {mods_text}"
+            + (" · duración larga" if r["long_duration"] else "")
+        )
+        verbs = sorted(PRECEPTS[pid]["verb"] for pid in r["precept_ids"])
+        st.caption(
+            " · ".join(outcome)
+            + f" — Preceptos: {', '.join(verbs[:8])}"
+            + (f" y {len(verbs) - 8} más" if len(verbs) > 8 else "")
+        )
+
+    st.stop()
+
+
 # ===================================================================
 # MODO: GRIMORIO DE ORDENANZAS
 # ===================================================================
@@ -1440,9 +1584,9 @@ if mode == "Grimorio de Ordenanzas":
         st.stop()
 
     # Filtros: Tipo, Numen, Precepto, Tier, texto
-    all_numen_ids = sorted({nid for o in ORDINANCES.values() for nid in o.numen_ids})
-    all_precepts = sorted({o.precept_id for o in ORDINANCES.values()})
-    all_tiers = sorted({o.tier for o in ORDINANCES.values()})
+    # (desde la vista columnar o, en modo SQLite, los índices: no hace falta
+    # materializar las ordenanzas)
+    all_precepts, all_numen_ids, all_tiers = grimoire_facets(ORDINANCES)
 
     EFFECT_FILTER_LABELS = {
         "Todas 🟦": None,
@@ -1487,46 +1631,58 @@ if mode == "Grimorio de Ordenanzas":
         ).lower()
 
 
-    # Aplicar filtros + tipo de ordenanza
-    filtered = []
-    for o in ORDINANCES.values():
-        if numen_filter and not any(n in o.numen_ids for n in numen_filter):
-            continue
-        if precept_filter and o.precept_id not in precept_filter:
-            continue
-        if tier_filter and o.tier not in tier_filter:
-            continue
-        if search_text and search_text not in o.name.lower():
-            continue
+    # Aplicar filtros + tipo de ordenanza (en modo SQLite se resuelven en SQL),
+    # ya ordenados por tier y nombre
+    match_ids = query_ordinance_ids(
+        ORDINANCES,
+        precept_ids=precept_filter,
+        numen_ids=numen_filter,
+        tiers=tier_filter,
+        effect_type=effect_filter,
+        name_contains=search_text,
+    )
 
-        # Tipo de ordenanza a partir de la sugerencia mecánica
-        long_duration_flag = any(
-            sel.modifier_id == "DURACION_PERSISTENTE" for sel in o.modifiers
-        )
-        complexity_o = calculate_complexity(
-            precept_id=o.precept_id,
-            numen_ids=o.numen_ids,
-            modifiers=o.modifiers,
-            long_duration=long_duration_flag,
-        )
-        mech = suggest_mechanics(
-            precept_id=o.precept_id,
-            numen_ids=o.numen_ids,
-            modifiers=o.modifiers,
-            complexity=complexity_o,
-            long_duration=long_duration_flag,
+    st.write(f"Se han encontrado **{len(match_ids)}** Ordenanzas.")
+
+    # Solo se materializan (y puntúan) las ordenanzas de la página visible
+    n_pages = max(1, -(-len(match_ids) // GRIMORIO_PAGE_SIZE))
+    page = 1
+    if n_pages > 1:
+        page = st.number_input(f"Página (de {n_pages})", min_value=1, max_value=n_pages, value=1, step=1)
+    page_ids = match_ids[(page - 1) * GRIMORIO_PAGE_SIZE : page * GRIMORIO_PAGE_SIZE]
+    matches = [o for o in map(ORDINANCES.get, page_ids) if o is not None]
+
+    # Sugerencia mecánica solo para las de la página
+    scored = batch_evaluate([
+        (
+            o.precept_id,
+            o.numen_ids,
+            o.modifiers,
+            any(sel.modifier_id == "DURACION_PERSISTENTE" for sel in o.modifiers),
         )
+        for o in matches
+    ])
+    filtered = []
+    for o, (_, mech) in zip(matches, scored):
         effect_type = mech.get("type", "utility")
-
-        if effect_filter and effect_type != effect_filter:
-            continue
-
         filtered.append((o, effect_type, mech))
 
-    st.write(f"Se han encontrado **{len(filtered)}** Ordenanzas.")
-
-    # Ordenar por tier y nombre
-    filtered.sort(key=lambda tup: (tup[0].tier, tup[0].name.lower()))
+    # Conteo vectorizado sobre la vista columnar del grimorio
+    with st.expander("Distribución por tier y tipo de efecto"):
+        distribution = grimoire_distribution(
+            ORDINANCES,
+            precept_ids=precept_filter,
+            numen_ids=numen_filter,
+            tiers=tier_filter,
+            effect_type=effect_filter,
+            name_contains=search_text,
+        )
+        effect_names = {"damage": "Daño", "heal": "Curación", "control": "Control", "utility": "Utilidad"}
+        rows = {tier: {"Tier": tier, **{name: 0 for name in effect_names.values()}} for tier in range(1, 5)}
+        for (tier, effect_type), n in distribution.items():
+            rows.setdefault(tier, {"Tier": tier, **{name: 0 for name in effect_names.values()}})
+            rows[tier][effect_names[effect_type]] += n
+        st.table([rows[tier] for tier in sorted(rows)])
 
     for o, effect_type, mech in filtered:
         summary = mech.get("summary", "")
@@ -1534,13 +1690,54 @@ if mode == "Grimorio de Ordenanzas":
 
     st.sidebar.markdown("---")
     st.sidebar.subheader("Exportar")
-    
-    st.sidebar.download_button(
-        label="⬇️ Descargar grimorio (JSON)",
-        data=export_ordinances_json_bytes(ORDINANCES),
-        file_name="arcana_ordinances_export.json",
-        mime="application/json",
+
+    export_fmt = st.sidebar.selectbox("Formato", options=EXPORT_FORMATS, index=0)
+    export_filtered = st.sidebar.checkbox(
+        f"Solo los resultados filtrados ({len(match_ids)})", value=False
     )
+    export_request = (export_fmt, export_filtered)
+
+    # La exportación solo se genera al pedirla (y se cachea por versión del DB)
+    if st.sidebar.button("Preparar exportación"):
+        st.session_state["export_request"] = export_request
+    if st.session_state.get("export_request") == export_request:
+        export_ids = match_ids if export_filtered else None
+        st.sidebar.download_button(
+            label=f"⬇️ Descargar grimorio ({export_fmt.upper()})",
+            data=export_ordinances_bytes(ORDINANCES, export_fmt, export_ids),
+            file_name=f"arcana_ordinances_export.{export_fmt}",
+            mime=arcana_export.mime_type(export_fmt),
+        )
+
+    st.sidebar.markdown("---")
+    st.sidebar.subheader("Importar")
+
+    import_file = st.sidebar.file_uploader(
+        "Exportación de otro grimorio",
+        type=["json", "ndjson", "jsonl", "csv", "gz"],
+    )
+    import_policy = st.sidebar.radio(
+        "Duplicados (misma clave canónica)",
+        options=["skip", "overwrite"],
+        format_func=lambda p: "Conservar la existente" if p == "skip" else "Sobrescribir",
+    )
+    if import_file is not None and st.sidebar.button("Importar ordenanzas"):
+        try:
+            report = import_ordinances(
+                import_file,
+                policy=import_policy,
+                ordinances=ORDINANCES,
+                make_backup=False,      # Como el Constructor: sin backup local (free tier)
+            )
+        except Exception as e:
+            st.sidebar.error(f"No se pudo importar: {e}")
+        else:
+            st.sidebar.success(
+                f"{report['added']} añadidas, {report['overwritten']} sobrescritas, "
+                f"{report['duplicates']} duplicadas, {report['invalid']} inválidas."
+            )
+            for err in report["errors"]:
+                st.sidebar.caption(f"⚠️ {err}")
 
 
 
@@ -1782,9 +1979,8 @@ else:
             if not name.strip():
                 st.error("La Ordenanza necesita un nombre.")
             else:
-                oid = next_ordinance_id(ORDINANCES)
                 ord_obj = Ordinance(
-                    id=oid,
+                    id="",  # lo asigna insert_ordinance bajo el lock
                     canonical_key=canonical_key,
                     name=name.strip(),
                     precept_id=precept_choice,
@@ -1804,20 +2000,29 @@ else:
                         "source": source,
                     },
                 )
-                ORDINANCES[oid] = ord_obj
                 
-                # Guardar con auto-commit a HF repo
-                with st.spinner("💾 Guardando y sincronizando..."):
-                    save_ordinances(
+                # Id + guardado atómicos frente a otras sesiones; el commit al repo
+                # se encola y lo hace el worker en segundo plano
+                try:
+                    saved = insert_ordinance(
                         ORDINANCES,
+                        ord_obj,
                         make_backup=False,      # No backup local (free tier)
-                        commit_to_repo=True     # Commit a HF repo
+                        commit_to_repo=True,    # Commit a HF repo
                     )
-                
-                st.success(
-                    f"✓ Ordenanza '{name}' guardada con id {oid} y sincronizada al repositorio. "
-                    "Revisa el Grimorio para consultarla."
-                )
-                st.balloons()  # ¡Celebración! 🎉
+                except Exception as e:
+                    st.error(f"No se pudo guardar la Ordenanza: {e}")
+                else:
+                    if saved is not ord_obj:
+                        st.warning(
+                            f"Otra sesión acaba de guardar esta combinación como '{saved.name}' "
+                            f"({saved.id}); no se ha duplicado."
+                        )
+                    else:
+                        st.success(
+                            f"✓ Ordenanza '{name}' guardada con id {saved.id}. La sincronización con el "
+                            "repositorio se hará en segundo plano. Revisa el Grimorio para consultarla."
+                        )
+                        st.balloons()  # ¡Celebración! 🎉
 
 
@@ -0,0 +1,250 @@
+# arcana_atlas.py
+#
+# Precomputed "atlas" of the mechanics of every (precept, modifier
+# selection, long_duration) cell up to a rank cap, stored as a fixed-width
+# binary file that the app maps read-only with mmap. Every Streamlit worker
+# and session of the machine shares the same pages of the page cache, and
+# a lookup is an index computation plus one read of RECORD_SIZE bytes.
+#
+# Layout:
+#   MAGIC (8 bytes) | header length (u32 LE) | JSON header | padding to 64
+#   records[class][cell], RECORD_FORMAT (one unsigned byte per field)
+#
+# Selection axes: an axis is a list of options, option 0 = absent and the
+# rest [modifier_id, rank, extra_instances]. The modifiers of a family with
+# limit 1 (arcana_rules.FAMILY_LIMITS) share one axis, every other modifier
+# has its own, and the last axis is long_duration:
+#
+#   cell = sum(option[a] * stride[a])
+#
+# Precepts with the same base cost and effect-by-intent row have identical
+# cells, so they share a class (precept_class in the header).
+#
+# Like arcana_rules it does not depend on arcana_core: arcana_core fills
+# the records with evaluate_batch() (build_atlas) and only trusts a file
+# whose header carries the current rules fingerprint.
+
+from __future__ import annotations
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import json
+import mmap
+import os
+import struct
+import sys
+
+import numpy as np
+
+import arcana_rules
+
+MAGIC = b"ARCATLS1"
+FORMAT_VERSION = 1
+ALIGN = 64
+RECORD_FIELDS = ("complexity", "tier", "effect_type", "total_dice", "dice_per_instance", "duration_kind")
+RECORD_FORMAT = "<" + "B" * len(RECORD_FIELDS)
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+RECORD_DTYPE = np.dtype([(field, np.uint8) for field in RECORD_FIELDS])
+
+Option = Optional[Tuple[str, int, int]]  # (modifier_id, rank, extra_instances); None = ausente
+
+
+def selection_axes(
+    tables: arcana_rules.CostTables,
+    variants: List[List[Tuple[int, int]]],
+    family_of: Dict[str, str | None],
+) -> List[List[Option]]:
+    """
+    Axes of the cell grid for the given modifier_variants(): one per
+    single-choice family (in order of first appearance), one per other
+    modifier, and [False, True] for long_duration last.
+    """
+    axes: List[List[Option]] = []
+    family_axis: Dict[str, int] = {}
+    for i, mid in enumerate(tables.modifier_ids):
+        options = [(mid, rank, extra) for rank, extra in variants[i]]
+        family = family_of.get(mid)
+        if arcana_rules.FAMILY_LIMITS.get(family) == 1:
+            if family not in family_axis:
+                family_axis[family] = len(axes)
+                axes.append([None])
+            axes[family_axis[family]].extend(options)
+        else:
+            axes.append([None, *options])
+    axes.append([False, True])
+    return axes
+
+
+def axis_strides(axes: Sequence[Sequence[Any]]) -> List[int]:
+    """Mixed-radix strides (first axis varies slowest)."""
+    strides = [1] * len(axes)
+    for a in range(len(axes) - 2, -1, -1):
+        strides[a] = strides[a + 1] * len(axes[a + 1])
+    return strides
+
+
+def decode_cells(
+    axes: List[List[Option]],
+    modifier_index: Dict[str, int],
+    start: int,
+    stop: int,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ranks / extras matrices and long_duration of cells [start, stop)."""
+    strides = axis_strides(axes)
+    cells = np.arange(start, stop, dtype=np.int64)
+    n = len(cells)
+    ranks = np.zeros((n, len(modifier_index)), dtype=np.int64)
+    extras = np.zeros((n, len(modifier_index)), dtype=np.int64)
+    rows = np.arange(n)
+    for a, options in enumerate(axes[:-1]):
+        digit = (cells // strides[a]) % len(options)
+        # Columna/rango/extra por opción; la opción 0 (ausente) no escribe nada
+        option_col = np.array([0] + [modifier_index[mid] for mid, _, _ in options[1:]])
+        option_rank = np.array([0] + [rank for _, rank, _ in options[1:]])
+        option_extra = np.array([0] + [extra for _, _, extra in options[1:]])
+        chosen = digit > 0
+        ranks[rows[chosen], option_col[digit[chosen]]] = option_rank[digit[chosen]]
+        extras[rows[chosen], option_col[digit[chosen]]] = option_extra[digit[chosen]]
+    long_duration = (cells % len(axes[-1])).astype(bool)
+    return ranks, extras, long_duration
+
+
+def write_atlas(path: str, header: Dict[str, Any], class_records: Iterable[np.ndarray]) -> int:
+    """
+    Write header + records (one RECORD_DTYPE array of n_cells per class,
+    in class order) to `path` atomically. Returns the file size.
+    """
+    raw = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    prefix = MAGIC + struct.pack("<I", len(raw)) + raw
+    prefix += b"\0" * (-len(prefix) % ALIGN)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(prefix)
+            for records in class_records:
+                if len(records) != header["n_cells"]:
+                    raise ValueError(f"Clase con {len(records)} celdas, se esperaban {header['n_cells']}")
+                f.write(np.ascontiguousarray(records, dtype=RECORD_DTYPE).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return size
+
+
+class Atlas:
+    """Read-only, memory-mapped view of an atlas file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[: len(MAGIC)] != MAGIC:
+            self._mm.close()
+            raise ValueError(f"{path} no es un atlas de Arcana")
+        (length,) = struct.unpack_from("<I", self._mm, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.header: Dict[str, Any] = json.loads(self._mm[start : start + length])
+        self.data_offset = start + length + (-(start + length) % ALIGN)
+
+        self.rules: str = self.header["rules"]
+        self.n_cells: int = self.header["n_cells"]
+        self.axes: List[List[Any]] = self.header["axes"]
+        self.strides = axis_strides(self.axes)
+        self.long_stride = self.strides[-1]
+        # Desplazamiento en bytes de cada precepto / opción (y el bit de su eje)
+        self._precept_base = {
+            pid: self.data_offset + cls * self.n_cells * RECORD_SIZE
+            for pid, cls in zip(self.header["precept_ids"], self.header["precept_class"])
+        }
+        self.die: Dict[str, int] = dict(zip(self.header["precept_ids"], self.header.get("die", [])))
+        self._option_offset: Dict[Tuple[str, int, int], Tuple[int, int]] = {}
+        for a, options in enumerate(self.axes[:-1]):
+            for o, option in enumerate(options[1:], start=1):
+                self._option_offset[tuple(option)] = (1 << a, o * self.strides[a] * RECORD_SIZE)
+        self._unpack = struct.Struct(RECORD_FORMAT).unpack_from
+
+    @property
+    def n_classes(self) -> int:
+        return max(self.header["precept_class"]) + 1
+
+    def cell_offset(
+        self,
+        precept_id: str,
+        modifiers: Iterable[Tuple[str, int, int]],
+        long_duration: bool = False,
+    ) -> int | None:
+        """
+        Byte offset of the record for (precept, (modifier_id, rank,
+        extra_instances) triples, long_duration), or None if the selection
+        is outside the atlas (unknown id, rank over the cap, two modifiers
+        on one single-choice axis or a repeated modifier).
+        """
+        offset = self._precept_base.get(precept_id)
+        if offset is None:
+            return None
+        if long_duration:
+            offset += self.long_stride * RECORD_SIZE
+        used = 0
+        option_offset = self._option_offset
+        for key in modifiers:
+            hit = option_offset.get(key)
+            if hit is None or used & hit[0]:
+                return None
+            used |= hit[0]
+            offset += hit[1]
+        return offset
+
+    def lookup(
+        self,
+        precept_id: str,
+        modifiers: Iterable[Tuple[str, int, int]],
+        long_duration: bool = False,
+    ) -> Tuple[int, ...] | None:
+        """RECORD_FIELDS values of a cell (see cell_offset), or None."""
+        offset = self.cell_offset(precept_id, modifiers, long_duration)
+        return None if offset is None else self._unpack(self._mm, offset)
+
+    def records(self) -> np.ndarray:
+        """All records as a zero-copy (n_classes, n_cells) RECORD_DTYPE array."""
+        flat = np.frombuffer(self._mm, dtype=RECORD_DTYPE, count=self.n_classes * self.n_cells, offset=self.data_offset)
+        return flat.reshape(self.n_classes, self.n_cells)
+
+    def iter_cells(self, chunk: int = 1 << 18) -> Iterator[Tuple[int, int, int]]:
+        """(class, start, stop) chunks covering the whole atlas."""
+        for cls in range(self.n_classes):
+            for start in range(0, self.n_cells, chunk):
+                yield cls, start, min(start + chunk, self.n_cells)
+
+    def close(self) -> None:
+        self._mm.close()
+
+
+if __name__ == "__main__":
+    # Paso offline:  python arcana_atlas.py build [path] [max_extra_instances]
+    #                python arcana_atlas.py info [path]
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "info"
+    if cmd == "build":
+        from arcana_core import ATLAS_PATH, build_atlas
+
+        path = sys.argv[2] if len(sys.argv) > 2 else ATLAS_PATH
+        max_extra = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+        info = build_atlas(path, max_extra)
+        print(
+            f"✓ Atlas {path}: {info['classes']} classes x {info['n_cells']} cells, "
+            f"{info['bytes'] / 1e6:.1f} MB in {info['seconds']:.1f}s"
+        )
+    elif cmd == "info":
+        from arcana_core import ATLAS_PATH
+
+        atlas = Atlas(sys.argv[2] if len(sys.argv) > 2 else ATLAS_PATH)
+        header = atlas.header
+        print(
+            f"rules {header['rules']}, {atlas.n_classes} classes x {atlas.n_cells} cells, "
+            f"max_extra_instances={header['max_extra_instances']}, {len(header['precept_ids'])} precepts"
+        )
+        atlas.close()
+    else:
+        print("Usage: python arcana_atlas.py build [path] [max_extra_instances] | info [path]")
+        sys.exit(1)
@@ -0,0 +1,275 @@
+# arcana_backups.py
+#
+# Content-addressed, deduplicated backups of the grimoire.
+#
+#   grimoire_h/
+#       objects/ab/abcdef....json      one ordinance record, stored once by sha256
+#       snapshots/<snapshot_id>.json   {"parent": ..., "full": bool, "set": {oid: hash}, "deleted": [...]}
+#
+# Every save writes a small *delta* snapshot (only the ordinances that changed)
+# and every KEYFRAME_EVERY snapshots a full one, so disk usage grows with the
+# number of changes instead of the number of saves.
+#
+# CLI:
+#   python arcana_backups.py list
+#   python arcana_backups.py restore [latest|<snapshot_id>|<YYYYmmddTHHMMSS>] [out.json]
+#   python arcana_backups.py prune [keep_last] [keep_daily]
+
+from __future__ import annotations
+from typing import Any, Callable, Dict, Iterable, List
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+import hashlib
+import json
+import os
+import sys
+
+
+KEYFRAME_EVERY = 50
+
+
+def record_hash(data: Dict[str, Any]) -> str:
+    blob = json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class BackupStore:
+    """
+    Deduplicated snapshot store. With `keep_last`/`keep_daily` set, the
+    retention policy (see prune) is applied every time a keyframe is written.
+    """
+
+    def __init__(self, root: Path | str, keep_last: int | None = None, keep_daily: int | None = None):
+        self.root = Path(root)
+        self.keep_last = keep_last
+        self.keep_daily = keep_daily
+        self.objects_dir = self.root / "objects"
+        self.snapshots_dir = self.root / "snapshots"
+        # Manifest completo del último snapshot (se carga la primera vez que hace falta)
+        self._head_id: str | None = None
+        self._head: Dict[str, str] | None = None
+        self._since_keyframe = 0
+
+    # ---------- Objetos ----------
+
+    def _object_path(self, h: str) -> Path:
+        return self.objects_dir / h[:2] / f"{h}.json"
+
+    def _put_object(self, data: Dict[str, Any]) -> str:
+        h = record_hash(data)
+        path = self._object_path(h)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, path)
+        return h
+
+    def _get_object(self, h: str) -> Dict[str, Any]:
+        with open(self._object_path(h), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    # ---------- Snapshots ----------
+
+    def list_snapshots(self) -> List[str]:
+        if not self.snapshots_dir.exists():
+            return []
+        return sorted(p.stem for p in self.snapshots_dir.glob("*.json"))
+
+    def _read_snapshot(self, snapshot_id: str) -> Dict[str, Any]:
+        with open(self.snapshots_dir / f"{snapshot_id}.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_snapshot_file(self, snapshot_id: str, snap: Dict[str, Any]) -> Path:
+        self.snapshots_dir.mkdir(parents=True, exist_ok=True)
+        path = self.snapshots_dir / f"{snapshot_id}.json"
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snap, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+        return path
+
+    def manifest(self, snapshot_id: str) -> Dict[str, str]:
+        """Full {oid: hash} of a snapshot: last keyframe + deltas up to it."""
+        chain = []
+        sid: str | None = snapshot_id
+        while sid is not None:
+            snap = self._read_snapshot(sid)
+            chain.append(snap)
+            if snap.get("full"):
+                break
+            sid = snap.get("parent")
+        result: Dict[str, str] = {}
+        for snap in reversed(chain):
+            result.update(snap["set"])
+            for oid in snap.get("deleted", []):
+                result.pop(oid, None)
+        return result
+
+    def _load_head(self) -> None:
+        snapshots = self.list_snapshots()
+        # Otro proceso puede haber escrito tras nuestro último snapshot: si no
+        # partimos de su manifest, la cadena de deltas se bifurca
+        if self._head is not None and self._head_id == (snapshots[-1] if snapshots else None):
+            return
+        if snapshots:
+            self._head_id = snapshots[-1]
+            self._head = self.manifest(self._head_id)
+            # Deltas desde el último keyframe
+            self._since_keyframe = 0
+            sid: str | None = self._head_id
+            while sid is not None:
+                snap = self._read_snapshot(sid)
+                if snap.get("full"):
+                    break
+                self._since_keyframe += 1
+                sid = snap.get("parent")
+        else:
+            self._head_id, self._head = None, {}
+
+    def write_snapshot(
+        self,
+        ids: Iterable[str],
+        get_record: Callable[[str], Dict[str, Any]],
+        changed_ids: Iterable[str] | None = None,
+    ) -> Path:
+        """
+        Record the grimoire whose ids are `ids`. Only `changed_ids` (plus ids
+        unknown to the previous snapshot) are serialized and hashed; with
+        changed_ids=None every record is rehashed.
+        The previous snapshot is the newest one on disk, even when another
+        process wrote it; callers serialize writers (arcana_core's _db_lock).
+        """
+        self._load_head()
+        prev = self._head
+        current = set(ids)
+        to_hash = set(current) if changed_ids is None else (set(changed_ids) & current) | (current - prev.keys())
+
+        changes: Dict[str, str] = {}
+        for oid in to_hash:
+            h = self._put_object(get_record(oid))
+            if prev.get(oid) != h:
+                changes[oid] = h
+        deleted = sorted(prev.keys() - current)
+
+        head = dict(prev)
+        head.update(changes)
+        for oid in deleted:
+            del head[oid]
+
+        snapshot_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S_%fZ")
+        full = self._head_id is None or self._since_keyframe + 1 >= KEYFRAME_EVERY
+        snap = {
+            "created": datetime.now(timezone.utc).isoformat(),
+            "parent": None if full else self._head_id,
+            "full": full,
+            "count": len(head),
+            "set": head if full else changes,
+            "deleted": [] if full else deleted,
+        }
+        path = self._write_snapshot_file(snapshot_id, snap)
+        self._head_id, self._head = snapshot_id, head
+        self._since_keyframe = 0 if full else self._since_keyframe + 1
+        if full and self.keep_last is not None:
+            self.prune(keep_last=self.keep_last, keep_daily=self.keep_daily or 0)
+        return path
+
+    # ---------- Restauración ----------
+
+    def resolve(self, ref: str = "latest") -> str:
+        """'latest', an exact snapshot id, or a timestamp prefix (point in time)."""
+        snapshots = self.list_snapshots()
+        if not snapshots:
+            raise FileNotFoundError(f"No snapshots in {self.snapshots_dir}")
+        if ref == "latest":
+            return snapshots[-1]
+        if ref in snapshots:
+            return ref
+        # Último snapshot hecho en o antes de ese instante
+        candidates = [s for s in snapshots if s[: len(ref)] <= ref]
+        if not candidates:
+            raise FileNotFoundError(f"No snapshot at or before {ref}")
+        return candidates[-1]
+
+    def restore(self, ref: str = "latest") -> Dict[str, Any]:
+        """Grimoire ({oid: record}) as it was at snapshot `ref`."""
+        manifest = self.manifest(self.resolve(ref))
+        return {oid: self._get_object(h) for oid, h in sorted(manifest.items())}
+
+    # ---------- Retención / compactación ----------
+
+    def prune(self, keep_last: int = 20, keep_daily: int = 30) -> Dict[str, int]:
+        """
+        Keep the newest `keep_last` snapshots plus the newest snapshot of each
+        of the last `keep_daily` days. Kept deltas whose chain loses a link
+        are rewritten as full snapshots; unreferenced objects are deleted.
+        """
+        snapshots = self.list_snapshots()
+        keep = set(snapshots[-keep_last:]) if keep_last > 0 else set()
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=keep_daily)).strftime("%Y%m%d")
+        newest_per_day: Dict[str, str] = {}
+        for sid in snapshots:
+            newest_per_day[sid[:8]] = sid
+        keep.update(sid for day, sid in newest_per_day.items() if day >= cutoff)
+
+        drop = [sid for sid in snapshots if sid not in keep]
+        manifests = {sid: self.manifest(sid) for sid in keep}
+
+        # Reescribimos como keyframe los deltas cuya cadena pasa por un snapshot borrado
+        dropped = set(drop)
+        for sid in sorted(keep):
+            snap = self._read_snapshot(sid)
+            parent = snap.get("parent")
+            needs_keyframe = False
+            while parent is not None and not snap.get("full"):
+                if parent in dropped:
+                    needs_keyframe = True
+                    break
+                snap = self._read_snapshot(parent)
+                parent = snap.get("parent")
+            if needs_keyframe:
+                original = self._read_snapshot(sid)
+                original.update({"parent": None, "full": True, "set": manifests[sid], "deleted": []})
+                self._write_snapshot_file(sid, original)
+
+        for sid in drop:
+            os.remove(self.snapshots_dir / f"{sid}.json")
+
+        live = set()
+        for manifest in manifests.values():
+            live.update(manifest.values())
+        removed_objects = 0
+        if self.objects_dir.exists():
+            for path in self.objects_dir.glob("*/*.json"):
+                if path.stem not in live:
+                    path.unlink()
+                    removed_objects += 1
+
+        self._head, self._head_id = None, None  # se recarga en el próximo write
+        return {"snapshots_removed": len(drop), "objects_removed": removed_objects}
+
+
+if __name__ == "__main__":
+    store = BackupStore(os.environ.get("ARCANA_BACKUP_DIR", "grimoire_h"))
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "list"
+
+    if cmd == "list":
+        for sid in store.list_snapshots():
+            snap = store._read_snapshot(sid)
+            kind = "full " if snap.get("full") else "delta"
+            print(f"{sid}  {kind}  {snap.get('count', '?')} ordinances, {len(snap['set'])} stored")
+    elif cmd == "restore":
+        ref = sys.argv[2] if len(sys.argv) > 2 else "latest"
+        out = sys.argv[3] if len(sys.argv) > 3 else "ordinances_db.restored.json"
+        raw = store.restore(ref)
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump(raw, f, ensure_ascii=False, indent=2)
+        print(f"✓ Restored {len(raw)} ordinances from snapshot {store.resolve(ref)} to {out}")
+    elif cmd == "prune":
+        keep_last = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+        keep_daily = int(sys.argv[3]) if len(sys.argv) > 3 else 30
+        print(store.prune(keep_last=keep_last, keep_daily=keep_daily))
+    else:
+        print("Usage: python arcana_backups.py list | restore [ref] [out] | prune [keep_last] [keep_daily]")
+        sys.exit(1)
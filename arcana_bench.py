@@ -0,0 +1,1056 @@
+# arcana_bench.py
+#
+# Benchmarks and self-checks for the grimoire engine. They run against a
+# throwaway DB in a temp directory, never against ordinances_db.json.
+#
+#   python arcana_bench.py writers [threads] [saves_per_writer] [processes]
+#   python arcana_bench.py serialize [ordinances]
+#   python arcana_bench.py import [records]
+#   python arcana_bench.py mechanics [ordinances] [reruns]
+#   python arcana_bench.py complexity [modifier_sets]
+#   python arcana_bench.py vectorized [max_modifiers]
+#   python arcana_bench.py enumerate [max_tier]
+#   python arcana_bench.py count [max_tier]
+#   python arcana_bench.py reverse [queries]
+#   python arcana_bench.py atlas [samples]
+#   python arcana_bench.py batch [items] [max_workers]
+#   python arcana_bench.py keys [keys]
+#   python arcana_bench.py memory [ordinances ...]
+#   python arcana_bench.py columns [ordinances] [queries]
+#   python arcana_bench.py lazy [ordinances] [accesses]
+#
+# The storage mode is taken from the usual ARCANA_DB_* variables
+# (e.g. ARCANA_DB_JOURNAL=1 or ARCANA_DB_SHARDED=1); ARCANA_DB_PATH is
+# always redirected to the temp directory.
+
+from __future__ import annotations
+from typing import Any, Dict, Iterator, List
+import contextlib
+import io
+import multiprocessing
+import shutil
+import tempfile
+import threading
+import time
+import os
+import sys
+
+
+def _setup_env(tmp_dir: str) -> None:
+    """Point arcana_core at tmp_dir. Must run before arcana_core is imported."""
+    path = os.environ.get("ARCANA_DB_PATH", "ordinances_db.json")
+    os.environ["ARCANA_DB_PATH"] = os.path.join(tmp_dir, os.path.basename(path))
+    os.environ["ARCANA_SHARD_DIR"] = os.path.join(tmp_dir, "ordinances_db")
+    os.environ["ARCANA_BACKUP_DIR"] = os.path.join(tmp_dir, "grimoire_h")
+    os.environ.pop("GITHUB_TOKEN_ARCANA", None)  # el token que lee arcana_core: nada de subir al repo real
+
+
+def _bench_ordinance(core, writer: str, i: int):
+    precept_id = "ENCENDER"
+    numen_ids = ["IGNIS"]
+    modifiers = [core.ModifierSelection(modifier_id="INTENSIDAD_POTENCIADO", rank=1 + i)]
+    return core.Ordinance(
+        id="",
+        # Clave única por (writer, i): así podemos contar pérdidas exactas
+        canonical_key=core.build_canonical_key(precept_id, numen_ids, modifiers) + f"#{writer}",
+        name=f"Bench {writer} {i}",
+        precept_id=precept_id,
+        numen_ids=numen_ids,
+        modifiers=modifiers,
+        mechanical={},
+        cost={},
+        tier=1,
+        meta={"created_by": writer},
+    )
+
+
+def _writer(writer: str, saves: int, stale: bool) -> None:
+    """
+    One simulated session. With stale=True it keeps its own Grimoire and
+    picks ids without the lock (the pre-locking code path), so every save
+    has to go through the stale-version merge.
+    """
+    import arcana_core as core
+
+    grimoire = core.load_ordinances()
+    for i in range(saves):
+        ord_obj = _bench_ordinance(core, writer, i)
+        if stale:
+            ord_obj.id = grimoire.next_id()
+            grimoire[ord_obj.id] = ord_obj
+            core.save_ordinances(grimoire, commit_to_repo=False, changed_ids=[ord_obj.id])
+        else:
+            core.insert_ordinance(grimoire, ord_obj, commit_to_repo=False)
+
+
+def _process_writer(writer: str, saves: int, stale: bool, tmp_dir: str) -> None:
+    _setup_env(tmp_dir)
+    with contextlib.redirect_stdout(io.StringIO()):
+        _writer(writer, saves, stale)
+
+
+def bench_writers(threads: int = 8, saves: int = 25, processes: int = 0) -> Dict[str, Any]:
+    """
+    N concurrent writers (threads, plus optional processes) each saving
+    `saves` new ordinances. Reports saves/s and checks that every single
+    ordinance made it to disk exactly once (zero lost updates).
+    """
+    results: Dict[str, Any] = {}
+    for stale in (False, True):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            _setup_env(tmp_dir)
+            sys.modules.pop("arcana_core", None)  # releer la config del entorno
+            import arcana_core as core
+
+            writers = [f"t{n}" for n in range(threads)]
+            procs_names = [f"p{n}" for n in range(processes)]
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                ts = [threading.Thread(target=_writer, args=(w, saves, stale)) for w in writers]
+                ctx = multiprocessing.get_context("spawn")
+                ps = [ctx.Process(target=_process_writer, args=(w, saves, stale, tmp_dir)) for w in procs_names]
+                for p in ps:
+                    p.start()
+                for t in ts:
+                    t.start()
+                for t in ts:
+                    t.join()
+                for p in ps:
+                    p.join()
+            elapsed = time.perf_counter() - start
+
+            final = core.load_ordinances()
+            expected = {
+                _bench_ordinance(core, w, i).canonical_key
+                for w in writers + procs_names
+                for i in range(saves)
+            }
+            found = [o.canonical_key for o in final.values()]
+            lost = len(expected - set(found))
+            duplicated = len(found) - len(set(found))
+            label = "stale-merge" if stale else "insert"
+            results[label] = {
+                "writers": threads + processes,
+                "saves": len(expected),
+                "seconds": round(elapsed, 3),
+                "saves_per_second": round(len(expected) / elapsed, 1),
+                "lost": lost,
+                "duplicated": duplicated,
+                "version": core._read_db_version(),
+            }
+    return results
+
+
+def bench_serialize(n: int = 20000) -> Dict[str, Any]:
+    """
+    Full-grimoire JSON encoding: asdict + json.dumps (the old path) vs the
+    fragment cache after one ordinance changed. Checks the bytes are equal.
+    """
+    import dataclasses
+    import json
+    import arcana_core as core
+
+    grimoire = core.Grimoire()
+    for i in range(n):
+        ord_obj = _bench_ordinance(core, "s", i)
+        ord_obj.id = f"ORD_{i + 1:06d}"
+        grimoire[ord_obj.id] = ord_obj
+
+    start = time.perf_counter()
+    reference = json.dumps(
+        {oid: dataclasses.asdict(o) for oid, o in grimoire.items()}, ensure_ascii=False, indent=2
+    )
+    t_asdict = time.perf_counter() - start
+
+    start = time.perf_counter()
+    core._grimoire_json(grimoire)
+    t_cold = time.perf_counter() - start
+
+    grimoire["ORD_000001"].name = "Bench renamed"
+    start = time.perf_counter()
+    text = core._grimoire_json(grimoire)
+    t_warm = time.perf_counter() - start
+
+    reference = json.dumps(
+        {oid: dataclasses.asdict(o) for oid, o in grimoire.items()}, ensure_ascii=False, indent=2
+    )
+    return {
+        "ordinances": n,
+        "asdict_seconds": round(t_asdict, 4),
+        "cold_seconds": round(t_cold, 4),
+        "one_dirty_seconds": round(t_warm, 4),
+        "identical": text == reference,
+    }
+
+
+def bench_import(n: int = 100000) -> Dict[str, Any]:
+    """
+    import_ordinances() of an n-record NDJSON export into an empty grimoire,
+    then the same file again with policy="skip" (every record a duplicate).
+    First a truncated copy of the file is imported, which must fail and
+    leave the grimoire empty.
+    Without backups: the snapshot store writes one object file per new record.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        _setup_env(tmp_dir)
+        sys.modules.pop("arcana_core", None)
+        import arcana_core as core
+
+        source = core.Grimoire()
+        for i in range(n):
+            ord_obj = _bench_ordinance(core, "i", i)
+            # El import recalcula la clave (sin el sufijo del writer): el
+            # rango distinto de cada registro evita que colapsen
+            ord_obj.id = f"ORD_{i + 1:06d}"
+            source[ord_obj.id] = ord_obj
+        path = os.path.join(tmp_dir, "import.ndjson.gz")
+        with open(path, "wb") as f:
+            for chunk in core.iter_export(source, "ndjson.gz"):
+                f.write(chunk)
+
+        # El gzip cortado falla a mitad de lectura, con lotes ya validados
+        truncated = os.path.join(tmp_dir, "truncated.ndjson.gz")
+        with open(path, "rb") as f, open(truncated, "wb") as out:
+            out.write(f.read()[: os.path.getsize(path) // 2])
+
+        target = core.Grimoire()
+        with contextlib.redirect_stdout(io.StringIO()):
+            try:
+                core.import_ordinances(truncated, ordinances=target, make_backup=False, commit_to_repo=False)
+            except Exception:
+                pass
+            left_after_truncated = len(target)
+
+            start = time.perf_counter()
+            first = core.import_ordinances(path, ordinances=target, make_backup=False, commit_to_repo=False)
+            t_first = time.perf_counter() - start
+
+            start = time.perf_counter()
+            again = core.import_ordinances(path, ordinances=target, make_backup=False, commit_to_repo=False)
+            t_again = time.perf_counter() - start
+
+        on_disk = len(core.load_ordinances())
+    return {
+        "records": n,
+        "import_seconds": round(t_first, 3),
+        "reimport_seconds": round(t_again, 3),
+        "left_after_truncated": left_after_truncated,
+        "added": first["added"],
+        "duplicates": again["duplicates"],
+        "on_disk": on_disk,
+    }
+
+
+def _random_selection(core, rng) -> tuple:
+    """A random (precept_id, numen_ids, modifiers, long_duration) from the rule tables."""
+    from arcana_data import PRECEPTS, NUMEN, MODIFIERS
+
+    precept_id = rng.choice(list(PRECEPTS))
+    numen_ids = rng.sample(list(NUMEN), rng.randint(1, 2))
+    modifiers = []
+    for mid in rng.sample(list(MODIFIERS), rng.randint(0, 4)):
+        rank = rng.randint(1, 3) if mid in ("INTENSIDAD_POTENCIADO", "DURACION_PERSISTENTE", "ALCANCE_EXTENDIDO") else 1
+        extra = rng.randint(1, 3) if mid == "INTENSIDAD_MULTIPLICADO" else 0
+        modifiers.append(core.ModifierSelection(mid, rank, extra))
+    long_duration = any(m.modifier_id == "DURACION_PERSISTENTE" for m in modifiers)
+    return precept_id, numen_ids, modifiers, long_duration
+
+
+def bench_mechanics(n: int = 5000, reruns: int = 5) -> Dict[str, Any]:
+    """
+    The Grimorio loop (calculate_complexity + suggest_mechanics for every
+    ordinance) over `reruns` reruns: suggest_mechanics uncached vs memoized.
+    Checks that both give the same results and that changing a returned
+    dict does not leak into the next call.
+    """
+    import random
+    import arcana_core as core
+
+    rng = random.Random(1234)
+    items = [_random_selection(core, rng) for _ in range(n)]
+
+    def grimorio(complexity_fn, mechanics_fn) -> List[Any]:
+        out = []
+        for precept_id, numen_ids, modifiers, long_duration in items:
+            c = complexity_fn(precept_id, numen_ids, modifiers, long_duration)
+            out.append((c, mechanics_fn(precept_id, numen_ids, modifiers, c, long_duration)))
+        return out
+
+    start = time.perf_counter()
+    for _ in range(reruns):
+        reference = grimorio(core.calculate_complexity, core.suggest_mechanics_uncached)
+    t_uncached = time.perf_counter() - start
+
+    core.clear_mechanics_cache()
+    start = time.perf_counter()
+    for _ in range(reruns):
+        memoized = grimorio(core.calculate_complexity, core.suggest_mechanics)
+    t_memoized = time.perf_counter() - start
+
+    precept_id, numen_ids, modifiers, long_duration = items[0]
+    c = core.calculate_complexity(precept_id, numen_ids, modifiers, long_duration)
+    mechanics = core.suggest_mechanics(precept_id, numen_ids, modifiers, c, long_duration)
+    mechanics["summary"] = None
+    mechanics["details"].clear()
+    isolated = core.suggest_mechanics(precept_id, numen_ids, modifiers, c, long_duration) == reference[0][1]
+
+    stats = core.mechanics_cache_stats()
+    return {
+        "ordinances": n,
+        "reruns": reruns,
+        "uncached_seconds": round(t_uncached, 3),
+        "memoized_seconds": round(t_memoized, 3),
+        "mechanics": stats["mechanics"],
+        "identical": memoized == reference,
+        "isolated": isolated,
+    }
+
+
+def bench_complexity(n: int = 100000) -> Dict[str, Any]:
+    """
+    calculate_complexity in a loop vs the compiled cost tables:
+    calculate_complexity_batch (ModifierSelection lists) and
+    complexity_batch on sets encoded beforehand. Checks all agree.
+    """
+    import random
+    import arcana_core as core
+
+    rng = random.Random(4321)
+    items = [_random_selection(core, rng) for _ in range(n)]
+    precept_ids = [it[0] for it in items]
+    modifier_sets = [it[2] for it in items]
+    long_durations = [rng.random() < 0.5 for _ in items]
+
+    start = time.perf_counter()
+    reference = [
+        core.calculate_complexity(p, [], mods, ld)
+        for p, mods, ld in zip(precept_ids, modifier_sets, long_durations)
+    ]
+    t_reference = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = core.calculate_complexity_batch(precept_ids, modifier_sets, long_durations)
+    t_batch = time.perf_counter() - start
+
+    tables = core.cost_tables()
+    precept_indices = [tables.precept_index[p] for p in precept_ids]
+    encoded = [tables.encode((m.modifier_id, m.rank, m.extra_instances) for m in mods) for mods in modifier_sets]
+    start = time.perf_counter()
+    compiled = tables.complexity_batch(precept_indices, encoded, long_durations)
+    t_encoded = time.perf_counter() - start
+
+    return {
+        "sets": n,
+        "reference_seconds": round(t_reference, 4),
+        "batch_seconds": round(t_batch, 4),
+        "encoded_seconds": round(t_encoded, 4),
+        "identical": reference == batch == compiled,
+    }
+
+
+def _exhaustive_selections(core, max_modifiers: int = 3) -> List[tuple]:
+    """
+    Every precept x every set of up to max_modifiers distinct modifiers
+    (in MODIFIERS order) x the ranks/instances that change the mechanics
+    (POTENCIADO, PERSISTENTE, MULTIPLICADO) x long_duration.
+    """
+    import itertools
+    from arcana_data import PRECEPTS, MODIFIERS
+
+    variants = {
+        "INTENSIDAD_POTENCIADO": [(r, 0) for r in range(1, MODIFIERS["INTENSIDAD_POTENCIADO"]["max_rank"] + 1)],
+        "DURACION_PERSISTENTE": [(r, 0) for r in range(1, MODIFIERS["DURACION_PERSISTENTE"]["max_rank"] + 1)],
+        "INTENSIDAD_MULTIPLICADO": [(1, x) for x in range(0, 4)],
+    }
+    selections = []
+    for size in range(max_modifiers + 1):
+        for ids in itertools.combinations(list(MODIFIERS), size):
+            for choice in itertools.product(*(variants.get(mid, [(1, 0)]) for mid in ids)):
+                selections.append([core.ModifierSelection(mid, r, x) for mid, (r, x) in zip(ids, choice)])
+    return [
+        (precept_id, ["IGNIS"], modifiers, long_duration)
+        for precept_id in PRECEPTS
+        for modifiers in selections
+        for long_duration in (False, True)
+    ]
+
+
+def bench_vectorized(max_modifiers: int = 3) -> Dict[str, Any]:
+    """
+    evaluate_batch() against the scalar rule functions on the exhaustive
+    sample of _exhaustive_selections(); reports mismatching rows per column.
+    """
+    import arcana_core as core
+    from arcana_data import get_base_die_for_precept
+
+    items = _exhaustive_selections(core, max_modifiers)
+
+    start = time.perf_counter()
+    expected: Dict[str, List[int]] = {k: [] for k in (
+        "complexity", "tier", "intent", "effect_type", "die",
+        "total_dice", "dice_per_instance", "instances", "severity", "duration_kind", "shape",
+    )}
+    for precept_id, numen_ids, modifiers, long_duration in items:
+        c = core.calculate_complexity(precept_id, numen_ids, modifiers, long_duration)
+        intent = core.get_intent_from_modifiers(modifiers)
+        mech = core.suggest_mechanics_uncached(precept_id, numen_ids, modifiers, c, long_duration)
+        details = mech["details"]
+        heavy = mech["type"] in ("damage", "heal")
+        expected["complexity"].append(c)
+        expected["tier"].append(core.derive_tier(c))
+        expected["intent"].append(core.INTENTS.index(intent))
+        expected["effect_type"].append(core.EFFECT_TYPES.index(core.get_effect_type(precept_id, intent)))
+        expected["die"].append(get_base_die_for_precept(precept_id))
+        expected["total_dice"].append(details["total_dice"] if heavy else 0)
+        expected["dice_per_instance"].append(details["dice_per_instance"] if heavy else 0)
+        expected["instances"].append(details["instances"] if heavy else 0)
+        expected["severity"].append(details["severity"] if mech["type"] == "control" else 0)
+        expected["duration_kind"].append(core.DURATION_KINDS.index(details["duration_kind"]))
+        expected["shape"].append(core.SHAPES.index(core.extract_modifier_info(modifiers)["shape"] or "TARGET"))
+    t_scalar = time.perf_counter() - start
+
+    encoded = core.encode_batch(items)
+    start = time.perf_counter()
+    result = core.evaluate_batch(
+        encoded["precepts"], encoded["ranks"], encoded["extras"], encoded["long_duration"], encoded["numen_mask"]
+    )
+    t_vector = time.perf_counter() - start
+
+    mismatches = {k: int((result[k] != v).sum()) for k, v in expected.items()}
+    return {
+        "ordinances": len(items),
+        "scalar_seconds": round(t_scalar, 3),
+        "vectorized_seconds": round(t_vector, 4),
+        "mismatches": mismatches,
+    }
+
+
+def bench_enumerate(max_tier: int = 2) -> Dict[str, Any]:
+    """
+    enumerate_ordinances() over every precept up to max_tier (one numen):
+    items/s, and a resume from a cursor taken halfway through (after a
+    JSON round trip) that must reproduce the rest of the stream.
+    """
+    import json
+    import arcana_core as core
+
+    start = time.perf_counter()
+    cursors = [item[4] for item in core.enumerate_ordinances(max_tier=max_tier)]
+    elapsed = time.perf_counter() - start
+
+    half = len(cursors) // 2
+    cursor = json.loads(json.dumps(cursors[half]))
+    resumed = [item[4] for item in core.enumerate_ordinances(max_tier=max_tier, cursor=cursor)]
+    return {
+        "max_tier": max_tier,
+        "items": len(cursors),
+        "seconds": round(elapsed, 3),
+        "items_per_second": round(len(cursors) / elapsed),
+        "resume_ok": resumed == cursors[half + 1:],
+    }
+
+
+def bench_count(max_tier: int = 1) -> Dict[str, Any]:
+    """
+    count_ordinances() (dynamic programming) against counting the output
+    of enumerate_ordinances() up to max_tier, per (precept, complexity,
+    tier, effect type).
+    """
+    import collections
+    import arcana_core as core
+
+    start = time.perf_counter()
+    counts = core.count_ordinances()
+    t_dp = time.perf_counter() - start
+
+    start = time.perf_counter()
+    enumerated: Dict[tuple, int] = collections.Counter()
+    for precept_id, _, modifiers, complexity, _ in core.enumerate_ordinances(max_tier=max_tier):
+        intent = core.get_intent_from_modifiers(modifiers)
+        effect_type = core.get_effect_type(precept_id, intent)
+        enumerated[(precept_id, complexity, core.derive_tier(complexity), effect_type)] += 1
+    t_enum = time.perf_counter() - start
+
+    expected = {k: v for k, v in counts.items() if k[2] <= max_tier}
+    return {
+        "max_tier": max_tier,
+        "total": sum(counts.values()),
+        "within_tier": sum(expected.values()),
+        "dp_seconds": round(t_dp, 4),
+        "enumerate_seconds": round(t_enum, 3),
+        "identical": dict(enumerated) == expected,
+    }
+
+
+def bench_reverse(queries: int = 1000) -> Dict[str, Any]:
+    """
+    build_reverse_index() time, then `queries` random reverse_search()
+    queries; every returned selection is re-scored with the scalar
+    functions for its first precept and must match the query.
+    """
+    import random
+    import arcana_core as core
+
+    start = time.perf_counter()
+    index = core.build_reverse_index()
+    t_build = time.perf_counter() - start
+
+    rng = random.Random(99)
+    elapsed, found, wrong = 0.0, 0, 0
+    for _ in range(queries):
+        query = {
+            "effect_type": rng.choice([None, *core.EFFECT_TYPES]),
+            "tier": rng.choice([None, 1, 2, 3, 4]),
+            "shape": rng.choice([None, *core.SHAPES]),
+            "duration_kind": rng.choice([None, *core.DURATION_KINDS]),
+        }
+        start = time.perf_counter()
+        results = core.reverse_search(**query, limit=5)
+        elapsed += time.perf_counter() - start
+        found += bool(results)
+        for r in results:
+            precept_id = r["precept_ids"][0]
+            c = core.calculate_complexity(precept_id, ["IGNIS"], r["modifiers"], r["long_duration"])
+            mech = core.suggest_mechanics_uncached(precept_id, ["IGNIS"], r["modifiers"], c, r["long_duration"])
+            got = {
+                "effect_type": mech["type"],
+                "tier": core.derive_tier(c),
+                "shape": core.extract_modifier_info(r["modifiers"])["shape"] or "TARGET",
+                "duration_kind": mech["details"]["duration_kind"],
+            }
+            wrong += c != r["complexity"] or any(v is not None and got[k] != v for k, v in query.items())
+    return {
+        "index_rows": len(index["complexity"]),
+        "build_seconds": round(t_build, 3),
+        "queries": queries,
+        "with_results": found,
+        "mean_query_ms": round(elapsed / queries * 1000, 3),
+        "wrong": wrong,
+    }
+
+
+def bench_atlas(n: int = 100000) -> Dict[str, Any]:
+    """
+    build_atlas() into a temp file, then `n` random selections: atlas
+    lookups against the scalar rule functions (selections outside the grid
+    count as fallbacks). Per covered selection, atlas_lookup() vs the
+    complexity + mechanics rule functions it replaces, and vs
+    calculate_complexity alone.
+    """
+    import random
+    import arcana_core as core
+
+    tmp_dir = tempfile.mkdtemp(prefix="arcana_atlas_")
+    core.ATLAS_PATH = os.path.join(tmp_dir, "arcana_atlas.bin")
+    info = core.build_atlas(core.ATLAS_PATH)
+
+    rng = random.Random(2024)
+    items = [_random_selection(core, rng) for _ in range(n)]
+
+    covered, mismatches = 0, 0
+    for precept_id, numen_ids, modifiers, long_duration in items:
+        cell = core.atlas_lookup(precept_id, modifiers, long_duration)
+        if cell is None:
+            continue
+        covered += 1
+        c = core.calculate_complexity(precept_id, numen_ids, modifiers, long_duration)
+        mech = core.suggest_mechanics_uncached(precept_id, numen_ids, modifiers, c, long_duration)
+        details = mech["details"]
+        heavy = mech["type"] in ("damage", "heal")
+        expected = {
+            "complexity": c,
+            "tier": core.derive_tier(c),
+            "effect_type": mech["type"],
+            "total_dice": details["total_dice"] if heavy else 0,
+            "dice_per_instance": details["dice_per_instance"] if heavy else 0,
+            "duration_kind": details["duration_kind"],
+        }
+        mismatches += any(cell[k] != v for k, v in expected.items())
+
+    # Solo las selecciones dentro del atlas: fuera de él no hay lookup que medir
+    inside = [it for it in items if core.atlas_lookup(it[0], it[2], it[3]) is not None]
+
+    def rules(precept_id, numen_ids, modifiers, long_duration):
+        c = core.calculate_complexity(precept_id, numen_ids, modifiers, long_duration)
+        return c, core.suggest_mechanics_uncached(precept_id, numen_ids, modifiers, c, long_duration)
+
+    def timed(fn) -> float:
+        start = time.perf_counter()
+        for precept_id, numen_ids, modifiers, long_duration in inside:
+            fn(precept_id, numen_ids, modifiers, long_duration)
+        return (time.perf_counter() - start) / max(1, len(inside))
+
+    t_lookup = timed(lambda p, n, m, ld: core.atlas_lookup(p, m, ld))
+    t_rules = timed(rules)
+    t_complexity = timed(core.calculate_complexity)
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    return {
+        "classes": info["classes"],
+        "cells": info["n_cells"],
+        "megabytes": round(info["bytes"] / 1e6, 1),
+        "build_seconds": round(info["seconds"], 1),
+        "samples": n,
+        "covered": covered,
+        "mismatches": mismatches,
+        "lookup_us": round(t_lookup * 1e6, 2),
+        "rules_us": round(t_rules * 1e6, 2),
+        "complexity_us": round(t_complexity * 1e6, 2),
+    }
+
+
+def bench_batch(n: int = 200000, max_workers: int = 0) -> Dict[str, Any]:
+    """
+    batch_evaluate() over `n` random selections with 1, 2, 4... up to
+    max_workers processes (0 = one per CPU): items/s and speedup over one
+    worker. Every run must equal the serial uncached rule functions.
+    """
+    import random
+    import arcana_core as core
+
+    rng = random.Random(21)
+    items = [_random_selection(core, rng) for _ in range(n)]
+    expected = []
+    for precept_id, numen_ids, modifiers, long_duration in items:
+        c = core.calculate_complexity(precept_id, numen_ids, modifiers, long_duration)
+        expected.append((c, core.suggest_mechanics_uncached(precept_id, numen_ids, modifiers, c, long_duration)))
+
+    max_workers = max_workers or os.cpu_count() or 1
+    counts = sorted({1, max_workers} | {w for w in (2, 4, 8, 16, 32) if w < max_workers})
+    runs = []
+    for workers in counts:
+        core.clear_mechanics_cache()
+        if workers > 1:
+            core.batch_evaluate(items[: core.BATCH_MIN_PARALLEL], workers=workers)  # arranque del pool
+        start = time.perf_counter()
+        result = core.batch_evaluate(items, workers=workers)
+        elapsed = time.perf_counter() - start
+        runs.append({
+            "workers": workers,
+            "seconds": round(elapsed, 3),
+            "items_per_second": round(n / elapsed),
+            "ok": result == expected,
+        })
+    core.shutdown_batch_pool()
+    for run in runs:
+        run["speedup"] = round(runs[0]["seconds"] / run["seconds"], 2)
+    return {"items": n, "cpus": os.cpu_count(), "runs": runs}
+
+
+def bench_keys(n: int = 1000000) -> Dict[str, Any]:
+    """
+    Dedup set over `n` random selections keyed by the text canonical key,
+    the packed key and the 64-bit fingerprint (also as a sorted uint64
+    array): memory (tracemalloc) and build time. Checks that the three
+    keys give the same number of distinct selections and that every
+    packed key parses back to its text key.
+    """
+    import random
+    import tracemalloc
+    import numpy as np
+    import arcana_core as core
+
+    rng = random.Random(22)
+    items = []
+    for _ in range(n):
+        precept_id, numen_ids, modifiers, _ = _random_selection(core, rng)
+        # Sin Numen repetidos: ahí la máscara de bits y el texto difieren
+        items.append((precept_id, sorted(set(numen_ids)), modifiers))
+
+    def measure(build) -> tuple:
+        tracemalloc.start()
+        start = time.perf_counter()
+        value = build()
+        elapsed = time.perf_counter() - start
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return value, elapsed, size
+
+    text, t_text, m_text = measure(lambda: {core.build_canonical_key(*item) for item in items})
+    packed, t_packed, m_packed = measure(lambda: {core.pack_canonical_key(*item) for item in items})
+    fps, t_fp, m_fp = measure(lambda: {core.canonical_fingerprint(key) for key in text})
+    fp_array, t_array, m_array = measure(lambda: np.unique(np.fromiter(fps, dtype=np.uint64, count=len(fps))))
+
+    start = time.perf_counter()
+    parsed = {core.build_canonical_key(*core.parse_canonical_key(key)) for key in packed}
+    t_parse = time.perf_counter() - start
+    return {
+        "keys": n,
+        "distinct": {"text": len(text), "packed": len(packed), "fingerprint": len(fps)},
+        "round_trip_ok": parsed == text,
+        "mb": {
+            "text": round(m_text / 1e6, 1),
+            "packed": round(m_packed / 1e6, 1),
+            "fingerprint_set": round(m_fp / 1e6, 1),
+            "fingerprint_array": round(fp_array.nbytes / 1e6, 1),
+        },
+        "seconds": {
+            "text": round(t_text, 2),
+            "packed": round(t_packed, 2),
+            "fingerprint": round(t_fp, 2),
+            "sort_array": round(t_array, 3),
+            "parse_packed": round(t_parse, 2),
+        },
+    }
+
+
+def _memory_records(core, n: int) -> Iterator[str]:
+    """`n` realistic ordinance records (ordinances_db.json layout) as JSON lines."""
+    import json
+    import random
+
+    rng = random.Random(23)
+    for i in range(1, n + 1):
+        precept_id, numen_ids, modifiers, _ = _random_selection(core, rng)
+        oid = f"ORD_{i:06d}"
+        tier = rng.randint(1, 4)
+        yield json.dumps({
+            "id": oid,
+            "canonical_key": core.build_canonical_key(precept_id, numen_ids, modifiers),
+            "name": f"Ordenanza {i}",
+            "precept_id": precept_id,
+            "numen_ids": numen_ids,
+            "modifiers": [m.to_dict() for m in modifiers],
+            "mechanical": {"narrative": f"Efecto {i % 997}", "notes": ""},
+            "cost": {"complexity_points": tier * 2, "tier": tier},
+            "tier": tier,
+            "meta": {"created_by": rng.choice(["Manu", "Ana", "bench"]), "source": "bench"},
+        }, ensure_ascii=False)
+
+
+def bench_memory(*sizes: int) -> List[Dict[str, Any]]:
+    """
+    Memory retained per loaded ordinance (tracemalloc; records are parsed
+    one by one, so only the ordinances stay alive) and load time (json.loads
+    + Ordinance.from_dict, without generating the records), per size.
+    """
+    import gc
+    import json
+    import tracemalloc
+    import arcana_core as core
+
+    out = []
+    for n in sizes or (100000, 1000000):
+        grimoire = core.Grimoire()
+        elapsed = 0.0
+        gc.collect()
+        tracemalloc.start()
+        for line in _memory_records(core, n):
+            start = time.perf_counter()
+            data = json.loads(line)
+            grimoire[data["id"]] = core.Ordinance.from_dict(data)
+            elapsed += time.perf_counter() - start
+        del line, data
+        gc.collect()
+        retained = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        out.append({
+            "ordinances": len(grimoire),
+            "bytes_per_ordinance": round(retained / len(grimoire)),
+            "total_mb": round(retained / 1e6, 1),
+            "load_seconds": round(elapsed, 2),
+        })
+        del grimoire
+    return out
+
+
+def bench_columns(n: int = 200000, queries: int = 200) -> Dict[str, Any]:
+    """
+    Grimorio filters over `n` ordinances: the columnar view (mask + ids)
+    against the object loop of query_ordinances() on a plain dict, with
+    the same random filters; plus a tier x effect distribution and the
+    cost of appending one ordinance to the built view.
+    """
+    import json
+    import random
+    import arcana_core as core
+
+    grimoire = core.Grimoire({d["id"]: core.Ordinance.from_dict(d) for d in map(json.loads, _memory_records(core, n))})
+    plain = dict(grimoire)
+    start = time.perf_counter()
+    store = grimoire.columns()
+    t_build = time.perf_counter() - start
+
+    rng = random.Random(24)
+    precepts, numen = list(core.PRECEPTS), list(core.NUMEN)
+    t_columns = t_loop = t_dist = 0.0
+    wrong = 0
+    for _ in range(queries):
+        filters = {
+            "precept_ids": rng.sample(precepts, rng.randint(1, 3)) if rng.random() < 0.5 else None,
+            "numen_ids": rng.sample(numen, rng.randint(1, 2)) if rng.random() < 0.5 else None,
+            "tiers": rng.sample([1, 2, 3, 4], rng.randint(1, 2)) if rng.random() < 0.5 else None,
+            "effect_type": rng.choice(core.EFFECT_TYPES) if rng.random() < 0.5 else None,
+            "name_contains": rng.choice(["1", "Ordenanza 4", "zz"]) if rng.random() < 0.3 else None,
+        }
+        start = time.perf_counter()
+        mask = core._columns_mask(store, *filters.values())
+        ids = store.select_ids(mask)
+        t_columns += time.perf_counter() - start
+        start = time.perf_counter()
+        distribution = core.grimoire_distribution(grimoire, **filters)
+        t_dist += time.perf_counter() - start
+        start = time.perf_counter()
+        expected = [o.id for o in core.query_ordinances(plain, **filters)]
+        t_loop += time.perf_counter() - start
+        counts: Dict[tuple, int] = {}
+        for oid in expected:
+            key = (plain[oid].tier, core._effect_type_for(plain[oid]))
+            counts[key] = counts.get(key, 0) + 1
+        # Mismo resultado, y con tipos de Python, que el recorrido de objetos
+        wrong += ids != expected or distribution != counts or any(type(t) is not int for t, _ in distribution)
+
+    new = []
+    for i in range(1000):
+        o = plain[f"ORD_{i + 1:06d}"]
+        new.append(core.Ordinance(
+            f"NEW_{i}", o.canonical_key + "#", o.name, o.precept_id, o.numen_ids, o.modifiers, {}, {}, o.tier, {}
+        ))
+    start = time.perf_counter()
+    for o in new:
+        grimoire[o.id] = o  # índice + fila nueva en la vista columnar
+    t_append = (time.perf_counter() - start) / len(new)
+    return {
+        "ordinances": n,
+        "build_seconds": round(t_build, 3),
+        "column_mb": round(store.stats()["bytes"] / 1e6, 1),
+        "queries": queries,
+        "wrong": wrong,
+        "columns_ms": round(t_columns / queries * 1000, 2),
+        "distribution_ms": round(t_dist / queries * 1000, 2),
+        "loop_ms": round(t_loop / queries * 1000, 2),
+        "append_us": round(t_append * 1e6, 1),
+    }
+
+
+def bench_lazy(n: int = 200000, accesses: int = 2000) -> Dict[str, Any]:
+    """
+    load_ordinances() of an n-record JSON snapshot, eager (every Ordinance
+    built) vs lazy (LazyGrimoire: index only): load time, memory retained
+    and peak (tracemalloc; the mapped file is page cache, not counted), the
+    first Grimorio page (columns + sorted ids + one page hydrated) and the
+    cost of hydrating random records. Checks both grimoires agree on
+    records, columns, query results and the saved text.
+    """
+    import gc
+    import json
+    import random
+    import tracemalloc
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        _setup_env(tmp_dir)
+        sys.modules.pop("arcana_core", None)
+        import arcana_core as core
+
+        # Snapshot escrito por trozos, sin tener todo el grimorio en memoria
+        with open(core.DB_PATH, "w", encoding="utf-8") as f:
+            f.write("{\n")
+            for i, line in enumerate(_memory_records(core, n)):
+                ord_obj = core.Ordinance.from_dict(json.loads(line))
+                sep = ",\n" if i else ""
+                f.write(f"{sep}  {json.dumps(ord_obj.id)}: {core._ordinance_fragment(ord_obj)}")
+            f.write("\n}")
+        with open(core.DB_PATH, encoding="utf-8") as f:
+            text = f.read()
+
+        def load(lazy: bool) -> Dict[str, Any]:
+            core.LAZY_LOAD = lazy
+            gc.collect()
+            start = time.perf_counter()
+            grimoire = core.load_ordinances()
+            elapsed = time.perf_counter() - start
+            del grimoire
+            gc.collect()
+            tracemalloc.start()
+            grimoire = core.load_ordinances()
+            gc.collect()
+            retained, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            start = time.perf_counter()
+            ids = core.query_ordinance_ids(grimoire)
+            page = [grimoire[oid] for oid in ids[:50]]
+            first_page = time.perf_counter() - start
+            return {
+                "grimoire": grimoire,
+                "type": type(grimoire).__name__,
+                "seconds": round(elapsed, 2),
+                "mb": round(retained / 1e6, 1),
+                "peak_mb": round(peak / 1e6, 1),
+                "first_page_seconds": round(first_page, 2),
+                "page": page,
+            }
+
+        eager, lazy = load(False), load(True)
+        g_eager, g_lazy = eager.pop("grimoire"), lazy.pop("grimoire")
+
+        rng = random.Random(25)
+        sample = rng.sample(list(g_eager), min(accesses, n))
+        start = time.perf_counter()
+        hydrated = [g_lazy[oid] for oid in sample]
+        t_hydrate = (time.perf_counter() - start) / len(sample)
+        mismatched = sum(o.to_dict() != g_eager[oid].to_dict() for oid, o in zip(sample, hydrated))
+        mismatched += [o.id for o in eager.pop("page")] != [o.id for o in lazy.pop("page")]
+        for column in ("tier", "complexity", "precept", "numen_mask", "modifier_mask", "effect_type", "name"):
+            mismatched += not (g_eager.columns().column(column) == g_lazy.columns().column(column)).all()
+        for precepts in (["ENCENDER"], ["SANAR", "CORTAR"], None):
+            args = (precepts, ["IGNIS"], [2, 3], None, "1")
+            mismatched += core.query_ordinance_ids(g_eager, *args) != core.query_ordinance_ids(g_lazy, *args)
+        mismatched += core.grimoire_facets(g_eager) != core.grimoire_facets(g_lazy)
+        mismatched += core._grimoire_json(g_lazy) != text
+        return {
+            "ordinances": n,
+            "eager": eager,
+            "lazy": lazy,
+            "hydrate_us": round(t_hydrate * 1e6, 1),
+            "hydration": g_lazy.hydration_stats(),
+            "mismatches": mismatched,
+        }
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "writers"
+    args = [int(a) for a in sys.argv[2:]]
+
+    if cmd == "writers":
+        ok = True
+        for label, r in bench_writers(*args).items():
+            print(
+                f"{label:12s} {r['writers']} writers, {r['saves']} saves in {r['seconds']}s "
+                f"({r['saves_per_second']} saves/s) lost={r['lost']} duplicated={r['duplicated']}"
+            )
+            ok = ok and r["lost"] == 0 and r["duplicated"] == 0
+        sys.exit(0 if ok else 1)
+    elif cmd == "serialize":
+        r = bench_serialize(*args)
+        print(
+            f"{r['ordinances']} ordinances: asdict {r['asdict_seconds']}s, "
+            f"fragments cold {r['cold_seconds']}s, one dirty {r['one_dirty_seconds']}s, "
+            f"identical={r['identical']}"
+        )
+        sys.exit(0 if r["identical"] else 1)
+    elif cmd == "import":
+        r = bench_import(*args)
+        print(
+            f"{r['records']} records: import {r['import_seconds']}s ({r['added']} added), "
+            f"re-import {r['reimport_seconds']}s ({r['duplicates']} duplicates), on disk {r['on_disk']}, "
+            f"left after truncated file {r['left_after_truncated']}"
+        )
+        ok = r["added"] == r["duplicates"] == r["on_disk"] == r["records"]
+        sys.exit(0 if ok and r["left_after_truncated"] == 0 else 1)
+    elif cmd == "mechanics":
+        r = bench_mechanics(*args)
+        print(
+            f"{r['ordinances']} ordinances x {r['reruns']} reruns: uncached {r['uncached_seconds']}s, "
+            f"memoized {r['memoized_seconds']}s, identical={r['identical']}, isolated={r['isolated']}"
+        )
+        st = r["mechanics"]
+        print(f"  mechanics  size={st['size']} hits={st['hits']} misses={st['misses']} evictions={st['evictions']}")
+        sys.exit(0 if r["identical"] and r["isolated"] else 1)
+    elif cmd == "complexity":
+        r = bench_complexity(*args)
+        print(
+            f"{r['sets']} modifier sets: loop {r['reference_seconds']}s, "
+            f"batch {r['batch_seconds']}s, pre-encoded batch {r['encoded_seconds']}s, "
+            f"identical={r['identical']}"
+        )
+        sys.exit(0 if r["identical"] else 1)
+    elif cmd == "vectorized":
+        r = bench_vectorized(*args)
+        bad = {k: v for k, v in r["mismatches"].items() if v}
+        print(
+            f"{r['ordinances']} ordinances: scalar {r['scalar_seconds']}s, "
+            f"evaluate_batch {r['vectorized_seconds']}s, mismatches={bad or 'none'}"
+        )
+        sys.exit(1 if bad else 0)
+    elif cmd == "enumerate":
+        r = bench_enumerate(*args)
+        print(
+            f"tier <= {r['max_tier']}: {r['items']} ordinances in {r['seconds']}s "
+            f"({r['items_per_second']}/s), resume_ok={r['resume_ok']}"
+        )
+        sys.exit(0 if r["resume_ok"] else 1)
+    elif cmd == "count":
+        r = bench_count(*args)
+        print(
+            f"{r['total']} ordinances in total, {r['within_tier']} up to tier {r['max_tier']}: "
+            f"DP {r['dp_seconds']}s, enumeration {r['enumerate_seconds']}s, identical={r['identical']}"
+        )
+        sys.exit(0 if r["identical"] else 1)
+    elif cmd == "reverse":
+        r = bench_reverse(*args)
+        print(
+            f"index {r['index_rows']} rows built in {r['build_seconds']}s; {r['queries']} queries "
+            f"({r['with_results']} with results), {r['mean_query_ms']} ms/query, wrong={r['wrong']}"
+        )
+        sys.exit(0 if r["wrong"] == 0 else 1)
+    elif cmd == "atlas":
+        r = bench_atlas(*args)
+        print(
+            f"atlas {r['classes']}x{r['cells']} cells, {r['megabytes']} MB built in {r['build_seconds']}s; "
+            f"{r['covered']}/{r['samples']} samples covered, mismatches={r['mismatches']}"
+        )
+        print(
+            f"atlas_lookup {r['lookup_us']} us vs complexity + mechanics {r['rules_us']} us "
+            f"(complexity alone {r['complexity_us']} us)"
+        )
+        sys.exit(0 if r["mismatches"] == 0 else 1)
+    elif cmd == "batch":
+        r = bench_batch(*args)
+        print(f"{r['items']} items, {r['cpus']} CPUs")
+        for run in r["runs"]:
+            print(
+                f"  workers={run['workers']:>2}: {run['seconds']}s, {run['items_per_second']} items/s, "
+                f"x{run['speedup']}, ok={run['ok']}"
+            )
+        sys.exit(0 if all(run["ok"] for run in r["runs"]) else 1)
+    elif cmd == "keys":
+        r = bench_keys(*args)
+        print(f"{r['keys']} selections, distinct {r['distinct']}, round trip ok={r['round_trip_ok']}")
+        print(f"  memory MB: {r['mb']}")
+        print(f"  seconds:   {r['seconds']}")
+        same = len(set(r["distinct"].values())) == 1
+        sys.exit(0 if same and r["round_trip_ok"] else 1)
+    elif cmd == "memory":
+        for r in bench_memory(*args):
+            print(
+                f"{r['ordinances']} ordinances: {r['bytes_per_ordinance']} B/ordinance, "
+                f"{r['total_mb']} MB, loaded in {r['load_seconds']}s (traced)"
+            )
+    elif cmd == "columns":
+        r = bench_columns(*args)
+        print(
+            f"{r['ordinances']} ordinances: view built in {r['build_seconds']}s ({r['column_mb']} MB); "
+            f"{r['queries']} queries, wrong={r['wrong']}"
+        )
+        print(
+            f"  filter: columns {r['columns_ms']} ms vs object loop {r['loop_ms']} ms; "
+            f"distribution {r['distribution_ms']} ms; append {r['append_us']} us/ordinance"
+        )
+        sys.exit(0 if r["wrong"] == 0 else 1)
+    elif cmd == "lazy":
+        r = bench_lazy(*args)
+        print(f"{r['ordinances']} ordinances, mismatches={r['mismatches']}")
+        for label in ("eager", "lazy"):
+            run = r[label]
+            print(
+                f"  {label:5s} ({run['type']}): loaded in {run['seconds']}s, {run['mb']} MB "
+                f"(peak {run['peak_mb']} MB), first Grimorio page in {run['first_page_seconds']}s"
+            )
+        print(f"  hydrate one record: {r['hydrate_us']} us; LRU {r['hydration']}")
+        sys.exit(0 if r["mismatches"] == 0 else 1)
+    else:
+        print("Usage: python arcana_bench.py writers [threads] [saves_per_writer] [processes]")
+        print("       python arcana_bench.py serialize [ordinances]")
+        print("       python arcana_bench.py import [records]")
+        print("       python arcana_bench.py mechanics [ordinances] [reruns]")
+        print("       python arcana_bench.py complexity [modifier_sets]")
+        print("       python arcana_bench.py vectorized [max_modifiers]")
+        print("       python arcana_bench.py enumerate [max_tier]")
+        print("       python arcana_bench.py count [max_tier]")
+        print("       python arcana_bench.py reverse [queries]")
+        print("       python arcana_bench.py atlas [samples]")
+        print("       python arcana_bench.py batch [items] [max_workers]")
+        print("       python arcana_bench.py keys [keys]")
+        print("       python arcana_bench.py memory [ordinances ...]")
+        print("       python arcana_bench.py columns [ordinances] [queries]")
+        print("       python arcana_bench.py lazy [ordinances] [accesses]")
+        sys.exit(1)
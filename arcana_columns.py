@@ -0,0 +1,203 @@
+# arcana_columns.py
+#
+# Columnar (struct-of-arrays) view of the grimoire for filters and charts:
+# one NumPy array per numeric column and an interned string table for the
+# names, so a Grimorio filter is a handful of vectorized mask operations
+# instead of a Python loop over Ordinance objects.
+#
+# Rows keep the grimoire's insertion order. Arrays grow by doubling, so
+# appending one ordinance after a save is amortized O(1); a replaced id is
+# updated in place and a deleted one is tombstoned (alive = False).
+#
+# Like arcana_export it does not depend on arcana_core: rows arrive as
+# plain values (precept index, bitmasks, codes) that arcana_core computes
+# from its rule tables (see grimoire_columns()).
+
+from __future__ import annotations
+from typing import Any, Dict, Iterable, List, Sequence
+
+import numpy as np
+
+# Columnas numéricas y su dtype; -1 = desconocido (id fuera de las tablas)
+COLUMNS = {
+    "tier": np.int8,
+    "complexity": np.int16,
+    "precept": np.int16,
+    "numen_mask": np.int64,      # bit i = NUMEN[i]
+    "modifier_mask": np.int64,   # bit i = cost_tables().modifier_ids[i]
+    "effect_type": np.int8,      # índice en EFFECT_TYPES
+}
+
+
+class ColumnStore:
+    """Growable column arrays plus id -> row and an interned name table."""
+
+    def __init__(self, capacity: int = 1024):
+        self._size = 0
+        self._arrays = {name: np.zeros(capacity, dtype=dtype) for name, dtype in COLUMNS.items()}
+        self._arrays["name"] = np.zeros(capacity, dtype=np.int32)  # código en name_table
+        self._alive = np.zeros(capacity, dtype=bool)
+        self.ids: List[str] = []
+        self.row_of: Dict[str, int] = {}
+        self.name_table: List[str] = []
+        self._name_code: Dict[str, int] = {}
+        self._name_lower: List[str] = []
+        self._name_rank: np.ndarray | None = None  # orden de los nombres (ver select_ids)
+
+    def __len__(self) -> int:
+        return len(self.row_of)
+
+    @property
+    def size(self) -> int:
+        """Rows including tombstones (length of every column)."""
+        return self._size
+
+    def column(self, name: str) -> np.ndarray:
+        """View of a column over all rows (tombstones included; see alive)."""
+        return self._arrays[name][: self._size]
+
+    @property
+    def alive(self) -> np.ndarray:
+        return self._alive[: self._size]
+
+    def _intern_name(self, name: str) -> int:
+        code = self._name_code.get(name)
+        if code is None:
+            code = self._name_code[name] = len(self.name_table)
+            self.name_table.append(name)
+            self._name_lower.append(name.lower())
+        return code
+
+    def _reserve(self, n: int) -> None:
+        capacity = len(self._alive)
+        if self._size + n <= capacity:
+            return
+        while capacity < self._size + n:
+            capacity *= 2
+        for name, array in self._arrays.items():
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[: self._size] = array[: self._size]
+            self._arrays[name] = grown
+        alive = np.zeros(capacity, dtype=bool)
+        alive[: self._size] = self._alive[: self._size]
+        self._alive = alive
+
+    def extend(self, ids: Sequence[str], names: Sequence[str], values: Dict[str, Iterable[int]]) -> None:
+        """
+        Append rows in bulk (ids must be new). `values` has one sequence
+        per COLUMNS entry, aligned with `ids`.
+        """
+        n = len(ids)
+        self._reserve(n)
+        lo, hi = self._size, self._size + n
+        for name in COLUMNS:
+            self._arrays[name][lo:hi] = np.fromiter(values[name], dtype=COLUMNS[name], count=n)
+        self._arrays["name"][lo:hi] = np.fromiter((self._intern_name(s) for s in names), dtype=np.int32, count=n)
+        self._alive[lo:hi] = True
+        for row, oid in enumerate(ids, start=lo):
+            self.row_of[oid] = row
+        self.ids.extend(ids)
+        self._size = hi
+
+    def upsert(self, oid: str, name: str, values: Dict[str, int]) -> None:
+        """Update the row of `oid` in place, or append it."""
+        row = self.row_of.get(oid)
+        if row is None:
+            self._reserve(1)
+            row = self._size
+            self._size += 1
+            self._alive[row] = True
+            self.row_of[oid] = row
+            self.ids.append(oid)
+        for column, value in values.items():
+            self._arrays[column][row] = value
+        self._arrays["name"][row] = self._intern_name(name)
+
+    def delete(self, oid: str) -> None:
+        row = self.row_of.pop(oid, None)
+        if row is not None:
+            self._alive[row] = False
+
+    def mask(
+        self,
+        precepts: Sequence[int] | None = None,
+        numen_mask: int = 0,
+        tiers: Sequence[int] | None = None,
+        effect_type: int | None = None,
+        name_contains: str | None = None,
+    ) -> np.ndarray:
+        """
+        Boolean row mask of the live rows matching every given filter:
+        precept index in `precepts`, any bit of `numen_mask`, tier in
+        `tiers`, effect code, case-insensitive substring of the name.
+        Empty / None filters match everything.
+        """
+        n = self._size
+        mask = self._alive[:n].copy()
+        if precepts:
+            mask &= np.isin(self._arrays["precept"][:n], precepts)
+        if numen_mask:
+            mask &= (self._arrays["numen_mask"][:n] & numen_mask) != 0
+        if tiers:
+            mask &= np.isin(self._arrays["tier"][:n], tiers)
+        if effect_type is not None:
+            mask &= self._arrays["effect_type"][:n] == effect_type
+        if name_contains:
+            # El substring se busca una vez por nombre distinto, no por fila
+            needle = name_contains.lower()
+            hits = np.fromiter((needle in s for s in self._name_lower), dtype=bool, count=len(self._name_lower))
+            mask &= hits[self._arrays["name"][:n]]
+        return mask
+
+    def _name_ranks(self) -> np.ndarray:
+        # Rango de cada código de nombre en orden alfabético sin mayúsculas;
+        # los nombres iguales comparten rango. Se recalcula al crecer la tabla.
+        if self._name_rank is None or len(self._name_rank) != len(self._name_lower):
+            lower = np.array(self._name_lower, dtype=object)
+            order = np.argsort(lower, kind="stable")
+            new = np.ones(len(lower), dtype=bool)
+            new[1:] = lower[order][1:] != lower[order][:-1]
+            self._name_rank = np.empty(len(lower), dtype=np.int64)
+            self._name_rank[order] = np.cumsum(new) - 1
+        return self._name_rank
+
+    def select_ids(self, mask: np.ndarray, order_by: Sequence[str] = ()) -> List[str]:
+        """
+        Ids of the rows in `mask`, in row order, or stably sorted by the
+        `order_by` columns ("name" sorts case-insensitively).
+        """
+        rows = np.flatnonzero(mask)
+        if order_by and len(rows):
+            keys = [
+                self._name_ranks()[self._arrays["name"][rows]] if column == "name" else self._arrays[column][rows]
+                for column in reversed(order_by)
+            ]
+            rows = rows[np.lexsort(keys)]
+        ids = self.ids
+        return [ids[row] for row in rows]
+
+    def counts(self, column: str, mask: np.ndarray | None = None, minlength: int = 0) -> np.ndarray:
+        """Histogram of a small non-negative code column over `mask` (default: live rows)."""
+        mask = self.alive if mask is None else mask
+        values = self._arrays[column][: self._size][mask]
+        return np.bincount(values[values >= 0].astype(np.int64), minlength=minlength)
+
+    def crosstab(self, row_column: str, col_column: str, mask: np.ndarray | None = None) -> np.ndarray:
+        """counts() of (row_column, col_column) pairs as a 2-D table."""
+        mask = self.alive if mask is None else mask
+        a = self._arrays[row_column][: self._size][mask].astype(np.int64)
+        b = self._arrays[col_column][: self._size][mask].astype(np.int64)
+        ok = (a >= 0) & (b >= 0)
+        a, b = a[ok], b[ok]
+        if not len(a):
+            return np.zeros((0, 0), dtype=np.int64)
+        shape = (int(a.max()) + 1, int(b.max()) + 1)
+        return np.bincount(a * shape[1] + b, minlength=shape[0] * shape[1]).reshape(shape)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rows": len(self),
+            "tombstones": self._size - len(self),
+            "names": len(self.name_table),
+            "bytes": sum(a.nbytes for a in self._arrays.values()) + self._alive.nbytes,
+        }
@@ -1,41 +1,638 @@
 # arcana_core.py
 
 from __future__ import annotations
-from typing import List, Dict, Any, Tuple
-from dataclasses import dataclass, asdict
-from arcana_data import NUMEN, PRECEPTS, MODIFIERS, get_base_die_for_precept
+from typing import List, Dict, Any, Tuple, Iterable, Iterator, Set
+from collections import OrderedDict
+from collections.abc import ItemsView, KeysView, MutableMapping, ValuesView
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from dataclasses import dataclass
+from arcana_data import NUMEN, PRECEPTS, MODIFIERS, DICE_BY_MODE, get_base_die_for_precept
 from datetime import datetime, timezone
 from huggingface_hub import HfApi
 from pathlib import Path
-import requests
-import base64
+import arcana_atlas
+import arcana_backups
+import arcana_columns
+import arcana_export
+import arcana_github
+import arcana_lazy
+import arcana_rules
+import arcana_shards
+import arcana_sqlite
+import arcana_sync
+import threading
+import tempfile
+import hashlib
+import itertools
+import multiprocessing
+import atexit
+import numpy as np
 import math
+import time
 import json
 import os
+import sys
+
+try:
+    import fcntl  # lock entre procesos (POSIX)
+except ImportError:  # Windows: solo lock entre hilos
+    fcntl = None
 
 # --------- Data classes ----------
 
-@dataclass
+# Tuplas de Numen / modificadores compartidas entre ordenanzas (y acotadas:
+# si se llena, las nuevas simplemente no se comparten)
+_SHARED_LIMIT = 1 << 16
+_SHARED_TUPLES: Dict[Tuple, Tuple] = {}
+_SHARED_SELECTIONS: Dict[Tuple[str, int, int], "ModifierSelection"] = {}
+
+
+def _shared_tuple(items: Tuple) -> Tuple:
+    shared = _SHARED_TUPLES.get(items)
+    if shared is None:
+        if len(_SHARED_TUPLES) >= _SHARED_LIMIT:
+            return items
+        shared = _SHARED_TUPLES.setdefault(items, items)
+    return shared
+
+
+@dataclass(frozen=True, slots=True)
 class ModifierSelection:
-    """A chosen modifier with optional rank / extra instances."""
+    """
+    A chosen modifier with optional rank / extra instances. Immutable, so
+    instances are shared: from_dict()/shared() return one per triple.
+    """
     modifier_id: str
     rank: int = 1                # for things like Potenciado I-III
     extra_instances: int = 0     # for Multiplicado (N-1)
 
+    def to_dict(self) -> Dict[str, Any]:
+        return {"modifier_id": self.modifier_id, "rank": self.rank, "extra_instances": self.extra_instances}
+
+    @classmethod
+    def shared(cls, modifier_id: str, rank: int = 1, extra_instances: int = 0) -> "ModifierSelection":
+        """The shared instance for (modifier_id, rank, extra_instances), with the id interned."""
+        key = (modifier_id, rank, extra_instances)
+        sel = _SHARED_SELECTIONS.get(key)
+        if sel is None:
+            sel = cls(sys.intern(modifier_id), rank, extra_instances)
+            if len(_SHARED_SELECTIONS) < _SHARED_LIMIT:
+                sel = _SHARED_SELECTIONS.setdefault(key, sel)
+        return sel
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ModifierSelection":
+        return cls.shared(data["modifier_id"], data.get("rank", 1), data.get("extra_instances", 0))
+
+
+def _numen_tuple(numen_ids) -> Tuple[str, ...]:
+    return _shared_tuple(tuple(map(sys.intern, numen_ids)))
+
+
+def _modifier_tuple(modifiers) -> Tuple[ModifierSelection, ...]:
+    return _shared_tuple(tuple(ModifierSelection.shared(m.modifier_id, m.rank, m.extra_instances) for m in modifiers))
+
 
 @dataclass
 class Ordinance:
+    # Sin __dict__: los campos y el fragmento JSON cacheado (ver
+    # _ordinance_fragment; None = sucio) van en slots. _fragment no es un
+    # campo del dataclass: no entra en __eq__/__repr__.
+    __slots__ = (
+        "id", "canonical_key", "name", "precept_id", "numen_ids", "modifiers",
+        "mechanical", "cost", "tier", "meta", "_fragment",
+    )
+
     id: str
     canonical_key: str
     name: str
     precept_id: str
-    numen_ids: List[str]
-    modifiers: List[ModifierSelection]
+    numen_ids: Tuple[str, ...]                 # se guardan como tuplas internadas,
+    modifiers: Tuple[ModifierSelection, ...]   # aunque se asignen listas
     mechanical: Dict[str, Any]
     cost: Dict[str, Any]
     tier: int
     meta: Dict[str, Any]
 
+    def __setattr__(self, name: str, value: Any) -> None:
+        if name == "numen_ids":
+            value = _numen_tuple(value)
+        elif name == "modifiers":
+            value = _modifier_tuple(value)
+        elif name == "precept_id":
+            value = sys.intern(value)
+        object.__setattr__(self, name, value)
+        if name != "_fragment":
+            object.__setattr__(self, "_fragment", None)
+
+    def mark_dirty(self) -> None:
+        """
+        Call after mutating a nested dict (e.g. ord.meta["x"] = ...) in
+        place; attribute assignment is tracked. save_ordinances() does it
+        for `changed_ids`.
+        """
+        object.__setattr__(self, "_fragment", None)
+
+    @property
+    def dirty(self) -> bool:
+        return self._fragment is None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Plain record in the ordinances_db.json layout (numen_ids as a
+        tuple). Unlike asdict() the nested numen/mechanical/cost/meta
+        containers are shared, not deep-copied: treat the result as
+        read-only.
+        """
+        return {
+            "id": self.id,
+            "canonical_key": self.canonical_key,
+            "name": self.name,
+            "precept_id": self.precept_id,
+            "numen_ids": self.numen_ids,
+            "modifiers": [m.to_dict() for m in self.modifiers],
+            "mechanical": self.mechanical,
+            "cost": self.cost,
+            "tier": self.tier,
+            "meta": self.meta,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Ordinance":
+        # Sin pasar por __init__/__setattr__: se carga una vez por ordenanza
+        ord_obj = cls.__new__(cls)
+        set_slot = object.__setattr__
+        set_slot(ord_obj, "id", data["id"])
+        set_slot(ord_obj, "canonical_key", data["canonical_key"])
+        set_slot(ord_obj, "name", data["name"])
+        set_slot(ord_obj, "precept_id", sys.intern(data["precept_id"]))
+        set_slot(ord_obj, "numen_ids", _numen_tuple(data["numen_ids"]))
+        set_slot(ord_obj, "modifiers", _shared_tuple(tuple(
+            ModifierSelection.shared(m["modifier_id"], m.get("rank", 1), m.get("extra_instances", 0))
+            for m in data["modifiers"]
+        )))
+        set_slot(ord_obj, "mechanical", data["mechanical"])
+        set_slot(ord_obj, "cost", data["cost"])
+        set_slot(ord_obj, "tier", data["tier"])
+        meta = data["meta"]
+        for k, v in meta.items():
+            # Autor / fuente se repiten en miles de registros
+            if type(v) is str and len(v) <= 64:
+                meta[k] = sys.intern(v)
+        set_slot(ord_obj, "meta", meta)
+        set_slot(ord_obj, "_fragment", None)
+        return ord_obj
+
+
+class Grimoire(MutableMapping):
+    """
+    Dict-like container of ordinances (id -> Ordinance).
+
+    Besides the records it maintains a hash index canonical_key -> id and the
+    highest numeric ORD_ id seen, so duplicate detection and id allocation
+    are O(1) instead of a scan of the whole grimoire. Both are built once
+    while loading and updated on every insert.
+    """
+
+    def __init__(self, ordinances: Dict[str, Ordinance] | None = None):
+        self._items: Dict[str, Ordinance] = {}
+        self._by_key: Dict[str, str] = {}
+        self._max_num = 0
+        self._max_num_stale = False
+        # Vista columnar (ver columns()); None = sin construir
+        self._columns: arcana_columns.ColumnStore | None = None
+        # Versión del DB en disco que refleja este grimorio (ver save_ordinances)
+        self.version = 0
+        if ordinances:
+            for oid, ord_obj in ordinances.items():
+                self[oid] = ord_obj
+
+    @staticmethod
+    def _id_number(oid: str) -> int:
+        if oid.startswith("ORD_"):
+            try:
+                return int(oid.split("_")[-1])
+            except ValueError:
+                pass
+        return 0
+
+    def __getitem__(self, oid: str) -> Ordinance:
+        return self._items[oid]
+
+    def _canonical_key(self, value: Any) -> str:
+        """canonical_key of a value of _items (see LazyGrimoire)."""
+        return value.canonical_key
+
+    def __setitem__(self, oid: str, ord_obj: Ordinance) -> None:
+        old = self._items.get(oid)
+        if old is not None and self._canonical_key(old) != ord_obj.canonical_key:
+            self._unindex(oid, self._canonical_key(old))
+        self._items[oid] = ord_obj
+        # Si hubiera duplicados gana el primero, igual que el antiguo recorrido lineal
+        self._by_key.setdefault(ord_obj.canonical_key, oid)
+        n = self._id_number(oid)
+        if n > self._max_num:
+            self._max_num = n
+        if self._columns is not None:
+            self._columns.upsert(oid, ord_obj.name, _column_row(ord_obj))
+
+    def __delitem__(self, oid: str) -> None:
+        old = self._items.pop(oid)
+        self._unindex(oid, self._canonical_key(old))
+        if self._columns is not None:
+            self._columns.delete(oid)
+        if self._id_number(oid) >= self._max_num:
+            self._max_num_stale = True
+
+    def _unindex(self, oid: str, canonical_key: str) -> None:
+        if self._by_key.get(canonical_key) != oid:
+            return
+        del self._by_key[canonical_key]
+        # Caso raro (duplicados): buscamos otra ordenanza con la misma clave
+        for other_id, other in self._items.items():
+            if other_id != oid and self._canonical_key(other) == canonical_key:
+                self._by_key[canonical_key] = other_id
+                break
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._items)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, oid: object) -> bool:
+        return oid in self._items
+
+    def __repr__(self) -> str:
+        return f"Grimoire({len(self._items)} ordinances)"
+
+    # Vistas directas del dict interno (más rápidas que las de MutableMapping)
+    def keys(self):
+        return self._items.keys()
+
+    def values(self):
+        return self._items.values()
+
+    def items(self):
+        return self._items.items()
+
+    def get(self, oid: str, default: Ordinance | None = None) -> Ordinance | None:
+        return self._items.get(oid, default)
+
+    def find_by_canonical_key(self, canonical_key: str) -> Ordinance | None:
+        oid = self._by_key.get(canonical_key)
+        return self[oid] if oid is not None else None
+
+    def ids_by_canonical_keys(self, canonical_keys: Iterable[str]) -> Dict[str, str]:
+        """{canonical_key: id} of the given keys present in the grimoire."""
+        by_key = self._by_key
+        return {key: by_key[key] for key in canonical_keys if key in by_key}
+
+    def fragment(self, oid: str) -> str:
+        """The record's text inside the grimoire JSON (see _ordinance_fragment)."""
+        return _ordinance_fragment(self[oid])
+
+    def columns(self) -> arcana_columns.ColumnStore:
+        """
+        Columnar view of the grimoire (see arcana_columns), built on first
+        use and kept in sync by every insert / replace / delete.
+        """
+        if self._columns is None:
+            # Las otras sesiones modifican el grimorio compartido bajo
+            # _db_lock: construida con el lock de hilos no se pierde ninguna
+            with _DB_THREAD_LOCK:
+                if self._columns is None:
+                    self._columns = grimoire_columns(self)
+        return self._columns
+
+    def refresh_columns(self, oids: Iterable[str] | None = None) -> None:
+        """Re-read `oids` into the columnar view after in-place edits (None = rebuild lazily)."""
+        if self._columns is None:
+            return
+        if oids is None:
+            self._columns = None
+            return
+        for oid in oids:
+            if oid in self._items:
+                self._columns.upsert(oid, self[oid].name, _column_row(self[oid]))
+
+    def next_id(self) -> str:
+        if self._max_num_stale:
+            self._max_num = max((self._id_number(oid) for oid in self._items), default=0)
+            self._max_num_stale = False
+        return f"ORD_{self._max_num + 1:06d}"
+
+
+@dataclass(frozen=True, slots=True)
+class _IndexedOrdinance:
+    """The fields of an ordinance the columnar view reads, without the record."""
+    name: str
+    precept_id: str
+    numen_ids: Tuple[str, ...]
+    modifiers: Tuple[ModifierSelection, ...]
+    tier: int
+
+
+class LazyGrimoire(Grimoire):
+    """
+    Grimoire over a scanned snapshot (arcana_lazy.SnapshotIndex).
+
+    Ids, canonical keys, names, precepts, Numen and tiers come from the
+    index; the full Ordinance is parsed from the mapped file the first time
+    it is read and kept in an LRU of HYDRATED_CACHE_SIZE records. Records
+    assigned afterwards (journal replay, inserts, imports, merges) are held
+    like in Grimoire and never evicted.
+
+    An evicted record is parsed again from the snapshot: edit a record in
+    place only right before saving it with changed_ids (or assign it back,
+    grimoire[oid] = ord_obj), which pins it.
+    """
+
+    def __init__(self, index: arcana_lazy.SnapshotIndex):
+        super().__init__()
+        self._index = index
+        self._hydrated = _MemoCache(HYDRATED_CACHE_SIZE)
+        # Valor en _items: la Ordinance, o su fila del índice (int) mientras
+        # siga siendo la del snapshot
+        items, by_key = self._items, self._by_key
+        for row, (oid, key) in enumerate(zip(index.ids, index.canonical_keys)):
+            items[oid] = row
+            by_key.setdefault(key, oid)
+        self._max_num_stale = True  # next_id() lo calcula si hace falta
+
+    def _canonical_key(self, value: Any) -> str:
+        return self._index.canonical_keys[value] if type(value) is int else value.canonical_key
+
+    def _hydrate(self, oid: str, row: int) -> Ordinance:
+        ord_obj = self._hydrated.get(oid)
+        if ord_obj is None:
+            ord_obj = _ordinance_from_dict(self._index.record(row))
+            # El texto del snapshot ya es su fragmento (mismo escritor)
+            object.__setattr__(ord_obj, "_fragment", self._index.fragment(row))
+            self._hydrated.put(oid, ord_obj)
+        return ord_obj
+
+    def __getitem__(self, oid: str) -> Ordinance:
+        value = self._items[oid]
+        return self._hydrate(oid, value) if type(value) is int else value
+
+    def __repr__(self) -> str:
+        return f"LazyGrimoire({len(self._items)} ordinances, {self._hydrated.stats()['size']} hydrated)"
+
+    def values(self):
+        return ValuesView(self)
+
+    def items(self):
+        return ItemsView(self)
+
+    def get(self, oid: str, default: Ordinance | None = None) -> Ordinance | None:
+        return self[oid] if oid in self._items else default
+
+    def fragment(self, oid: str) -> str:
+        value = self._items[oid]
+        if type(value) is not int:
+            return _ordinance_fragment(value)
+        ord_obj = self._hydrated.peek(oid)
+        return self._index.fragment(value) if ord_obj is None else _ordinance_fragment(ord_obj)
+
+    def snapshot_bytes(self, oid: str) -> bytes | None:
+        """Stored text of `oid` if it still comes from the snapshot, else None."""
+        value = self._items.get(oid)
+        return self._index.raw(value) if type(value) is int else None
+
+    def column_sources(self) -> Tuple[List[str], List[Ordinance | _IndexedOrdinance]]:
+        """
+        (ids, objects for _column_values()) from one copy of the grimoire:
+        the held ordinances, and for the rest the index fields plus the
+        modifiers list read from the snapshot (SnapshotIndex.modifiers),
+        without hydrating them.
+        """
+        index = self._index
+        # Copia en C (sin soltar el GIL): otra sesión puede insertar a la vez
+        items = list(self._items.items())
+        out: List[Ordinance | _IndexedOrdinance] = []
+        for _, value in items:
+            if type(value) is not int:
+                out.append(value)
+                continue
+            out.append(_IndexedOrdinance(
+                index.names[value],
+                index.precept_ids[value],
+                index.numen_ids[value],
+                tuple(ModifierSelection.shared(*m) for m in index.modifiers(value)),
+                index.tiers[value],
+            ))
+        return [oid for oid, _ in items], out
+
+    def refresh_columns(self, oids: Iterable[str] | None = None) -> None:
+        # Editadas en el sitio: se fijan para que el LRU no las descarte
+        for oid in oids or ():
+            value = self._items.get(oid)
+            if type(value) is int:
+                self._items[oid] = self._hydrate(oid, value)
+        super().refresh_columns(oids)
+
+    def hydration_stats(self) -> Dict[str, Any]:
+        return {"indexed": len(self._index), **self._hydrated.stats()}
+
+
+class SqliteGrimoire(Grimoire):
+    """
+    Grimoire over the SQLite database (SQLITE_MODE).
+
+    Nothing is loaded up front: lookups by id and by canonical_key, the next
+    id, the length and iteration are answered by the indexed tables, and
+    the records read are kept in an LRU of HYDRATED_CACHE_SIZE. Records
+    assigned or deleted afterwards are held in memory until save_ordinances
+    writes them (see mark_stored) and shadow the database until then.
+
+    As in LazyGrimoire, edit a record in place only right before saving it
+    with changed_ids (or assign it back), which pins it until it is written.
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self._path = path
+        self._hydrated = _MemoCache(HYDRATED_CACHE_SIZE)
+        # Guardadas en la base de datos pero borradas aquí, aún sin escribir
+        self._deleted: Set[str] = set()
+
+    def _hydrate(self, data: Dict[str, Any]) -> Ordinance:
+        ord_obj = self._hydrated.peek(data["id"])
+        if ord_obj is None:
+            ord_obj = _ordinance_from_dict(data)
+            self._hydrated.put(data["id"], ord_obj)
+        return ord_obj
+
+    def __getitem__(self, oid: str) -> Ordinance:
+        ord_obj = self._items.get(oid)
+        if ord_obj is not None:
+            return ord_obj
+        if oid in self._deleted:
+            raise KeyError(oid)
+        ord_obj = self._hydrated.get(oid)
+        if ord_obj is None:
+            data = arcana_sqlite.get_records(self._path, [oid]).get(oid)
+            if data is None:
+                raise KeyError(oid)
+            ord_obj = self._hydrate(data)
+        return ord_obj
+
+    def __setitem__(self, oid: str, ord_obj: Ordinance) -> None:
+        self._deleted.discard(oid)
+        super().__setitem__(oid, ord_obj)
+
+    def __delitem__(self, oid: str) -> None:
+        stored = oid not in self._deleted and bool(arcana_sqlite.existing_ids(self._path, [oid]))
+        if oid in self._items:
+            super().__delitem__(oid)
+        elif not stored:
+            raise KeyError(oid)
+        if stored:
+            self._deleted.add(oid)
+
+    def __iter__(self) -> Iterator[str]:
+        held = dict.fromkeys(self._items)
+        deleted = set(self._deleted)
+        for oid in arcana_sqlite.iter_ids(self._path):
+            if oid not in deleted:
+                held.pop(oid, None)
+                yield oid
+        yield from held
+
+    def _iter_items(self) -> Iterator[Tuple[str, Ordinance]]:
+        """(id, Ordinance) in __iter__ order, from a single query."""
+        held = dict(self._items)
+        deleted = set(self._deleted)
+        for data in arcana_sqlite.load_records(self._path):
+            oid = data["id"]
+            if oid in deleted:
+                continue
+            ord_obj = held.pop(oid, None) or self._hydrated.peek(oid)
+            yield oid, ord_obj if ord_obj is not None else _ordinance_from_dict(data)
+        yield from held.items()
+
+    def __len__(self) -> int:
+        n = arcana_sqlite.count_records(self._path) - len(self._deleted)
+        if self._items:
+            n += len(self._items) - len(arcana_sqlite.existing_ids(self._path, list(self._items)))
+        return n
+
+    def __contains__(self, oid: object) -> bool:
+        if oid in self._items:
+            return True
+        if oid in self._deleted or not isinstance(oid, str):
+            return False
+        return bool(arcana_sqlite.existing_ids(self._path, [oid]))
+
+    def __repr__(self) -> str:
+        return (
+            f"SqliteGrimoire({self._path}, {len(self._items)} held, "
+            f"{self._hydrated.stats()['size']} hydrated)"
+        )
+
+    def keys(self):
+        return KeysView(self)
+
+    def values(self):
+        return _SqliteValuesView(self)
+
+    def items(self):
+        return _SqliteItemsView(self)
+
+    def get(self, oid: str, default: Ordinance | None = None) -> Ordinance | None:
+        try:
+            return self[oid]
+        except KeyError:
+            return default
+
+    def find_by_canonical_key(self, canonical_key: str) -> Ordinance | None:
+        oid = self._by_key.get(canonical_key)
+        if oid is not None:
+            return self[oid]
+        data = arcana_sqlite.find_by_canonical_key(self._path, canonical_key)
+        # Borrada, o retenida con otra clave: la fila de la base de datos ya no vale
+        if data is None or data["id"] in self._deleted or data["id"] in self._items:
+            return None
+        return self._hydrate(data)
+
+    def ids_by_canonical_keys(self, canonical_keys: Iterable[str]) -> Dict[str, str]:
+        keys = list(canonical_keys)
+        found = {
+            key: oid
+            for key, oid in arcana_sqlite.ids_by_canonical_keys(self._path, keys).items()
+            if oid not in self._deleted and oid not in self._items
+        }
+        found.update(super().ids_by_canonical_keys(keys))
+        return found
+
+    def next_id(self) -> str:
+        held = max((self._id_number(oid) for oid in self._items), default=0)
+        return f"ORD_{max(arcana_sqlite.max_ordinance_number(self._path), held) + 1:06d}"
+
+    def refresh_columns(self, oids: Iterable[str] | None = None) -> None:
+        # Sin vista columnar (las consultas van a SQL); las editadas en el
+        # sitio se fijan para que el LRU no las descarte antes de escribirlas
+        for oid in oids or ():
+            ord_obj = self._hydrated.peek(oid)
+            if ord_obj is not None and oid not in self._items and oid not in self._deleted:
+                self[oid] = ord_obj
+
+    def subset(self, oids: Iterable[str]) -> Grimoire:
+        """In-memory Grimoire with the records of `oids`, read in batched queries."""
+        oids = list(oids)
+        missing = [oid for oid in oids if oid not in self._items and oid not in self._deleted]
+        stored = arcana_sqlite.get_records(self._path, missing)
+        out = Grimoire()
+        for oid in oids:
+            if oid in self._items:
+                out[oid] = self._items[oid]
+            elif oid in stored:
+                out[oid] = self._hydrated.peek(oid) or _ordinance_from_dict(stored[oid])
+        out.version = self.version
+        return out
+
+    def mark_stored(self, oids: Iterable[str] | None = None) -> None:
+        """`oids` (all if None) were written to the database: stop holding them."""
+        oids = self.held_ids() if oids is None else list(oids)
+        for ord_obj in self.release(oids):
+            self._hydrated.put(ord_obj.id, ord_obj)
+        for oid in oids:
+            if oid in self._deleted:
+                self._deleted.discard(oid)
+                self._hydrated.discard(oid)
+
+    def held_ids(self) -> List[str]:
+        """Ids assigned or deleted here and not written yet."""
+        return list(self._items) + list(self._deleted)
+
+    def release(self, oids: Iterable[str]) -> List[Ordinance]:
+        """Stop holding `oids` without touching the database. Returns the released records."""
+        released = [self._items.pop(oid) for oid in oids if oid in self._items]
+        # Índice de las que siguen retenidas, de una vez (_unindex las recorre por cada una)
+        self._by_key = {}
+        for oid, ord_obj in self._items.items():
+            self._by_key.setdefault(ord_obj.canonical_key, oid)
+        return released
+
+    def clear_cache(self) -> None:
+        """Forget the records read so far (others may have rewritten them)."""
+        self._hydrated.clear()
+
+    def hydration_stats(self) -> Dict[str, Any]:
+        return {"held": len(self._items), **self._hydrated.stats()}
+
+
+class _SqliteItemsView(ItemsView):
+    def __iter__(self):
+        return self._mapping._iter_items()
+
+
+class _SqliteValuesView(ValuesView):
+    def __iter__(self):
+        return (ord_obj for _, ord_obj in self._mapping._iter_items())
 
 # ---------- Canonical key ----------
 
@@ -65,6 +662,127 @@ def build_canonical_key(
     return f"{precept_id}|{numen_part}|[{modifier_str}]"
 
 
+# Clave compacta: bytes con ids internados (índice de precepto, máscara de
+# Numen y (modificador, rango, instancias)), ordenados como la clave de texto.
+# Los índices siguen el orden de las tablas de arcana_data: sirven para
+# sets/índices en memoria, no para guardarse (se guarda la de texto).
+_KEY_CODEC: Dict[str, Dict[str, Any]] = {}
+
+
+def _key_codec() -> Dict[str, Any]:
+    version = _rules_version()
+    codec = _KEY_CODEC.get(version)
+    if codec is None:
+        tables = cost_tables()
+        numen_ids = tuple(NUMEN)
+        codec = {
+            "precept_ids": tables.precept_ids,
+            "precept_byte": {pid: bytes((i,)) for i, pid in enumerate(tables.precept_ids)},
+            "modifier_ids": tables.modifier_ids,
+            "modifier_index": tables.modifier_index,
+            "numen_ids": numen_ids,
+            "numen_bit": {nid: 1 << i for i, nid in enumerate(numen_ids)},
+            "mask_bytes": max(1, -(-len(numen_ids) // 8)),
+            "pieces": {},  # (modifier_id, rank, extra) -> 3 bytes, caché
+        }
+        _KEY_CODEC.clear()
+        _KEY_CODEC[version] = codec
+    return codec
+
+
+def pack_canonical_key(
+    precept_id: str,
+    numen_ids: List[str],
+    modifiers: List[ModifierSelection],
+) -> bytes:
+    """
+    build_canonical_key() as packed bytes: precept index (1 byte), Numen
+    bitmask, then (modifier index, rank, extra_instances) per modifier, one
+    byte each. Same selection -> same bytes (a repeated Numen counts once).
+    ValueError for unknown ids or ranks/instances outside 0..255.
+    """
+    codec = _key_codec()
+    pieces = codec["pieces"]
+    try:
+        numen_bit = codec["numen_bit"]
+        mask = 0
+        for nid in numen_ids:
+            mask |= numen_bit[nid]
+        head = codec["precept_byte"][precept_id] + mask.to_bytes(codec["mask_bytes"], "little")
+        # Trozos de 3 bytes big-endian: ordenarlos como bytes = ordenar por índice
+        mods = []
+        for m in modifiers:
+            sig = (m.modifier_id, m.rank, m.extra_instances)
+            piece = pieces.get(sig)
+            if piece is None:
+                piece = bytes((codec["modifier_index"][sig[0]], sig[1], sig[2]))
+                if len(pieces) < 4096:
+                    pieces[sig] = piece
+            mods.append(piece)
+    except KeyError as e:
+        raise ValueError(f"Id desconocido en la clave canónica: {e.args[0]}") from None
+    mods.sort()
+    return head + b"".join(mods)
+
+
+def canonical_fingerprint(key: str | bytes) -> int:
+    """
+    Stable 64-bit fingerprint (blake2b, same value in every process and
+    run) of a text or packed canonical key. Prefer the text key for
+    anything persisted: packed keys change if the rule tables are reordered.
+    """
+    if isinstance(key, str):
+        key = key.encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+
+def parse_canonical_key(key: str | bytes) -> Tuple[str, List[str], List[ModifierSelection]]:
+    """
+    (precept_id, numen_ids, modifiers) back from a build_canonical_key()
+    string or a pack_canonical_key() bytes key, with the shared
+    ModifierSelection instances. ValueError if malformed.
+    """
+    if isinstance(key, (bytes, bytearray)):
+        codec = _key_codec()
+        width = codec["mask_bytes"]
+        if len(key) < 1 + width or (len(key) - 1 - width) % 3:
+            raise ValueError(f"Clave compacta mal formada: {bytes(key)!r}")
+        try:
+            precept_id = codec["precept_ids"][key[0]]
+            mask = int.from_bytes(key[1 : 1 + width], "little")
+            numen_ids = []
+            while mask:
+                low = mask & -mask
+                numen_ids.append(codec["numen_ids"][low.bit_length() - 1])
+                mask ^= low
+            modifier_ids = codec["modifier_ids"]
+            rest = iter(key[1 + width :])
+            modifiers = [ModifierSelection.shared(modifier_ids[i], rank, extra) for i, rank, extra in zip(rest, rest, rest)]
+        except IndexError:
+            raise ValueError(f"Clave compacta con ids fuera de tabla: {bytes(key)!r}") from None
+        return precept_id, numen_ids, modifiers
+
+    try:
+        precept_id, numen_part, modifier_part = key.split("|", 2)
+        if not (modifier_part.startswith("[") and modifier_part.endswith("]")):
+            raise ValueError
+        modifiers = []
+        for part in filter(None, modifier_part[1:-1].split(",")):
+            modifier_id, *options = part.split(":")
+            rank, extra = 1, 0
+            for opt in options:
+                if opt[:1] == "r":
+                    rank = int(opt[1:])
+                elif opt[:1] == "x":
+                    extra = int(opt[1:])
+                else:
+                    raise ValueError
+            modifiers.append(ModifierSelection.shared(modifier_id, rank, extra))
+    except ValueError:
+        raise ValueError(f"Clave canónica mal formada: {key!r}") from None
+    return precept_id, numen_part.split("+") if numen_part else [], modifiers
+
+
 # ---------- Complexity & Tier ----------
 
 def calculate_complexity(
@@ -255,7 +973,7 @@ def get_effect_type(precept_id: str, intent: str) -> str:
 # SUGERENCIAS MECÁNICAS (GLUTINANTES)
 # ============================================================
 
-def suggest_mechanics(
+def suggest_mechanics_uncached(
     precept_id: str,
     numen_ids: list[str],
     modifiers: list[ModifierSelection],
@@ -263,7 +981,8 @@ def suggest_mechanics(
     long_duration: bool = False,
 ) -> dict:
     """
-    Devuelve un dict con sugerencias mecánicas glutinantes:
+    Devuelve un dict con sugerencias mecánicas glutinantes
+    (suggest_mechanics es la versión memoizada):
     - type: 'damage', 'heal', 'control' o 'utility'
     - summary: texto breve
     - details: dict con info estructurada (dados, área, etc.)
@@ -733,93 +1452,1866 @@ def suggest_utility_effect(
 
 
 
+# ---------- Memoization of the rule functions ----------
+
+# suggest_mechanics es una función pura de la selección y de las tablas de
+# arcana_data; el Grimorio la llama para cada ordenanza en cada rerun.
+# calculate_complexity no se memoiza: cuesta menos que montar la clave.
+MECHANICS_CACHE_SIZE = int(os.environ.get("ARCANA_MECHANICS_CACHE_SIZE", "8192"))
+RULES_CHECK_SECONDS = float(os.environ.get("ARCANA_RULES_CHECK_SECONDS", "5"))
+
+
+class _MemoCache:
+    """Bounded LRU dict with hit/miss/eviction counters; writes are locked."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key: Tuple) -> Any:
+        # Lectura sin lock (el GIL basta para el dict); los contadores
+        # pueden perder algún incremento entre hilos
+        value = self._data.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            self._data.move_to_end(key)
+        except KeyError:  # desalojada por otro hilo entre medias
+            pass
+        return value
+
+    def peek(self, key: Tuple) -> Any:
+        """get() without touching the LRU order or the counters."""
+        return self._data.get(key)
+
+    def put(self, key: Tuple, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, key: Tuple) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+_MECHANICS_CACHE = _MemoCache(MECHANICS_CACHE_SIZE)
+_RULES_STATE: Dict[str, Any] = {"version": None, "checked": float("-inf"), "invalidations": 0}
+
+
+def rules_fingerprint() -> str:
+    """Hash of the arcana_data rule tables the mechanics are computed from."""
+    raw = json.dumps([PRECEPTS, NUMEN, MODIFIERS, DICE_BY_MODE], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _rules_version() -> str:
+    """
+    rules_fingerprint(), recomputed at most every RULES_CHECK_SECONDS (it
+    serializes ~20 KB of tables). A change empties the cache.
+    """
+    now = time.monotonic()
+    if now - _RULES_STATE["checked"] >= RULES_CHECK_SECONDS:
+        version = rules_fingerprint()
+        if _RULES_STATE["version"] not in (None, version):
+            _MECHANICS_CACHE.clear()
+            _RULES_STATE["invalidations"] += 1
+        _RULES_STATE["version"] = version
+        _RULES_STATE["checked"] = now
+    return _RULES_STATE["version"]
+
+
+def _modifier_signature(modifiers: List[ModifierSelection]) -> List[Tuple[str, int, int]]:
+    return [(m.modifier_id, m.rank, m.extra_instances) for m in modifiers]
+
+
+def suggest_mechanics(
+    precept_id: str,
+    numen_ids: list[str],
+    modifiers: list[ModifierSelection],
+    complexity: int,
+    long_duration: bool = False,
+) -> dict:
+    """
+    suggest_mechanics_uncached(), memoized. Only the first numen (the
+    element name) and the tier derived from `complexity` matter. The
+    modifiers keep their order: the first FORMA wins. Every call returns
+    its own copy, so callers may modify it.
+    """
+    key = (
+        _rules_version(),
+        precept_id,
+        numen_ids[0] if numen_ids else None,
+        tuple(_modifier_signature(modifiers)),
+        derive_tier(complexity),
+        bool(long_duration),
+    )
+    value = _MECHANICS_CACHE.get(key)
+    if value is None:
+        value = suggest_mechanics_uncached(precept_id, numen_ids, modifiers, complexity, long_duration)
+        _MECHANICS_CACHE.put(key, value)
+    return _copy_mechanics(value)
+
+
+def _copy_mechanics(mechanics: Dict[str, Any]) -> Dict[str, Any]:
+    # Lo único mutable es details y, dentro, area (lo demás son str/int/None);
+    # mucho más barato que copy.deepcopy
+    details = dict(mechanics["details"])
+    if "area" in details:
+        details["area"] = dict(details["area"])
+    return {**mechanics, "details": details}
+
+
+def mechanics_cache_stats() -> Dict[str, Any]:
+    """Hit/miss/eviction counters of the mechanics cache and the current rules version."""
+    return {
+        "rules_version": _RULES_STATE["version"],
+        "invalidations": _RULES_STATE["invalidations"],
+        "mechanics": _MECHANICS_CACHE.stats(),
+    }
+
+
+def clear_mechanics_cache() -> None:
+    """Empty the cache and force a rules fingerprint check on the next call."""
+    _MECHANICS_CACHE.clear()
+    _RULES_STATE["checked"] = float("-inf")
+
+
+# ---------- Compiled cost tables ----------
+
+_COST_TABLES: Dict[str, arcana_rules.CostTables] = {}
+
+
+def cost_tables() -> arcana_rules.CostTables:
+    """arcana_rules.CostTables for the current rules, recompiled when they change."""
+    version = _rules_version()
+    tables = _COST_TABLES.get(version)
+    if tables is None:
+        tables = arcana_rules.compile_cost_tables(PRECEPTS, MODIFIERS)
+        _COST_TABLES.clear()
+        _COST_TABLES[version] = tables
+    return tables
+
+
+def calculate_complexity_batch(
+    precept_ids: List[str],
+    modifier_sets: List[List[ModifierSelection]],
+    long_durations: List[bool] | None = None,
+) -> List[int]:
+    """
+    calculate_complexity for many selections in one call, through the
+    compiled cost tables. Callers that score the same sets repeatedly can
+    encode them once with cost_tables().encode() and call
+    cost_tables().complexity_batch() directly.
+    """
+    tables = cost_tables()
+    try:
+        precept_indices = [tables.precept_index[pid] for pid in precept_ids]
+    except KeyError as e:
+        raise ValueError(f"Precepto desconocido: {e.args[0]}") from None
+    # Misma cuenta que CostTables.complexity_batch, leyendo los
+    # ModifierSelection directamente en vez de codificarlos antes
+    index = tables.modifier_index
+    precept_base = tables.precept_base
+    base_short, base_long = tables.base, tables.base_long
+    rank_cost, instance_cost, efficiency = tables.rank, tables.instance, tables.efficiency
+    if long_durations is None:
+        long_durations = [False] * len(modifier_sets)
+    out: List[int] = []
+    for p, modifiers, long_duration in zip(precept_indices, modifier_sets, long_durations):
+        base = base_long if long_duration else base_short
+        total = precept_base[p]
+        has_efficiency = False
+        for m in modifiers:
+            i = index[m.modifier_id]
+            rank = m.rank
+            total += base[i] + rank_cost[i] * (rank if rank > 1 else 1) + instance_cost[i] * m.extra_instances
+            has_efficiency = has_efficiency or efficiency[i]
+        if has_efficiency:
+            total += tables.efficiency_total
+        out.append(total if total > 1 else 1)
+    return out
+
+
+
+# ---------- Vectorized batch evaluation ----------
+
+# Códigos de las columnas que devuelve evaluate_batch()
+INTENTS = ("NEUTRAL", "OFFENSIVE", "DEFENSIVE", "CONDITIONAL")
+EFFECT_TYPES = ("damage", "heal", "control", "utility")
+DURATION_KINDS = ("INSTANT", "ROUNDS", "MINUTES", "HOURS", "DAYS", "WEEKS", "MONTHS_YEARS")
+SHAPES = ("TARGET", "LINE", "CONE", "SPHERE", "WALL", "AURA")
+_SHAPE_BY_MODIFIER = {
+    "FORMA_LINEA": "LINE",
+    "FORMA_CONO": "CONE",
+    "FORMA_ESFERA": "SPHERE",
+    "FORMA_MURO": "WALL",
+    "FORMA_AURA": "AURA",
+}
+
+_ARRAY_TABLES: Dict[str, Dict[str, Any]] = {}
+
+
+def _array_tables() -> Dict[str, Any]:
+    """cost_tables() as NumPy arrays, plus the per-precept effect/die lookups."""
+    version = _rules_version()
+    arrays = _ARRAY_TABLES.get(version)
+    if arrays is not None:
+        return arrays
+    tables = cost_tables()
+    # effect_by_intent[p, intent] = código de get_effect_type(precept, intent)
+    effect_by_intent = np.array(
+        [[EFFECT_TYPES.index(get_effect_type(pid, intent)) for intent in INTENTS] for pid in tables.precept_ids],
+        dtype=np.int8,
+    )
+    arrays = {
+        "precept_base": np.array(tables.precept_base, dtype=np.int64),
+        "base": np.array(tables.base, dtype=np.int64),
+        "base_long": np.array(tables.base_long, dtype=np.int64),
+        "rank": np.array(tables.rank, dtype=np.int64),
+        "instance": np.array(tables.instance, dtype=np.int64),
+        "efficiency": np.array(tables.efficiency, dtype=bool),
+        "efficiency_total": tables.efficiency_total,
+        "effect_by_intent": effect_by_intent,
+        "die": np.array([get_base_die_for_precept(pid) for pid in tables.precept_ids], dtype=np.int64),
+        "column": tables.modifier_index,
+    }
+    _ARRAY_TABLES.clear()
+    _ARRAY_TABLES[version] = arrays
+    return arrays
+
+
+def encode_batch(
+    items: List[Tuple[str, List[str], List[ModifierSelection], bool]],
+) -> Dict[str, np.ndarray]:
+    """
+    (precept_id, numen_ids, modifiers, long_duration) tuples -> the arrays
+    evaluate_batch() takes: precept index, numen bitmask (NUMEN order),
+    ranks / extra_instances matrices with one column per modifier
+    (cost_tables().modifier_ids; rank 0 = absent) and long_duration.
+    A modifier repeated in one selection keeps its last values.
+    """
+    tables = cost_tables()
+    numen_bit = {nid: 1 << i for i, nid in enumerate(NUMEN)}
+    n, m = len(items), len(tables.modifier_ids)
+    precepts = np.empty(n, dtype=np.int64)
+    numen_mask = np.zeros(n, dtype=np.int64)
+    ranks = np.zeros((n, m), dtype=np.int64)
+    extras = np.zeros((n, m), dtype=np.int64)
+    long_duration = np.zeros(n, dtype=bool)
+    for row, (precept_id, numen_ids, modifiers, long_flag) in enumerate(items):
+        precepts[row] = tables.precept_index[precept_id]
+        for nid in numen_ids:
+            numen_mask[row] |= numen_bit[nid]
+        for sel in modifiers:
+            col = tables.modifier_index[sel.modifier_id]
+            ranks[row, col] = sel.rank
+            extras[row, col] = sel.extra_instances
+        long_duration[row] = long_flag
+    return {
+        "precepts": precepts,
+        "numen_mask": numen_mask,
+        "ranks": ranks,
+        "extras": extras,
+        "long_duration": long_duration,
+    }
+
+
+def evaluate_batch(
+    precepts: np.ndarray,
+    ranks: np.ndarray,
+    extras: np.ndarray | None = None,
+    long_duration: np.ndarray | None = None,
+    numen_mask: np.ndarray | None = None,
+) -> Dict[str, np.ndarray]:
+    """
+    calculate_complexity, derive_tier, get_intent_from_modifiers,
+    get_effect_type and the dice / duration kind of suggest_mechanics for
+    N encoded ordinances at once (see encode_batch), as whole arrays.
+
+    Returns int arrays complexity, tier, intent (index into INTENTS),
+    effect_type (EFFECT_TYPES), die, total_dice, dice_per_instance and
+    instances (0 unless damage/heal), severity (0 unless control),
+    duration_kind (DURATION_KINDS) and shape (SHAPES). The matrix has no
+    modifier order: with several FORMA the one first in MODIFIERS counts.
+    numen_mask is accepted for symmetry; no output depends on the numen.
+    """
+    t = _array_tables()
+    col = t["column"]
+    precepts = np.asarray(precepts, dtype=np.int64)
+    ranks = np.asarray(ranks, dtype=np.int64)
+    n = len(precepts)
+    extras = np.zeros_like(ranks) if extras is None else np.asarray(extras, dtype=np.int64)
+    long_duration = np.zeros(n, dtype=bool) if long_duration is None else np.asarray(long_duration, dtype=bool)
+    present = ranks > 0
+
+    # Complejidad (misma fórmula que arcana_rules.CostTables)
+    base = np.where(long_duration[:, None], t["base_long"], t["base"])
+    per_modifier = base + t["rank"] * np.maximum(ranks, 1) + t["instance"] * extras
+    complexity = t["precept_base"][precepts] + (per_modifier * present).sum(axis=1)
+    has_efficiency = (present & t["efficiency"]).any(axis=1)
+    complexity = np.maximum(complexity + has_efficiency * t["efficiency_total"], 1)
+
+    tier = np.searchsorted(np.array([2, 5, 8]), complexity, side="left") + 1
+
+    # Intención: el primer modificador de INTENCION por prioridad
+    offensive = present[:, col["INTENCION_OFENSIVO"]]
+    defensive = present[:, col["INTENCION_DEFENSIVO"]]
+    conditional = present[:, col["INTENCION_CONDICIONAL"]]
+    intent = np.select([offensive, defensive, conditional], [1, 2, 3], default=0)
+    effect_type = t["effect_by_intent"][precepts, intent]
+
+    # Dados (suggest_damage_or_heal)
+    potenciado = ranks[:, col["INTENSIDAD_POTENCIADO"]]
+    up = 1 + potenciado
+    up = np.where(present[:, col["INTENSIDAD_REDUCIDO"]], np.maximum(up - 1, 0), up)
+    total_dice = np.maximum(up + tier - 1, 1)
+    multiplicado = col["INTENSIDAD_MULTIPLICADO"]
+    instances = np.where(present[:, multiplicado], 1 + np.maximum(extras[:, multiplicado], 0), 1)
+    dice_per_instance = np.maximum(total_dice // instances, 1)
+    heavy = effect_type <= EFFECT_TYPES.index("heal")
+    zero = np.zeros(n, dtype=np.int64)
+
+    # Severidad (suggest_control_effect) y forma (extract_modifier_info)
+    severity = np.clip(tier + (potenciado >= 2) - present[:, col["INTENSIDAD_REDUCIDO"]], 1, 4)
+    severity = np.where(effect_type == EFFECT_TYPES.index("control"), severity, zero)
+    shape = zero.copy()
+    for _, mid in sorted(((col[mid], mid) for mid in _SHAPE_BY_MODIFIER if mid in col), reverse=True):
+        shape = np.where(present[:, col[mid]], SHAPES.index(_SHAPE_BY_MODIFIER[mid]), shape)
+
+    # Duración (_suggest_duration_profile)
+    persistente = ranks[:, col["DURACION_PERSISTENTE"]]
+    power = tier + persistente + potenciado + long_duration
+    step = np.searchsorted(np.array([2, 4, 6, 8]), power, side="left")
+    duration_kind = np.where(heavy, 1 + step, 2 + step)
+    duration_kind = np.where((persistente <= 0) & ~long_duration, 0, duration_kind)
+
+    return {
+        "complexity": complexity,
+        "tier": tier,
+        "intent": intent,
+        "effect_type": effect_type.astype(np.int64),
+        "die": t["die"][precepts],
+        "total_dice": np.where(heavy, total_dice, zero),
+        "dice_per_instance": np.where(heavy, dice_per_instance, zero),
+        "instances": np.where(heavy, instances, zero),
+        "severity": severity,
+        "duration_kind": duration_kind,
+        "shape": shape,
+    }
+
+
+
+# ---------- Enumeración del espacio de diseño ----------
+
+def _complexity_bounds(min_tier: int | None, max_tier: int | None, max_complexity: int | None) -> Tuple[int, int]:
+    """[min, max] complexity budget from the tier and/or complexity limits."""
+    tables = cost_tables()
+    variants = arcana_rules.modifier_variants(tables, MODIFIERS, max_extra_instances=0)
+    # Cota superior de cualquier selección: base máxima + todos los costes positivos
+    upper = max(tables.precept_base) + sum(
+        max(0, tables.base_long[i] + tables.rank[i] * max(r for r, _ in variants[i])) for i in range(len(variants))
+    )
+    hi = upper if max_complexity is None else max_complexity
+    lo = 1
+    if max_tier is not None:
+        hi = min(hi, max((c for c in range(1, hi + 1) if derive_tier(c) <= max_tier), default=0))
+    if min_tier is not None:
+        lo = min((c for c in range(1, hi + 1) if derive_tier(c) >= min_tier), default=hi + 1)
+    return lo, hi
+
+
+def enumerate_ordinances(
+    max_complexity: int | None = None,
+    max_tier: int | None = None,
+    min_tier: int | None = None,
+    precept_ids: List[str] | None = None,
+    max_numen: int = 1,
+    max_modifiers: int | None = None,
+    max_extra_instances: int = 3,
+    long_duration: bool = False,
+    cursor: Tuple | List | None = None,
+) -> Iterator[Tuple[str, List[str], List[ModifierSelection], int, Tuple]]:
+    """
+    Stream every valid (precept_id, numen_ids, modifiers, complexity,
+    cursor) within the complexity / tier budget, without building the
+    product. Modifier selections come from arcana_rules.iter_selections:
+    Constructor ranks, 0..max_extra_instances for MULTIPLICADO and the
+    FAMILY_LIMITS / EXCLUSIVE_MODIFIERS / FAMILY_REQUIRES constraints
+    (one FORMA, one INTENCION, CONDICION only with Condicional...).
+    Each selection is paired with every set of 1..max_numen numen.
+
+    A yielded cursor is JSON-serializable once converted to lists; pass it
+    back with the same arguments to resume right after that item. Cursors
+    from other rules versions are rejected.
+    """
+    tables = cost_tables()
+    version = _rules_version()
+    lo, hi = _complexity_bounds(min_tier, max_tier, max_complexity)
+    variants = arcana_rules.modifier_variants(tables, MODIFIERS, max_extra_instances)
+    numen_sets = [
+        list(combo)
+        for size in range(1, max_numen + 1)
+        for combo in itertools.combinations(NUMEN, size)
+    ]
+    precept_indices = None
+    if precept_ids is not None:
+        precept_indices = sorted(tables.precept_index[pid] for pid in precept_ids)
+
+    after = None
+    start_numen = 0
+    if cursor is not None:
+        cursor_version, p, choices, numen_index = cursor
+        if cursor_version != version:
+            raise ValueError("The cursor belongs to another rules version")
+        after = (p, tuple(choices))
+        start_numen = numen_index + 1
+
+    def selections():
+        if after is not None and start_numen < len(numen_sets):
+            # Terminar los numen pendientes de la selección del cursor
+            complexity = tables.complexity(
+                after[0],
+                [(i, *variants[i][v]) for i, v in enumerate(after[1]) if v != -1],
+                long_duration,
+            )
+            yield after[0], after[1], complexity, start_numen
+        for p, choices, complexity in arcana_rules.iter_selections(
+            tables, MODIFIERS, variants, hi, lo, long_duration, precept_indices, max_modifiers, after
+        ):
+            yield p, choices, complexity, 0
+
+    mod_ids = tables.modifier_ids
+    for p, choices, complexity, first_numen in selections():
+        precept_id = tables.precept_ids[p]
+        modifiers = [
+            ModifierSelection(mod_ids[i], *variants[i][v]) for i, v in enumerate(choices) if v != -1
+        ]
+        for k in range(first_numen, len(numen_sets)):
+            yield precept_id, numen_sets[k], modifiers, complexity, (version, p, choices, k)
+
+
+
+_COUNT_CACHE: Dict[Tuple, Dict[Tuple[str, int, int, str], int]] = {}
+
+
+def count_ordinances(
+    max_numen: int = 1,
+    max_modifiers: int | None = None,
+    max_extra_instances: int = 3,
+    long_duration: bool = False,
+) -> Dict[Tuple[str, int, int, str], int]:
+    """
+    Exact number of ordinances enumerate_ordinances() would yield (same
+    arguments, no budget), by (precept_id, complexity, tier, effect_type),
+    without enumerating them. Cached per rules version.
+    """
+    version = _rules_version()
+    key = (version, max_numen, max_modifiers, max_extra_instances, bool(long_duration))
+    counts = _COUNT_CACHE.get(key)
+    if counts is not None:
+        return counts
+
+    tables = cost_tables()
+    variants = arcana_rules.modifier_variants(tables, MODIFIERS, max_extra_instances)
+    by_cost = arcana_rules.count_selections(tables, MODIFIERS, variants, long_duration, max_modifiers)
+    numen_sets = sum(math.comb(len(NUMEN), k) for k in range(1, max_numen + 1))
+
+    intents = {
+        group: get_intent_from_modifiers([ModifierSelection(mid) for mid in group])
+        for _, group in by_cost
+    }
+    counts = {}
+    for pid, base in zip(tables.precept_ids, tables.precept_base):
+        for (cost, group), n in by_cost.items():
+            complexity = max(1, base + cost)
+            k = (pid, complexity, derive_tier(complexity), get_effect_type(pid, intents[group]))
+            counts[k] = counts.get(k, 0) + n * numen_sets
+
+    for old in [k for k in _COUNT_CACHE if k[0] != version]:
+        del _COUNT_CACHE[old]
+    _COUNT_CACHE[key] = counts
+    return counts
+
+
+
+# ---------- Búsqueda inversa (constructor inverso) ----------
+
+REVERSE_FEATURES = ("effect_type", "tier", "dice_per_instance", "shape", "duration_kind", "severity")
+REVERSE_PER_OUTCOME = 5  # selecciones más baratas que se guardan por resultado
+
+_REVERSE_INDEX: Dict[Tuple, Dict[str, Any]] = {}
+
+
+def _selection_matrices(
+    tables: arcana_rules.CostTables,
+    variants: List[List[Tuple[int, int]]],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Every selection arcana_rules.iter_selections() would yield without a
+    budget, as ranks / extras matrices. Built column by column with NumPy
+    (each modifier multiplies the rows by its options, then the family
+    constraints filter them): the DFS visits millions of nodes for this.
+    """
+    families = [MODIFIERS[mid].get("family") for mid in tables.modifier_ids]
+    n = len(tables.modifier_ids)
+    choices = np.full((1, n), -1, dtype=np.int64)
+    family_count = {f: np.zeros(1, dtype=np.int64) for f in arcana_rules.FAMILY_LIMITS}
+    for i, mid in enumerate(tables.modifier_ids):
+        options = np.arange(-1, len(variants[i]))
+        rows = len(choices)
+        choices = np.repeat(choices, len(options), axis=0)
+        choices[:, i] = np.tile(options, rows)
+        family_count = {f: np.repeat(c, len(options)) for f, c in family_count.items()}
+        fam = families[i]
+        if fam in family_count:
+            family_count[fam] = family_count[fam] + (choices[:, i] >= 0)
+        ok = np.ones(len(choices), dtype=bool)
+        for f, c in family_count.items():
+            ok &= c <= arcana_rules.FAMILY_LIMITS[f]
+        for a, b in arcana_rules.EXCLUSIVE_MODIFIERS:
+            if mid in (a, b) and a in tables.modifier_index and b in tables.modifier_index:
+                ok &= (choices[:, tables.modifier_index[a]] < 0) | (choices[:, tables.modifier_index[b]] < 0)
+        choices = choices[ok]
+        family_count = {f: c[ok] for f, c in family_count.items()}
+    for i, fam in enumerate(families):
+        required = arcana_rules.FAMILY_REQUIRES.get(fam)
+        if required is not None:
+            has_required = choices[:, tables.modifier_index[required]] >= 0 if required in tables.modifier_index else False
+            choices = choices[(choices[:, i] < 0) | has_required]
+
+    ranks = np.zeros(choices.shape, dtype=np.int64)
+    extras = np.zeros(choices.shape, dtype=np.int64)
+    for i, options in enumerate(variants):
+        chosen = choices[:, i] >= 0
+        picked = np.where(chosen, choices[:, i], 0)
+        ranks[:, i] = np.where(chosen, np.array([r for r, _ in options])[picked], 0)
+        extras[:, i] = np.where(chosen, np.array([x for _, x in options])[picked], 0)
+    return ranks, extras
+
+
+def build_reverse_index(max_extra_instances: int = 3) -> Dict[str, Any]:
+    """
+    Index from outcome features (REVERSE_FEATURES) to the cheapest
+    modifier selections that produce them, cached per rules version.
+
+    Mechanics do not depend on the numen, and precepts only matter through
+    their base cost and how intent maps to effect type. So the whole
+    selection space is evaluated once per group of equivalent precepts
+    with evaluate_batch, and only the REVERSE_PER_OUTCOME cheapest
+    selections of each distinct outcome are kept.
+    """
+    version = _rules_version()
+    key = (version, max_extra_instances)
+    index = _REVERSE_INDEX.get(key)
+    if index is not None:
+        return index
+
+    tables = cost_tables()
+    arrays = _array_tables()
+    variants = arcana_rules.modifier_variants(tables, MODIFIERS, max_extra_instances)
+    ranks, extras = _selection_matrices(tables, variants)
+    # long_duration solo se ofrece con Persistente (como en el Constructor)
+    persistent = ranks[:, tables.modifier_index["DURACION_PERSISTENTE"]] > 0
+    ranks = np.concatenate([ranks, ranks[persistent]])
+    extras = np.concatenate([extras, extras[persistent]])
+    long_duration = np.concatenate([np.zeros(len(persistent), dtype=bool), np.ones(persistent.sum(), dtype=bool)])
+    n_modifiers = (ranks > 0).sum(axis=1)
+
+    groups: Dict[Tuple, List[str]] = {}
+    for p, pid in enumerate(tables.precept_ids):
+        group_key = (tuple(arrays["effect_by_intent"][p]), tables.precept_base[p])
+        groups.setdefault(group_key, []).append(pid)
+
+    parts: List[Dict[str, np.ndarray]] = []
+    group_precepts: List[List[str]] = []
+    for g, precept_ids in enumerate(groups.values()):
+        rep = tables.precept_index[precept_ids[0]]
+        result = evaluate_batch(np.full(len(ranks), rep), ranks, extras, long_duration)
+        features = [result[f] for f in REVERSE_FEATURES]
+        # Orden: resultado, luego complejidad y nº de modificadores
+        order = np.lexsort([n_modifiers, result["complexity"]] + features[::-1])
+        sorted_keys = np.stack([f[order] for f in features], axis=1)
+        new_key = np.ones(len(order), dtype=bool)
+        new_key[1:] = (sorted_keys[1:] != sorted_keys[:-1]).any(axis=1)
+        starts = np.maximum.accumulate(np.where(new_key, np.arange(len(order)), 0))
+        keep = order[np.arange(len(order)) - starts < REVERSE_PER_OUTCOME]
+        part = {f: result[f][keep] for f in REVERSE_FEATURES}
+        part["complexity"] = result["complexity"][keep]
+        part["ranks"] = ranks[keep]
+        part["extras"] = extras[keep]
+        part["long_duration"] = long_duration[keep]
+        part["group"] = np.full(len(keep), g)
+        parts.append(part)
+        group_precepts.append(precept_ids)
+
+    index = {k: np.concatenate([part[k] for part in parts]) for k in parts[0]}
+    index["group_precepts"] = group_precepts
+    index["modifier_ids"] = tables.modifier_ids
+    for old in [k for k in _REVERSE_INDEX if k[0] != version]:
+        del _REVERSE_INDEX[old]
+    _REVERSE_INDEX[key] = index
+    return index
+
+
+def reverse_search(
+    effect_type: str | None = None,
+    tier: int | None = None,
+    dice_per_instance: int | None = None,
+    shape: str | None = None,
+    duration_kind: str | None = None,
+    severity: int | None = None,
+    precept_id: str | None = None,
+    limit: int = 10,
+) -> List[Dict[str, Any]]:
+    """
+    Cheapest modifier selections whose suggest_mechanics outcome matches
+    every given feature (None = any), e.g. effect_type="damage",
+    dice_per_instance=3, shape="CONE", duration_kind="ROUNDS".
+
+    Each result has modifiers, long_duration, complexity, the outcome
+    features and the precept_ids it applies to (only `precept_id` if
+    given). Sorted by complexity, then number of modifiers. An unknown
+    precept_id raises ValueError.
+    """
+    if precept_id is not None and precept_id not in PRECEPTS:
+        raise ValueError(f"Precepto desconocido: {precept_id}")
+    index = build_reverse_index()
+    wanted = {
+        "effect_type": None if effect_type is None else EFFECT_TYPES.index(effect_type),
+        "tier": tier,
+        "dice_per_instance": dice_per_instance,
+        "shape": None if shape is None else SHAPES.index(shape),
+        "duration_kind": None if duration_kind is None else DURATION_KINDS.index(duration_kind),
+        "severity": severity,
+    }
+    mask = np.ones(len(index["complexity"]), dtype=bool)
+    for feature, value in wanted.items():
+        if value is not None:
+            mask &= index[feature] == value
+    if precept_id is not None:
+        group = next(g for g, pids in enumerate(index["group_precepts"]) if precept_id in pids)
+        mask &= index["group"] == group
+
+    rows = np.flatnonzero(mask)
+    n_modifiers = (index["ranks"][rows] > 0).sum(axis=1)
+    rows = rows[np.lexsort((n_modifiers, index["complexity"][rows]))]
+
+    # La misma selección puede salir para varios grupos de preceptos: se juntan
+    results: Dict[Tuple, Dict[str, Any]] = {}
+    mod_ids = index["modifier_ids"]
+    for row in rows:
+        ranks, extras = index["ranks"][row], index["extras"][row]
+        selection = tuple((i, int(ranks[i]), int(extras[i])) for i in np.flatnonzero(ranks))
+        key = (selection, bool(index["long_duration"][row]), int(index["complexity"][row]))
+        precepts = [precept_id] if precept_id is not None else index["group_precepts"][index["group"][row]]
+        if key in results:
+            results[key]["precept_ids"].extend(precepts)
+            continue
+        if len(results) >= limit:
+            continue
+        results[key] = {
+            "modifiers": [ModifierSelection(mod_ids[i], r, x) for i, r, x in selection],
+            "long_duration": key[1],
+            "complexity": key[2],
+            "effect_type": EFFECT_TYPES[index["effect_type"][row]],
+            "tier": int(index["tier"][row]),
+            "dice_per_instance": int(index["dice_per_instance"][row]),
+            "shape": SHAPES[index["shape"][row]],
+            "duration_kind": DURATION_KINDS[index["duration_kind"][row]],
+            "severity": int(index["severity"][row]),
+            "precept_ids": list(precepts),
+        }
+    return list(results.values())
+
+
+
+# ---------- Atlas precalculado (mmap) ----------
+
+ATLAS_PATH = os.environ.get("ARCANA_ATLAS_PATH", "arcana_atlas.bin")
+ATLAS_CHUNK = 1 << 18  # celdas por llamada a evaluate_batch al construir
+
+_ATLAS_STATE: Dict[str, Any] = {"atlas": None, "signature": None, "checked": float("-inf")}
+_ATLAS_LOCK = threading.Lock()
+
+
+def build_atlas(path: str = ATLAS_PATH, max_extra_instances: int = 3) -> Dict[str, Any]:
+    """
+    Offline step: evaluate every atlas cell (see arcana_atlas) with
+    evaluate_batch and write the file. Ranks are capped at each modifier's
+    max_rank and Multiplicado at `max_extra_instances` extra instances;
+    anything outside the grid falls back to the rule functions.
+    """
+    start = time.perf_counter()
+    tables = cost_tables()
+    arrays = _array_tables()
+    variants = arcana_rules.modifier_variants(tables, MODIFIERS, max_extra_instances)
+    family_of = {mid: MODIFIERS[mid].get("family") for mid in tables.modifier_ids}
+    axes = arcana_atlas.selection_axes(tables, variants, family_of)
+    n_cells = math.prod(len(options) for options in axes)
+
+    # Misma agrupación que build_reverse_index: coste base + fila de efectos
+    classes: Dict[Tuple, int] = {}
+    precept_class = []
+    for p in range(len(tables.precept_ids)):
+        class_key = (tuple(arrays["effect_by_intent"][p]), tables.precept_base[p])
+        precept_class.append(classes.setdefault(class_key, len(classes)))
+    representatives = [precept_class.index(c) for c in range(len(classes))]
+
+    def class_records():
+        for rep in representatives:
+            records = np.empty(n_cells, dtype=arcana_atlas.RECORD_DTYPE)
+            for lo in range(0, n_cells, ATLAS_CHUNK):
+                hi = min(lo + ATLAS_CHUNK, n_cells)
+                ranks, extras, long_duration = arcana_atlas.decode_cells(axes, tables.modifier_index, lo, hi)
+                result = evaluate_batch(np.full(hi - lo, rep), ranks, extras, long_duration)
+                for field in arcana_atlas.RECORD_FIELDS:
+                    if result[field].max() > 255:
+                        raise ValueError(f"{field} no cabe en un byte: {result[field].max()}")
+                    records[field][lo:hi] = result[field]
+            yield records
+
+    header = {
+        "format": arcana_atlas.FORMAT_VERSION,
+        "rules": _rules_version(),
+        "max_extra_instances": max_extra_instances,
+        "fields": list(arcana_atlas.RECORD_FIELDS),
+        "effect_types": list(EFFECT_TYPES),
+        "duration_kinds": list(DURATION_KINDS),
+        "precept_ids": list(tables.precept_ids),
+        "precept_class": precept_class,
+        "die": [int(d) for d in arrays["die"]],
+        "axes": axes,
+        "n_cells": n_cells,
+    }
+    size = arcana_atlas.write_atlas(path, header, class_records())
+    return {
+        "path": path,
+        "classes": len(classes),
+        "n_cells": n_cells,
+        "bytes": size,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def mechanics_atlas() -> arcana_atlas.Atlas | None:
+    """
+    The memory-mapped ATLAS_PATH, opened once per process and reopened when
+    the file changes (checked at most every RULES_CHECK_SECONDS). None if
+    there is no atlas or it was built for other rules.
+    """
+    now = time.monotonic()
+    if now - _ATLAS_STATE["checked"] >= RULES_CHECK_SECONDS:
+        with _ATLAS_LOCK:
+            try:
+                st = os.stat(ATLAS_PATH)
+                signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+            except OSError:
+                signature = None
+            if signature != _ATLAS_STATE["signature"]:
+                # El mapa viejo no se cierra: otros hilos pueden estar leyéndolo
+                atlas = None
+                if signature is not None:
+                    try:
+                        atlas = arcana_atlas.Atlas(ATLAS_PATH)
+                    except (OSError, ValueError, KeyError):
+                        atlas = None
+                _ATLAS_STATE["atlas"] = atlas
+                _ATLAS_STATE["signature"] = signature
+            _ATLAS_STATE["checked"] = now
+    atlas = _ATLAS_STATE["atlas"]
+    if atlas is None or atlas.rules != _rules_version():
+        return None
+    return atlas
+
+
+def atlas_lookup(
+    precept_id: str,
+    modifiers: List[ModifierSelection],
+    long_duration: bool = False,
+) -> Dict[str, Any] | None:
+    """
+    complexity, tier, effect_type, die, total_dice, dice_per_instance and
+    duration_kind of a selection read from the atlas (same values as
+    evaluate_batch), or None if there is no current atlas or the selection
+    is outside it.
+
+    Opt-in: nothing else reads the atlas. One lookup replaces a
+    calculate_complexity + suggest_mechanics pair (see bench atlas), but
+    it is slower than calculate_complexity alone.
+    """
+    atlas = mechanics_atlas()
+    if atlas is None:
+        return None
+    record = atlas.lookup(precept_id, _modifier_signature(modifiers), long_duration)
+    if record is None:
+        return None
+    complexity, tier, effect_type, total_dice, dice_per_instance, duration_kind = record
+    return {
+        "complexity": complexity,
+        "tier": tier,
+        "effect_type": EFFECT_TYPES[effect_type],
+        "die": atlas.die[precept_id],
+        "total_dice": total_dice,
+        "dice_per_instance": dice_per_instance,
+        "duration_kind": DURATION_KINDS[duration_kind],
+    }
+
+
+
+# ---------- Evaluación por lotes en procesos ----------
+
+BATCH_WORKERS = int(os.environ.get("ARCANA_BATCH_WORKERS", "0"))  # 0 = os.cpu_count()
+BATCH_CHUNK_SIZE = int(os.environ.get("ARCANA_BATCH_CHUNK_SIZE", "2000"))
+BATCH_MIN_PARALLEL = 5000  # por debajo no compensa repartir entre procesos
+
+# (precept_id, numen_ids, ((modifier_id, rank, extra_instances), ...), long_duration)
+EncodedItem = Tuple[str, Tuple[str, ...], Tuple[Tuple[str, int, int], ...], bool]
+
+_BATCH_POOL: Dict[str, Any] = {"executor": None, "workers": 0}
+_BATCH_POOL_LOCK = threading.Lock()
+
+
+def _encode_item(item: Tuple[str, List[str], List[ModifierSelection], bool]) -> EncodedItem:
+    precept_id, numen_ids, modifiers, long_duration = item
+    return precept_id, tuple(numen_ids), tuple(_modifier_signature(modifiers)), bool(long_duration)
+
+
+def _evaluate_encoded(chunk: List[EncodedItem]) -> List[Tuple[int, Dict[str, Any]]]:
+    """(complexity, suggest_mechanics) per encoded item; runs in the workers."""
+    out = []
+    for precept_id, numen_ids, signature, long_duration in chunk:
+        modifiers = [ModifierSelection(mid, rank, extra) for mid, rank, extra in signature]
+        complexity = calculate_complexity(precept_id, list(numen_ids), modifiers, long_duration)
+        # Sin memo: en lotes grandes casi no se repiten selecciones y la LRU
+        # solo añade el coste de la clave y de los desalojos
+        mechanics = suggest_mechanics_uncached(precept_id, list(numen_ids), modifiers, complexity, long_duration)
+        out.append((complexity, mechanics))
+    return out
+
+
+def _batch_executor(workers: int) -> ProcessPoolExecutor:
+    """Process pool kept between calls (no respawn per batch)."""
+    with _BATCH_POOL_LOCK:
+        if _BATCH_POOL["executor"] is None or _BATCH_POOL["workers"] != workers:
+            if _BATCH_POOL["executor"] is not None:
+                _BATCH_POOL["executor"].shutdown(wait=False, cancel_futures=True)
+            # spawn: el proceso de Streamlit tiene hilos y fork no es seguro
+            _BATCH_POOL["executor"] = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+            _BATCH_POOL["workers"] = workers
+        return _BATCH_POOL["executor"]
+
+
+def shutdown_batch_pool() -> None:
+    """Stop the batch_evaluate() worker processes (recreated on demand)."""
+    with _BATCH_POOL_LOCK:
+        if _BATCH_POOL["executor"] is not None:
+            _BATCH_POOL["executor"].shutdown(wait=True, cancel_futures=True)
+        _BATCH_POOL["executor"], _BATCH_POOL["workers"] = None, 0
+
+
+atexit.register(shutdown_batch_pool)
+
+
+def batch_evaluate(
+    items: List[Tuple[str, List[str], List[ModifierSelection], bool]],
+    workers: int | None = None,
+    chunk_size: int | None = None,
+) -> List[Tuple[int, Dict[str, Any]]]:
+    """
+    (complexity, suggest_mechanics dict) for each (precept_id, numen_ids,
+    modifiers, long_duration) item, in input order.
+
+    Large inputs are split into chunks of plain tuples (no dataclasses to
+    pickle) and scored by a pool of `workers` processes (default
+    BATCH_WORKERS, 0 = one per CPU); small inputs or workers=1 run in this
+    process. Errors in a worker (e.g. an unknown precept) are re-raised.
+    """
+    workers = workers or BATCH_WORKERS or os.cpu_count() or 1
+    chunk_size = chunk_size or BATCH_CHUNK_SIZE
+    encoded = [_encode_item(item) for item in items]
+    if workers <= 1 or len(encoded) < BATCH_MIN_PARALLEL:
+        return _evaluate_encoded(encoded)
+
+    # Como mucho ~4 trozos por proceso para repartir bien la carga
+    chunk_size = max(1, min(chunk_size, -(-len(encoded) // (workers * 4))))
+    chunks = [encoded[i : i + chunk_size] for i in range(0, len(encoded), chunk_size)]
+    try:
+        parts = list(_batch_executor(workers).map(_evaluate_encoded, chunks))
+    except BrokenProcessPool:
+        shutdown_batch_pool()
+        raise
+    return [result for part in parts for result in part]
+
+
+
 # ---------- Simple JSON "DB" helpers ----------
 
 DB_PATH = os.environ.get( "ARCANA_DB_PATH", "ordinances_db.json")
 BACKUP_DIR = Path(os.environ.get("ARCANA_BACKUP_DIR", "grimoire_h"))
+BACKUP_KEEP_LAST = int(os.environ.get("ARCANA_BACKUP_KEEP_LAST", "20"))
+BACKUP_KEEP_DAILY = int(os.environ.get("ARCANA_BACKUP_KEEP_DAILY", "30"))
+
+# Journal mode: cada guardado añade un registro al final de un log en vez de
+# reescribir todo el JSON. load_ordinances reconstruye snapshot + journal.
+JOURNAL_MODE = os.environ.get("ARCANA_DB_JOURNAL", "").lower() in ("1", "true", "yes")
+JOURNAL_PATH = os.environ.get("ARCANA_DB_JOURNAL_PATH", DB_PATH + ".journal")
+JOURNAL_COMPACT_EVERY = int(os.environ.get("ARCANA_JOURNAL_COMPACT_EVERY", "500"))
+
+# SQLite backend: se activa apuntando ARCANA_DB_PATH a un fichero .sqlite/.db.
+# Si la base aún no existe se migra una vez desde el JSON legado.
+SQLITE_MODE = DB_PATH.endswith((".sqlite", ".sqlite3", ".db"))
+LEGACY_JSON_PATH = os.environ.get("ARCANA_JSON_DB_PATH", "ordinances_db.json")
+
+# Sharded mode: un fichero por precepto + manifest en SHARD_DIR. Cada guardado
+# reescribe, respalda y sube solo los shards que han cambiado.
+SHARD_MODE = not SQLITE_MODE and os.environ.get("ARCANA_DB_SHARDED", "").lower() in ("1", "true", "yes")
+SHARD_DIR = os.environ.get("ARCANA_SHARD_DIR", "ordinances_db")
+SHARD_REPO_DIR = os.path.basename(os.path.normpath(SHARD_DIR))  # carpeta de los shards en el repo
+# Shard en el que está escrito cada id según la última carga o escritura de
+# este proceso: si una edición le cambia el precepto hay que sacarlo del viejo
+_SHARD_OF: Dict[str, str] = {}
+
+# Carga perezosa del snapshot JSON (LazyGrimoire): índice ligero al arrancar,
+# registros completos bajo demanda. Solo en POSIX: en Windows un fichero
+# mapeado no se puede reemplazar al guardar.
+LAZY_LOAD = os.environ.get("ARCANA_DB_LAZY", "1" if os.name == "posix" else "0").lower() in ("1", "true", "yes")
+HYDRATED_CACHE_SIZE = int(os.environ.get("ARCANA_HYDRATED_CACHE_SIZE", "4096"))
+
+# Lock de escritura (hilos + procesos) y versión monotónica del DB
+_DB_META_BASE = os.path.join(SHARD_DIR, "grimoire") if SHARD_MODE else DB_PATH
+LOCK_PATH = _DB_META_BASE + ".lock"
+VERSION_PATH = _DB_META_BASE + ".version"
 
 GITHUB_TOKEN = os.environ.get("GITHUB_TOKEN_ARCANA")  # Tu Personal Access Token de GitHub
 GITHUB_REPO = "Addraed/Arcana-Dataviz"  # Tu repo de GitHub
 GITHUB_BRANCH = "main"  # o "master" según tu repo
+GITHUB_API_URL = os.environ.get("ARCANA_GITHUB_API_URL", "https://api.github.com")
+
+# Sync a GitHub en segundo plano: cola persistente + debounce
+SYNC_PENDING_PATH = os.environ.get("ARCANA_SYNC_PENDING_PATH", DB_PATH + ".sync_pending")
+SYNC_DEBOUNCE_SECONDS = float(os.environ.get("ARCANA_SYNC_DEBOUNCE", "5"))
+SYNC_MAX_DELAY_SECONDS = float(os.environ.get("ARCANA_SYNC_MAX_DELAY", "60"))
 
 # Ensure backup directory exists
 BACKUP_DIR.mkdir(parents=True, exist_ok=True)
 
+# Number of records currently sitting in the journal (set on load / append)
+_journal_records = 0
 
-def load_ordinances() -> Dict[str, Ordinance]:
-    if not os.path.exists(DB_PATH):
-        return {}
-    with open(DB_PATH, "r", encoding="utf-8") as f:
-        raw = json.load(f)
-    ordinances: Dict[str, Ordinance] = {}
-    for oid, data in raw.items():
-        modifiers = [
-            ModifierSelection(**m) for m in data["modifiers"]
-        ]
-        ordinances[oid] = Ordinance(
-            id=data["id"],
-            canonical_key=data["canonical_key"],
-            name=data["name"],
-            precept_id=data["precept_id"],
-            numen_ids=data["numen_ids"],
-            modifiers=modifiers,
-            mechanical=data["mechanical"],
-            cost=data["cost"],
-            tier=data["tier"],
-            meta=data["meta"],
+
+def _ordinance_from_dict(data: Dict[str, Any]) -> Ordinance:
+    return Ordinance.from_dict(data)
+
+
+# ---------- Serialización incremental ----------
+
+_encode_str = json.encoder.encode_basestring  # versión C, equivale a ensure_ascii=False
+
+
+def _json_indented(value: Any, prefix: str) -> str:
+    """
+    json.dumps(value, ensure_ascii=False, indent=2) with every line after
+    the first prefixed by `prefix`, byte for byte. With indent set, json
+    falls back to its pure-Python encoder; this renders the usual record
+    shapes (str keys, scalars, lists, dicts) several times faster.
+    """
+    if isinstance(value, str):
+        return _encode_str(value)
+    if isinstance(value, dict):
+        if not value:
+            return "{}"
+        inner = prefix + "  "
+        parts = []
+        for k, v in value.items():
+            if not isinstance(k, str):
+                break  # claves no str: que las convierta json
+            parts.append(f"{inner}{_encode_str(k)}: {_json_indented(v, inner)}")
+        else:
+            return "{\n" + ",\n".join(parts) + "\n" + prefix + "}"
+    elif isinstance(value, (list, tuple)):
+        if not value:
+            return "[]"
+        inner = prefix + "  "
+        return "[\n" + ",\n".join(inner + _json_indented(v, inner) for v in value) + "\n" + prefix + "]"
+    elif value is None or isinstance(value, (bool, int)):
+        return "null" if value is None else "true" if value is True else "false" if value is False else int.__repr__(value)
+    return json.dumps(value, ensure_ascii=False, indent=2).replace("\n", "\n" + prefix)
+
+
+def _ordinance_fragment(ord_obj: Ordinance) -> str:
+    """
+    The ordinance's record as it appears inside the indent=2 grimoire JSON
+    (already indented one level). Cached on the object until it changes.
+    """
+    fragment = ord_obj._fragment
+    if fragment is None:
+        # Plantilla fija para la parte conocida del registro; _json_indented
+        # solo para los valores libres (mechanical/cost/meta)
+        i1, i2, i3 = "    ", "      ", "        "
+        if ord_obj.modifiers:
+            modifiers = "[\n" + ",\n".join(
+                f'{i2}{{\n{i3}"modifier_id": {_json_indented(m.modifier_id, i3)},\n'
+                f'{i3}"rank": {_json_indented(m.rank, i3)},\n'
+                f'{i3}"extra_instances": {_json_indented(m.extra_instances, i3)}\n{i2}}}'
+                for m in ord_obj.modifiers
+            ) + f"\n{i1}]"
+        else:
+            modifiers = "[]"
+        fragment = (
+            f'{{\n{i1}"id": {_json_indented(ord_obj.id, i1)},\n'
+            f'{i1}"canonical_key": {_json_indented(ord_obj.canonical_key, i1)},\n'
+            f'{i1}"name": {_json_indented(ord_obj.name, i1)},\n'
+            f'{i1}"precept_id": {_json_indented(ord_obj.precept_id, i1)},\n'
+            f'{i1}"numen_ids": {_json_indented(ord_obj.numen_ids, i1)},\n'
+            f'{i1}"modifiers": {modifiers},\n'
+            f'{i1}"mechanical": {_json_indented(ord_obj.mechanical, i1)},\n'
+            f'{i1}"cost": {_json_indented(ord_obj.cost, i1)},\n'
+            f'{i1}"tier": {_json_indented(ord_obj.tier, i1)},\n'
+            f'{i1}"meta": {_json_indented(ord_obj.meta, i1)}\n  }}'
         )
+        object.__setattr__(ord_obj, "_fragment", fragment)
+    return fragment
+
+
+def _grimoire_json(ordinances: Dict[str, Ordinance]) -> str:
+    """
+    Same text as json.dumps({oid: record}, ensure_ascii=False, indent=2),
+    but only dirty ordinances are re-encoded; the rest are spliced in from
+    their cached fragments.
+    """
+    if not ordinances:
+        return "{}"
+    if isinstance(ordinances, Grimoire):
+        # Un LazyGrimoire copia tal cual el texto de lo que no se ha tocado
+        parts = [f"  {json.dumps(oid, ensure_ascii=False)}: {ordinances.fragment(oid)}" for oid in ordinances]
+    else:
+        parts = [
+            f"  {json.dumps(oid, ensure_ascii=False)}: {_ordinance_fragment(ord_obj)}"
+            for oid, ord_obj in ordinances.items()
+        ]
+    return "{\n" + ",\n".join(parts) + "\n}"
+
+
+def _effect_type_for(ord_obj: Ordinance) -> str:
+    """Derived effect type, same value suggest_mechanics reports as 'type'."""
+    return get_effect_type(ord_obj.precept_id, get_intent_from_modifiers(ord_obj.modifiers))
+
+
+# ---------- Vista columnar del grimorio ----------
+
+def _column_values(ords: List[Ordinance]) -> Dict[str, np.ndarray]:
+    """
+    arcana_columns.COLUMNS values for `ords`. Complexity and effect type
+    come from evaluate_batch (long_duration = has Persistente, as in the
+    Grimorio); rows it cannot represent (repeated modifiers, rank <= 0,
+    unknown modifier ids) use the scalar functions, and an unknown
+    precept gets -1.
+    """
+    tables = cost_tables()
+    numen_bit = {nid: 1 << i for i, nid in enumerate(NUMEN)}
+    modifier_index = tables.modifier_index
+    n, m = len(ords), len(tables.modifier_ids)
+    precept = np.full(n, -1, dtype=np.int64)
+    numen_mask = np.zeros(n, dtype=np.int64)
+    modifier_mask = np.zeros(n, dtype=np.int64)
+    ranks = np.zeros((n, m), dtype=np.int64)
+    extras = np.zeros((n, m), dtype=np.int64)
+    exact = np.ones(n, dtype=bool)  # filas que evaluate_batch puntúa igual que las funciones escalares
+    for row, o in enumerate(ords):
+        precept[row] = tables.precept_index.get(o.precept_id, -1)
+        bits = 0
+        for nid in o.numen_ids:
+            bits |= numen_bit.get(nid, 0)
+        numen_mask[row] = bits
+        present = 0
+        for sel in o.modifiers:
+            col = modifier_index.get(sel.modifier_id)
+            if col is None or present >> col & 1 or sel.rank <= 0:
+                exact[row] = False
+                if col is None:
+                    continue
+            present |= 1 << col
+            ranks[row, col] = sel.rank
+            extras[row, col] = sel.extra_instances
+        modifier_mask[row] = present
+
+    complexity = np.full(n, -1, dtype=np.int64)
+    effect_type = np.full(n, -1, dtype=np.int64)
+    fast = exact & (precept >= 0)
+    if fast.any():
+        long_duration = ranks[fast, modifier_index["DURACION_PERSISTENTE"]] > 0
+        result = evaluate_batch(precept[fast], ranks[fast], extras[fast], long_duration)
+        complexity[fast] = result["complexity"]
+        effect_type[fast] = result["effect_type"]
+    for row in np.flatnonzero(~fast & (precept >= 0)):
+        o = ords[row]
+        effect_type[row] = EFFECT_TYPES.index(_effect_type_for(o))
+        try:
+            long_duration = any(sel.modifier_id == "DURACION_PERSISTENTE" for sel in o.modifiers)
+            complexity[row] = calculate_complexity(o.precept_id, o.numen_ids, o.modifiers, long_duration)
+        except KeyError:  # modificador desconocido
+            pass
+    return {
+        "tier": np.fromiter((o.tier for o in ords), dtype=np.int64, count=n),
+        "complexity": complexity,
+        "precept": precept,
+        "numen_mask": numen_mask,
+        "modifier_mask": modifier_mask,
+        "effect_type": effect_type,
+    }
+
+
+def _column_row(ord_obj: Ordinance) -> Dict[str, int]:
+    """_column_values() of one ordinance with the scalar functions (incremental append)."""
+    tables = cost_tables()
+    precept = tables.precept_index.get(ord_obj.precept_id, -1)
+    numen_mask = 0
+    for i, nid in enumerate(NUMEN):
+        if nid in ord_obj.numen_ids:
+            numen_mask |= 1 << i
+    modifier_mask = 0
+    for sel in ord_obj.modifiers:
+        col = tables.modifier_index.get(sel.modifier_id)
+        if col is not None:
+            modifier_mask |= 1 << col
+    complexity = effect_type = -1
+    if precept >= 0:
+        effect_type = EFFECT_TYPES.index(_effect_type_for(ord_obj))
+        long_duration = any(sel.modifier_id == "DURACION_PERSISTENTE" for sel in ord_obj.modifiers)
+        try:
+            complexity = calculate_complexity(ord_obj.precept_id, ord_obj.numen_ids, ord_obj.modifiers, long_duration)
+        except KeyError:  # modificador desconocido
+            pass
+    return {
+        "tier": ord_obj.tier,
+        "complexity": complexity,
+        "precept": precept,
+        "numen_mask": numen_mask,
+        "modifier_mask": modifier_mask,
+        "effect_type": effect_type,
+    }
+
+
+def grimoire_columns(ordinances: Dict[str, Ordinance]) -> arcana_columns.ColumnStore:
+    """
+    Build an arcana_columns.ColumnStore from load_ordinances() output, in
+    the grimoire's order. Grimoire.columns() caches one per grimoire; a
+    LazyGrimoire is read from its index (LazyGrimoire.column_sources).
+    Ids and rows come from one copy of the items, so an insert by another
+    session meanwhile cannot misalign them.
+    """
+    if isinstance(ordinances, LazyGrimoire):
+        ids, ords = ordinances.column_sources()
+    else:
+        items = list(ordinances.items())
+        ids, ords = [oid for oid, _ in items], [o for _, o in items]
+    store = arcana_columns.ColumnStore(capacity=max(1024, len(ords)))
+    store.extend(ids, [o.name for o in ords], _column_values(ords))
+    return store
+
+
+def _ensure_sqlite_db() -> None:
+    """Create the SQLite schema, migrating the legacy JSON DB the first time."""
+    if os.path.exists(DB_PATH):
+        arcana_sqlite.init_db(DB_PATH)
+        return
+    with _db_lock():  # que solo una sesión haga la migración
+        is_new = not os.path.exists(DB_PATH)
+        arcana_sqlite.init_db(DB_PATH)
+        if is_new and os.path.exists(LEGACY_JSON_PATH):
+            n = migrate_json_to_sqlite(LEGACY_JSON_PATH, DB_PATH)
+            print(f"✓ Migrated {n} ordinances from {LEGACY_JSON_PATH} to {DB_PATH}")
+
+
+def migrate_json_to_sqlite(json_path: str, sqlite_path: str) -> int:
+    """One-shot migration of a JSON grimoire into a SQLite database."""
+    with open(json_path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    arcana_sqlite.init_db(sqlite_path)
+    return arcana_sqlite.upsert_records(
+        sqlite_path,
+        (
+            (data, _effect_type_for(_ordinance_from_dict(data)))
+            for data in raw.values()
+        ),
+    )
+
+
+def _ensure_shards() -> None:
+    """Split the legacy JSON DB into shards the first time sharded mode is used."""
+    if os.path.exists(arcana_shards.manifest_path(SHARD_DIR)) or not os.path.exists(LEGACY_JSON_PATH):
+        return
+    with _db_lock():  # que solo una sesión haga la migración
+        if not os.path.exists(arcana_shards.manifest_path(SHARD_DIR)):
+            n = arcana_shards.migrate_json(LEGACY_JSON_PATH, SHARD_DIR)
+            print(f"✓ Split {n} ordinances from {LEGACY_JSON_PATH} into shards in {SHARD_DIR}")
+
+
+def load_ordinances(precept_ids: List[str] | None = None) -> Grimoire:
+    """
+    Load the last snapshot (DB_PATH) and replay the journal on top of it.
+    The journal is replayed whenever it exists, so switching JOURNAL_MODE
+    off never hides records that were appended while it was on.
+    In SQLITE_MODE nothing is read: the result is a SqliteGrimoire over the
+    database.
+    In SHARD_MODE only the shards of `precept_ids` are read (all if None).
+    The result is a Grimoire, so the canonical-key index is built here once.
+    With LAZY_LOAD the JSON snapshot is only indexed (see LazyGrimoire) and
+    records are parsed when accessed; a snapshot the index cannot read is
+    loaded eagerly.
+    """
+    ordinances = Grimoire()
+    # Se lee antes que los datos: si alguien escribe entre medias, como mucho
+    # haremos un merge innecesario, nunca sobrescribiremos datos nuevos.
+    ordinances.version = _read_db_version()
+    if SQLITE_MODE:
+        _ensure_sqlite_db()
+        grimoire = SqliteGrimoire(DB_PATH)
+        grimoire.version = ordinances.version
+        return grimoire
+    if SHARD_MODE:
+        _ensure_shards()
+        for data in arcana_shards.load_records(SHARD_DIR, precept_ids):
+            ordinances[data["id"]] = _ordinance_from_dict(data)
+            _SHARD_OF[data["id"]] = arcana_shards.shard_name(data)
+        return ordinances
+    index = arcana_lazy.scan_snapshot(DB_PATH) if LAZY_LOAD and os.path.exists(DB_PATH) else None
+    if index is not None:
+        lazy = LazyGrimoire(index)
+        lazy.version = ordinances.version
+        ordinances = lazy
+    elif os.path.exists(DB_PATH):
+        with open(DB_PATH, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        for oid, data in raw.items():
+            ordinances[oid] = _ordinance_from_dict(data)
+    _replay_journal(ordinances)
     return ordinances
 
+
+def _replay_journal(ordinances: Dict[str, Ordinance]) -> int:
+    """Apply every journal record to `ordinances` in order. Returns the count."""
+    global _journal_records
+    count = 0
+    if os.path.exists(JOURNAL_PATH):
+        with open(JOURNAL_PATH, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Línea a medio escribir (crash durante el append): la ignoramos
+                    print(f"⚠️  Skipping corrupt journal line in {JOURNAL_PATH}")
+                    continue
+                if record.get("op") == "put":
+                    data = record["data"]
+                    ordinances[data["id"]] = _ordinance_from_dict(data)
+                    count += 1
+    _journal_records = count
+    return count
+
+
+def _append_journal(ordinances: Dict[str, Ordinance], changed_ids) -> None:
+    """Append one compact line per changed ordinance. Cost is O(len(changed_ids))."""
+    global _journal_records
+    lines = []
+    for oid in changed_ids:
+        record = {"op": "put", "data": ordinances[oid].to_dict()}
+        lines.append(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+    if not lines:
+        return
+    with open(JOURNAL_PATH, "a", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    _journal_records += len(lines)
+
+
+def _fsync_dir(dir_name: str) -> None:
+    try:
+        fd = os.open(dir_name, os.O_RDONLY)
+    except OSError:
+        return  # p.ej. Windows
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _atomic_write_text(path: str, text: str) -> None:
+    """
+    Crash-safe write: temp file in the same directory, fsync, rename over
+    `path`, fsync the directory. Readers see the old or the new file, never
+    a truncated one.
+    """
+    dir_name = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=dir_name, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_dir(dir_name)
+
+
+def _atomic_write_json(path: str, raw: Any) -> None:
+    _atomic_write_text(path, json.dumps(raw, ensure_ascii=False, indent=2))
+
+
+# ---------- Concurrencia: lock + versión ----------
+
+_DB_THREAD_LOCK = threading.RLock()
+_db_lock_depth = 0
+_db_lock_fd: int | None = None
+
+
+@contextmanager
+def _db_lock():
+    """
+    Exclusive, re-entrant write lock: a thread lock for the Streamlit
+    sessions of this process plus an flock on LOCK_PATH for other processes.
+    """
+    global _db_lock_depth, _db_lock_fd
+    with _DB_THREAD_LOCK:
+        if _db_lock_depth == 0 and fcntl is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(LOCK_PATH)), exist_ok=True)
+            _db_lock_fd = os.open(LOCK_PATH, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(_db_lock_fd, fcntl.LOCK_EX)
+        _db_lock_depth += 1
+        try:
+            yield
+        finally:
+            _db_lock_depth -= 1
+            if _db_lock_depth == 0 and _db_lock_fd is not None:
+                fcntl.flock(_db_lock_fd, fcntl.LOCK_UN)
+                os.close(_db_lock_fd)
+                _db_lock_fd = None
+
+
+def _read_db_version() -> int:
+    try:
+        with open(VERSION_PATH, "r", encoding="utf-8") as f:
+            return int(f.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def _bump_db_version() -> int:
+    """Increment the on-disk DB version (caller holds _db_lock)."""
+    version = _read_db_version() + 1
+    _atomic_write_json(VERSION_PATH, version)
+    return version
+
+
+def _merge_from_disk(
+    ordinances: Grimoire,
+    changed_ids: List[str] | None,
+) -> List[str] | None:
+    """
+    `ordinances` is stale (someone else saved since it was loaded): pull the
+    records written by others into it instead of clobbering them.
+
+    Ours win for `changed_ids` (for every id we hold if None). A new
+    ordinance of ours whose id was taken meanwhile by a different one is
+    renumbered; one whose canonical_key was saved meanwhile is dropped.
+    A SqliteGrimoire already reads the database, so only the ordinances it
+    holds are checked against it (same rules) and nothing is pulled in.
+    Returns the updated changed_ids. Caller holds _db_lock.
+    """
+    disk_version = _read_db_version()
+    sqlite = isinstance(ordinances, SqliteGrimoire)
+    if sqlite:
+        ordinances.clear_cache()
+        fresh: Grimoire = SqliteGrimoire(DB_PATH)
+        mine = ordinances.held_ids() if changed_ids is None else list(changed_ids)
+    else:
+        fresh = load_ordinances()
+        mine = list(ordinances.keys()) if changed_ids is None else list(changed_ids)
+
+    next_num = max(Grimoire._id_number(fresh.next_id()), Grimoire._id_number(ordinances.next_id()))
+    kept: List[str] = []
+    for oid in mine:
+        ord_obj = ordinances.get(oid)
+        if ord_obj is None:
+            if sqlite:
+                kept.append(oid)  # borrada: también se borra de la base de datos
+            continue
+        theirs = fresh.get(oid)
+        if theirs is None or theirs.canonical_key != ord_obj.canonical_key:
+            existing = fresh.find_by_canonical_key(ord_obj.canonical_key)
+            if existing is not None:
+                # Otra sesión ya guardó esta misma ordenanza
+                if sqlite:
+                    ordinances.release([oid])
+                else:
+                    del ordinances[oid]
+                print(f"🔀 {oid} already saved by another writer as {existing.id}")
+                continue
+        if theirs is not None and theirs.canonical_key != ord_obj.canonical_key:
+            new_id = f"ORD_{next_num:06d}"
+            next_num += 1
+            if sqlite:
+                ordinances.release([oid])  # el id en la base de datos es de la otra
+            else:
+                del ordinances[oid]
+            ord_obj.id = new_id
+            ordinances[new_id] = ord_obj
+            print(f"🔀 {oid} was taken by another writer; saved as {new_id}")
+            oid = new_id
+        kept.append(oid)
+
+    if sqlite:
+        ordinances.version = disk_version
+        return None if changed_ids is None else kept
+
+    keep = set(kept)
+    lazy = isinstance(ordinances, LazyGrimoire) and isinstance(fresh, LazyGrimoire)
+    for oid in fresh:
+        if oid in keep:
+            continue
+        if lazy:
+            # Mismo texto en los dos snapshots: no hace falta materializarla
+            mine = ordinances.snapshot_bytes(oid)
+            if mine is not None and mine == fresh.snapshot_bytes(oid):
+                continue
+        ordinances[oid] = fresh[oid]
+    ordinances.version = disk_version
+    return None if changed_ids is None else kept
+
+
+def _write_snapshot(text: str) -> None:
+    """Atomically rewrite DB_PATH (see _grimoire_json) and drop the (now folded-in) journal."""
+    global _journal_records
+    _atomic_write_text(DB_PATH, text)
+    if os.path.exists(JOURNAL_PATH):
+        os.remove(JOURNAL_PATH)
+    _journal_records = 0
+
+
+def compact_journal(ordinances: Dict[str, Ordinance] | None = None) -> None:
+    """
+    Fold the journal back into the snapshot.
+    If `ordinances` is None the current state is loaded from disk first.
+    """
+    if ordinances is None:
+        ordinances = load_ordinances()
+    print(f"🗜️  Compacting journal ({_journal_records} records) into {DB_PATH}")
+    _write_snapshot(_grimoire_json(ordinances))
+
+
+def _collect_changed_shards(
+    ordinances: Dict[str, Ordinance],
+    changed_ids: List[str] | None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Full content ({oid: record}) of every shard touched by `changed_ids`:
+    the shard of each one's precept and the shard it was written to before
+    (_SHARD_OF), which differs when the precept changed or the ordinance was
+    deleted. With changed_ids=None every shard, including the ones left
+    empty (write_shards removes them).
+    """
+    if changed_ids is None:
+        names = None
+        shards: Dict[str, Dict[str, Any]] = {
+            name: {} for name in arcana_shards.load_manifest(SHARD_DIR)["shards"]
+        }
+    else:
+        names = {ordinances[oid].precept_id for oid in changed_ids if oid in ordinances}
+        names.update(_SHARD_OF[oid] for oid in changed_ids if oid in _SHARD_OF)
+        shards = {name: {} for name in names}
+    for oid, ord_obj in ordinances.items():
+        if names is None or ord_obj.precept_id in names:
+            shards.setdefault(ord_obj.precept_id, {})[oid] = ord_obj.to_dict()
+    return shards
+
+
 def save_ordinances(
     ordinances: Dict[str, Ordinance], 
     make_backup: bool = False,
-    commit_to_repo: bool = True
+    commit_to_repo: bool = True,
+    changed_ids: List[str] | None = None,
 ) -> None:
     """
     Save ordinances locally and optionally commit to GitHub repo.
+    The commit is only queued here; see get_sync_worker().
+
+    In journal mode, passing `changed_ids` appends only those records to the
+    journal (O(1) per save); the snapshot is rewritten every
+    JOURNAL_COMPACT_EVERY records. Without `changed_ids` (or outside journal
+    mode) the whole snapshot is rewritten as before.
+    In SQLITE_MODE `changed_ids` (or every ordinance) is upserted in one
+    transaction. In SHARD_MODE only the shards holding `changed_ids` (all
+    of them if None) are rewritten, backed up and committed.
+
+    Writes are atomic and serialized by _db_lock() across threads and
+    processes. If `ordinances` is a Grimoire loaded before somebody else's
+    save (its version is behind the on-disk one), the other writer's
+    records are merged in first (see _merge_from_disk), so concurrent
+    sessions never lose each other's ordinances.
+
+    If the local write fails the error is raised after logging it; no
+    backup is written and no GitHub sync is queued.
     """
     print(f"🔍 save_ordinances called with {len(ordinances)} ordinances")
     
-    raw: Dict[str, Any] = {oid: asdict(ord_obj) for oid, ord_obj in ordinances.items()}
-    
-    # Write main DB locally (ephemeral)
-    print(f"💾 Saving to local DB_PATH: {DB_PATH}")
+    repo_paths: List[str] = []
+    # El llamador dice que cambiaron: no fiarse de fragmentos cacheados
+    for oid in changed_ids or ():
+        if oid in ordinances:
+            ordinances[oid].mark_dirty()
+    if isinstance(ordinances, Grimoire):
+        ordinances.refresh_columns(changed_ids)
+
     try:
-        with open(DB_PATH, "w", encoding="utf-8") as f:
-            json.dump(raw, f, ensure_ascii=False, indent=2)
+        with _db_lock():
+            if isinstance(ordinances, Grimoire) and ordinances.version != _read_db_version():
+                print("🔀 Grimoire is stale, merging changes from other writers")
+                changed_ids = _merge_from_disk(ordinances, changed_ids)
+            repo_paths = _write_ordinances(ordinances, changed_ids)
+            version = _bump_db_version()
+            if isinstance(ordinances, Grimoire):
+                ordinances.version = version
+            # Aún con el lock: fuera, otro proceso podría escribir antes del
+            # stat() y su firma pasaría por la nuestra
+            _refresh_cache_signature(ordinances)
         print(f"✓ Local save successful")
     except Exception as e:
         print(f"✗ Local save failed: {e}")
-    
+        # Sin guardado local no hay nada que respaldar ni que subir al repo
+        raise
+
     # Write timestamped backup (optional)
     if make_backup:
         try:
-            backup_path = _write_backup_snapshot(raw)
+            with _db_lock():  # el BackupStore no es thread-safe
+                backup_path = _write_backup_snapshot(ordinances, changed_ids)
             print(f"✓ Backup created: {backup_path}")
         except Exception as e:
             print(f"⚠️  Backup failed: {e}")
     
-    # Commit to GitHub repo
+    # Commit to GitHub repo (en segundo plano, varios guardados = un commit)
     if commit_to_repo:
-        print(f"🚀 Attempting to commit to GitHub repo...")
-        
         if not GITHUB_TOKEN:
             print("✗ GITHUB_TOKEN not found - skipping repo commit")
             return
-        
+        get_sync_worker().request_sync(repo_paths)
+        print(f"🕒 GitHub sync queued (debounce {SYNC_DEBOUNCE_SECONDS:.0f}s)")
+
+
+def _write_ordinances(
+    ordinances: Dict[str, Ordinance],
+    changed_ids: List[str] | None,
+) -> List[str]:
+    """Local write for the active storage mode. Returns the repo paths touched."""
+    repo_paths: List[str] = []
+    if SQLITE_MODE:
+        if changed_ids is None:
+            items, deleted = ordinances.items(), []
+            print(f"💾 Upserting every ordinance into SQLite DB: {DB_PATH}")
+        else:
+            items = [(oid, ordinances[oid]) for oid in changed_ids if oid in ordinances]
+            deleted = [oid for oid in changed_ids if oid not in ordinances]
+            print(f"💾 Upserting {len(items)} ordinance(s) into SQLite DB: {DB_PATH}")
+        arcana_sqlite.init_db(DB_PATH)
+        arcana_sqlite.upsert_records(
+            DB_PATH,
+            ((ord_obj.to_dict(), _effect_type_for(ord_obj)) for _, ord_obj in items),
+        )
+        if deleted:
+            arcana_sqlite.delete_records(DB_PATH, deleted)
+        if isinstance(ordinances, SqliteGrimoire):
+            ordinances.mark_stored(changed_ids)
+    elif SHARD_MODE:
+        changed_shards = _collect_changed_shards(ordinances, changed_ids)
+        print(f"💾 Rewriting {len(changed_shards)} shard(s) in {SHARD_DIR}")
+        touched = arcana_shards.write_shards(SHARD_DIR, changed_shards)
+        if changed_ids is None:
+            _SHARD_OF.clear()
+        for oid in changed_ids or ():
+            _SHARD_OF.pop(oid, None)  # borradas: ya no están en ningún shard
+        for name, raw in changed_shards.items():
+            _SHARD_OF.update(dict.fromkeys(raw, name))
+        repo_paths = [f"{SHARD_REPO_DIR}/{name}" for name in touched]
+    elif JOURNAL_MODE and changed_ids is not None:
+        print(f"📝 Appending {len(changed_ids)} record(s) to journal: {JOURNAL_PATH}")
+        _append_journal(ordinances, changed_ids)
+        if _journal_records >= JOURNAL_COMPACT_EVERY:
+            compact_journal(ordinances)
+    else:
+        # Write main DB locally (ephemeral)
+        print(f"💾 Saving to local DB_PATH: {DB_PATH}")
+        _write_snapshot(_grimoire_json(ordinances))
+    return repo_paths
+
+
+def insert_ordinance(
+    ordinances: Grimoire,
+    ord_obj: Ordinance,
+    **save_kwargs: Any,
+) -> Ordinance:
+    """
+    Assign the next free id to `ord_obj`, add it and save, all under the
+    write lock, so two sessions can never hand out the same id.
+    If an ordinance with the same canonical_key already exists (maybe saved
+    by another session a moment ago) that one is returned and nothing is
+    written.
+    If the save fails the ordinance is taken out of `ordinances` again and
+    the error is raised.
+    """
+    with _db_lock():
+        if ordinances.version != _read_db_version():
+            _merge_from_disk(ordinances, [])
+        existing = ordinances.find_by_canonical_key(ord_obj.canonical_key)
+        if existing is not None:
+            return existing
+        ord_obj.id = ordinances.next_id()
+        ordinances[ord_obj.id] = ord_obj
         try:
-            _commit_to_github_repo(raw)
-            print("✓ Commit to GitHub successful!")
-        except Exception as e:
-            print(f"✗ Commit to GitHub failed: {e}")
-            import traceback
-            traceback.print_exc()
+            save_ordinances(ordinances, changed_ids=[ord_obj.id], **save_kwargs)
+        except Exception:
+            # No dejar en el grimorio compartido una ordenanza que no está en disco
+            ordinances.pop(ord_obj.id, None)
+            raise
+    return ord_obj
+
+
+IMPORT_BATCH_SIZE = 5000
+IMPORT_POLICIES = ("skip", "overwrite")
+
+
+def _validate_import_batch(batch: List[Dict[str, Any]], errors: List[str]) -> List[Ordinance]:
+    """
+    Validate a batch of raw records against PRECEPTS/NUMEN/MODIFIERS and
+    build the Ordinance objects, with the canonical key recomputed.
+    Invalid records are reported in `errors` and dropped.
+    """
+    valid: List[Ordinance] = []
+    for data in batch:
+        try:
+            ord_obj = Ordinance.from_dict(data)
+            if ord_obj.precept_id not in PRECEPTS:
+                raise ValueError(f"unknown precept {ord_obj.precept_id!r}")
+            bad = [nid for nid in ord_obj.numen_ids if nid not in NUMEN]
+            bad += [m.modifier_id for m in ord_obj.modifiers if m.modifier_id not in MODIFIERS]
+            if bad:
+                raise ValueError(f"unknown numen/modifier ids {bad}")
+            if any(m.rank < 1 or m.extra_instances < 0 for m in ord_obj.modifiers):
+                raise ValueError("invalid modifier rank/instances")
+        except (KeyError, TypeError, ValueError) as e:
+            errors.append(f"{data.get('id', '?') if isinstance(data, dict) else '?'}: {e}")
+            continue
+        ord_obj.canonical_key = build_canonical_key(ord_obj.precept_id, ord_obj.numen_ids, ord_obj.modifiers)
+        valid.append(ord_obj)
+    return valid
+
+
+def import_ordinances(
+    source: Any,
+    policy: str = "skip",
+    ordinances: Grimoire | None = None,
+    fmt: str | None = None,
+    make_backup: bool = True,
+    commit_to_repo: bool = True,
+) -> Dict[str, Any]:
+    """
+    Bulk-import an export file (JSON, NDJSON or CSV, optionally .gz; a path
+    or a binary file-like object) into `ordinances` (the process grimoire
+    if None), with one save and one repo commit at the end.
+
+    Records are validated in batches of IMPORT_BATCH_SIZE and their
+    canonical keys recomputed. An ordinance whose canonical key already
+    exists (in the grimoire or earlier in the file) is skipped with
+    policy="skip", or replaces the existing one, keeping its id, with
+    policy="overwrite". New ordinances get fresh consecutive ids.
+    Nothing reaches `ordinances` until the whole file has been read, so a
+    file that fails partway leaves it untouched; if the save fails the
+    import is undone before the error is raised.
+    Returns a report with the counts and the first validation errors.
+    """
+    if policy not in IMPORT_POLICIES:
+        raise ValueError(f"policy must be one of {IMPORT_POLICIES}")
+    if ordinances is None:
+        ordinances = load_ordinances_cached()
+
+    report: Dict[str, Any] = {"read": 0, "added": 0, "overwritten": 0, "duplicates": 0, "invalid": 0}
+    errors: List[str] = []
+    # Lo importado se acumula aquí y se aplica al final: si iter_records falla
+    # a mitad de fichero el grimorio compartido no queda a medias
+    pending: Dict[str, Ordinance] = {}
+    pending_keys: Dict[str, str] = {}  # canonical_key -> id, de lo ya leído del fichero
+    overwritten: List[str] = []  # ids ya existentes que se reemplazan
+
+    with _db_lock():
+        if ordinances.version != _read_db_version():
+            _merge_from_disk(ordinances, [])
+        next_num = Grimoire._id_number(ordinances.next_id())
+
+        batch: List[Dict[str, Any]] = []
+        records = arcana_export.iter_records(source, fmt)
+        while True:
+            batch.clear()
+            for data in records:
+                batch.append(data)
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    break
+            if not batch:
+                break
+            report["read"] += len(batch)
+            valid = _validate_import_batch(batch, errors)
+            report["invalid"] += len(batch) - len(valid)
+            # Una consulta por lote (en SQLITE_MODE) en vez de una por registro
+            known = ordinances.ids_by_canonical_keys(o.canonical_key for o in valid)
+
+            for ord_obj in valid:
+                oid = pending_keys.get(ord_obj.canonical_key)
+                if oid is None:
+                    oid = known.get(ord_obj.canonical_key)
+                    if oid is not None and policy == "overwrite":
+                        overwritten.append(oid)
+                if oid is None:
+                    oid = f"ORD_{next_num:06d}"
+                    next_num += 1
+                    report["added"] += 1
+                elif policy == "overwrite":
+                    report["overwritten"] += 1
+                else:
+                    report["duplicates"] += 1
+                    continue
+                ord_obj.id = oid
+                pending[oid] = ord_obj
+                pending_keys[ord_obj.canonical_key] = oid
+
+        print(
+            f"📥 Import: {report['read']} read, {report['added']} added, "
+            f"{report['overwritten']} overwritten, {report['duplicates']} duplicates, "
+            f"{report['invalid']} invalid"
+        )
+        if pending:
+            sqlite = isinstance(ordinances, SqliteGrimoire)
+            # Con SqliteGrimoire lo reemplazado sigue en la base de datos
+            replaced = {} if sqlite else {oid: ordinances[oid] for oid in overwritten}
+            ordinances.update(pending)
+            try:
+                save_ordinances(
+                    ordinances,
+                    make_backup=make_backup,
+                    commit_to_repo=commit_to_repo,
+                    changed_ids=list(pending),
+                )
+            except Exception:
+                # Igual que insert_ordinance: nada sin guardar en el grimorio compartido
+                if sqlite:
+                    ordinances.release(pending)
+                else:
+                    for oid in pending:
+                        if oid in replaced:
+                            ordinances[oid] = replaced[oid]
+                        else:
+                            del ordinances[oid]
+                raise
+
+    report["errors"] = errors[:50]
+    return report
+
+# ---------- Process-wide grimoire cache ----------
+
+# Streamlit re-ejecuta arcana_app.py en cada interacción, pero los módulos
+# importados viven lo que dura el proceso: aquí guardamos un único Grimoire
+# compartido por todas las sesiones.
+_GRIMOIRE_CACHE: Dict[str, Any] = {"signature": None, "grimoire": None}
+_GRIMOIRE_CACHE_LOCK = threading.Lock()
+
+
+def _db_files() -> List[str]:
+    """Files whose (inode, mtime, size) change whenever the DB changes."""
+    if SQLITE_MODE:
+        # En WAL las escrituras van al -wal hasta el checkpoint
+        return [DB_PATH, DB_PATH + "-wal"]
+    if SHARD_MODE:
+        # El manifest se reescribe (os.replace) en cada guardado
+        return [arcana_shards.manifest_path(SHARD_DIR)]
+    if JOURNAL_MODE:
+        return [DB_PATH, JOURNAL_PATH]
+    return [DB_PATH]
+
+
+def _db_signature() -> Tuple:
+    sig = []
+    for path in _db_files():
+        try:
+            st = os.stat(path)
+            sig.append((st.st_ino, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            sig.append(None)
+    return tuple(sig)
+
+
+def load_ordinances_cached() -> Grimoire:
+    """
+    Shared, process-level Grimoire. Each call only stat()s the DB file(s);
+    the grimoire is reloaded only when they were changed by someone else.
+    Saves of the cached object through save_ordinances update the cache in
+    place, so the app's own writes never trigger a reload.
+    """
+    sig = _db_signature()
+    cached = _GRIMOIRE_CACHE["grimoire"]
+    if cached is not None and _GRIMOIRE_CACHE["signature"] == sig:
+        return cached
+    with _GRIMOIRE_CACHE_LOCK:
+        # Otra sesión puede haber recargado mientras esperábamos el lock
+        sig = _db_signature()
+        if _GRIMOIRE_CACHE["grimoire"] is None or _GRIMOIRE_CACHE["signature"] != sig:
+            print(f"📖 Loading grimoire into process cache from {DB_PATH}")
+            _GRIMOIRE_CACHE["grimoire"] = load_ordinances()
+            _GRIMOIRE_CACHE["signature"] = sig
+        return _GRIMOIRE_CACHE["grimoire"]
+
+
+def _refresh_cache_signature(ordinances: Dict[str, Ordinance]) -> None:
+    """After saving the cached grimoire itself, it is still up to date."""
+    if ordinances is _GRIMOIRE_CACHE["grimoire"]:
+        _GRIMOIRE_CACHE["signature"] = _db_signature()
 
 
 def find_by_canonical_key(
     ordinances: Dict[str, Ordinance],
     canonical_key: str,
 ) -> Ordinance | None:
+    if isinstance(ordinances, Grimoire):
+        return ordinances.find_by_canonical_key(canonical_key)
+    if SQLITE_MODE:
+        # Índice sobre canonical_key en vez de recorrer todo el grimorio
+        data = arcana_sqlite.find_by_canonical_key(DB_PATH, canonical_key)
+        return _ordinance_from_dict(data) if data else None
     for ord_obj in ordinances.values():
         if ord_obj.canonical_key == canonical_key:
             return ord_obj
@@ -828,6 +3320,10 @@ def find_by_canonical_key(
 
 def next_ordinance_id(ordinances: Dict[str, Ordinance]) -> str:
     # simple incremental id
+    if isinstance(ordinances, Grimoire):
+        return ordinances.next_id()
+    if SQLITE_MODE:
+        return f"ORD_{arcana_sqlite.max_ordinance_number(DB_PATH) + 1:06d}"
     if not ordinances:
         return "ORD_000001"
     nums = [
@@ -838,71 +3334,384 @@ def next_ordinance_id(ordinances: Dict[str, Ordinance]) -> str:
     n = max(nums) + 1 if nums else 1
     return f"ORD_{n:06d}"
 
-def _write_backup_snapshot(raw: Dict[str, Any]) -> Path:
-    """Create timestamped backup"""
-    BACKUP_DIR.mkdir(parents=True, exist_ok=True)
-    ts = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%SZ")
-    backup_path = BACKUP_DIR / f"ordinances_db_{ts}.json"
-    with open(backup_path, "w", encoding="utf-8") as f:
-        json.dump(raw, f, ensure_ascii=False, indent=2)
-    return backup_path
-
-def _commit_to_github_repo(raw: Dict[str, Any]) -> None:
-    """Commit current ordinances to GitHub repository using GitHub API"""
-    
-    file_path = "ordinances_db.json"
-    
-    # Convert to JSON
-    json_content = json.dumps(raw, ensure_ascii=False, indent=2)
-    
-    # Encode to base64 (GitHub API requirement)
-    content_base64 = base64.b64encode(json_content.encode('utf-8')).decode('utf-8')
-    
-    # GitHub API endpoint
-    url = f"https://api.github.com/repos/{GITHUB_REPO}/contents/{file_path}"
-    
-    headers = {
-        "Authorization": f"token {GITHUB_TOKEN}",
-        "Accept": "application/vnd.github.v3+json"
+def query_ordinances(
+    ordinances: Dict[str, Ordinance] | None,
+    precept_ids: List[str] | None = None,
+    numen_ids: List[str] | None = None,
+    tiers: List[int] | None = None,
+    effect_type: str | None = None,
+    name_contains: str | None = None,
+) -> List[Ordinance]:
+    """
+    Grimorio filters. Empty filters match everything; numen_ids matches
+    ordinances with any of the given Numen. In SQLITE_MODE the predicates are
+    answered by the indexed tables instead of scanning `ordinances`.
+    With `ordinances=None` the grimoire is read from disk; in SHARD_MODE
+    only the shards of `precept_ids` are read. A Grimoire is filtered
+    through its columnar view (Grimoire.columns()).
+    """
+    if SQLITE_MODE:
+        return [
+            _ordinance_from_dict(data)
+            for data in arcana_sqlite.query_records(
+                DB_PATH,
+                precept_ids=precept_ids,
+                numen_ids=numen_ids,
+                tiers=tiers,
+                effect_type=effect_type,
+                name_contains=name_contains,
+            )
+        ]
+
+    if ordinances is None:
+        ordinances = load_ordinances(precept_ids if SHARD_MODE else None)
+
+    if isinstance(ordinances, Grimoire):
+        return [ordinances[oid] for oid in ordinances.columns().select_ids(
+            _columns_mask(ordinances.columns(), precept_ids, numen_ids, tiers, effect_type, name_contains)
+        )]
+
+    needle = name_contains.lower() if name_contains else None
+    result = []
+    for o in ordinances.values():
+        if numen_ids and not any(n in o.numen_ids for n in numen_ids):
+            continue
+        if precept_ids and o.precept_id not in precept_ids:
+            continue
+        if tiers and o.tier not in tiers:
+            continue
+        if needle and needle not in o.name.lower():
+            continue
+        if effect_type and _effect_type_for(o) != effect_type:
+            continue
+        result.append(o)
+    return result
+
+
+def query_ordinance_ids(
+    ordinances: Dict[str, Ordinance] | None,
+    precept_ids: List[str] | None = None,
+    numen_ids: List[str] | None = None,
+    tiers: List[int] | None = None,
+    effect_type: str | None = None,
+    name_contains: str | None = None,
+) -> List[str]:
+    """
+    Ids of the query_ordinances() results, sorted by (tier, name) as the
+    Grimorio lists them. For a Grimoire they come from its columnar view (in
+    SQLITE_MODE from an id-only query), so no record is materialized (the
+    Grimorio only reads one page of them).
+    """
+    filters = (precept_ids, numen_ids, tiers, effect_type, name_contains)
+    if SQLITE_MODE:
+        return arcana_sqlite.query_ids(DB_PATH, *filters)
+    if isinstance(ordinances, Grimoire):
+        store = ordinances.columns()
+        return store.select_ids(_columns_mask(store, *filters), order_by=("tier", "name"))
+    matches = query_ordinances(ordinances, *filters)
+    matches.sort(key=lambda o: (o.tier, o.name.lower()))
+    return [o.id for o in matches]
+
+
+def grimoire_facets(ordinances: Dict[str, Ordinance]) -> Tuple[List[str], List[str], List[int]]:
+    """
+    Sorted precept ids, Numen ids and tiers present in the grimoire (the
+    Grimorio filter options). A Grimoire answers from its columnar view, a
+    SqliteGrimoire from the database indexes.
+    """
+    if isinstance(ordinances, SqliteGrimoire):
+        return arcana_sqlite.facets(DB_PATH)
+    if not isinstance(ordinances, Grimoire):
+        return (
+            sorted({o.precept_id for o in ordinances.values()}),
+            sorted({nid for o in ordinances.values() for nid in o.numen_ids}),
+            sorted({o.tier for o in ordinances.values()}),
+        )
+    store = ordinances.columns()
+    alive = store.alive
+    precept_ids = cost_tables().precept_ids
+    precepts = np.unique(store.column("precept")[alive])
+    numen_bits = int(np.bitwise_or.reduce(store.column("numen_mask")[alive])) if alive.any() else 0
+    return (
+        sorted(precept_ids[i] for i in precepts if i >= 0),
+        sorted(nid for i, nid in enumerate(NUMEN) if numen_bits >> i & 1),
+        [int(tier) for tier in np.unique(store.column("tier")[alive])],
+    )
+
+
+def grimoire_distribution(
+    ordinances: Dict[str, Ordinance] | None,
+    precept_ids: List[str] | None = None,
+    numen_ids: List[str] | None = None,
+    tiers: List[int] | None = None,
+    effect_type: str | None = None,
+    name_contains: str | None = None,
+) -> Dict[Tuple[int, str], int]:
+    """
+    {(tier, effect_type): count} of the ordinances query_ordinances() would
+    return, as one bincount over the columnar view when `ordinances` is a
+    Grimoire, a GROUP BY in SQLITE_MODE (counted from the query results
+    otherwise).
+    """
+    filters = (precept_ids, numen_ids, tiers, effect_type, name_contains)
+    if SQLITE_MODE:
+        return arcana_sqlite.count_by_tier_effect(DB_PATH, *filters)
+    if not isinstance(ordinances, Grimoire):
+        counts: Dict[Tuple[int, str], int] = {}
+        for o in query_ordinances(ordinances, *filters):
+            key = (o.tier, _effect_type_for(o))
+            counts[key] = counts.get(key, 0) + 1
+        return counts
+    store = ordinances.columns()
+    table = store.crosstab("tier", "effect_type", _columns_mask(store, *filters))
+    # Claves int de Python, como en la rama de SQLite (np.int64 no va a json)
+    return {
+        (int(tier), EFFECT_TYPES[effect]): int(table[tier, effect])
+        for tier, effect in zip(*np.nonzero(table))
     }
+
+
+def _columns_mask(
+    store: arcana_columns.ColumnStore,
+    precept_ids: List[str] | None,
+    numen_ids: List[str] | None,
+    tiers: List[int] | None,
+    effect_type: str | None,
+    name_contains: str | None,
+) -> np.ndarray:
+    """query_ordinances() filters as a ColumnStore row mask."""
+    tables = cost_tables()
+    precepts = [tables.precept_index[pid] for pid in precept_ids or () if pid in tables.precept_index]
+    numen_bits = 0
+    for i, nid in enumerate(NUMEN):
+        if nid in (numen_ids or ()):
+            numen_bits |= 1 << i
+    # Filtros dados pero sin ningún id conocido: no casan con nada
+    if (precept_ids and not precepts) or (numen_ids and not numen_bits) or (
+        effect_type and effect_type not in EFFECT_TYPES
+    ):
+        return np.zeros(store.size, dtype=bool)
+    return store.mask(
+        precepts=precepts,
+        numen_mask=numen_bits,
+        tiers=tiers,
+        effect_type=EFFECT_TYPES.index(effect_type) if effect_type else None,
+        name_contains=name_contains,
+    )
+
+
+_BACKUP_STORE: arcana_backups.BackupStore | None = None
+
+
+def _write_backup_snapshot(
+    ordinances: Dict[str, Ordinance],
+    changed_ids: List[str] | None = None,
+) -> Path:
+    """
+    Content-addressed backup: every ordinance is stored once by hash and the
+    snapshot only records what changed since the previous one. Restore with
+    `python arcana_backups.py restore <when>`.
+    """
+    global _BACKUP_STORE
+    if _BACKUP_STORE is None:
+        _BACKUP_STORE = arcana_backups.BackupStore(
+            BACKUP_DIR, keep_last=BACKUP_KEEP_LAST, keep_daily=BACKUP_KEEP_DAILY
+        )
+    if isinstance(ordinances, SqliteGrimoire) and changed_ids is None:
+        ordinances = ordinances.subset(ordinances.keys())
+    return _BACKUP_STORE.write_snapshot(
+        ordinances.keys(),
+        lambda oid: ordinances[oid].to_dict(),
+        changed_ids,
+    )
+
+# ---------- GitHub sync ----------
+
+_SYNC_WORKER: arcana_sync.GitHubSyncWorker | None = None
+_SYNC_WORKER_LOCK = threading.Lock()
+_GITHUB_CLIENT: arcana_github.GitHubContentsClient | None = None
+
+
+def get_sync_worker() -> arcana_sync.GitHubSyncWorker | None:
+    """Process-wide sync worker (None when no GitHub token is configured)."""
+    global _SYNC_WORKER
+    if not GITHUB_TOKEN:
+        return None
+    with _SYNC_WORKER_LOCK:
+        if _SYNC_WORKER is None:
+            _SYNC_WORKER = arcana_sync.GitHubSyncWorker(
+                commit_fn=_sync_repo_now,
+                pending_path=SYNC_PENDING_PATH,
+                debounce_seconds=SYNC_DEBOUNCE_SECONDS,
+                max_delay_seconds=SYNC_MAX_DELAY_SECONDS,
+            )
+        return _SYNC_WORKER
+
+
+def sync_status() -> Dict[str, Any]:
+    """Non-blocking status of the background GitHub sync, for the UI."""
+    worker = get_sync_worker()
+    if worker is None:
+        return {"state": "disabled", "pending": 0, "last_success": None, "last_error": None}
+    return worker.status()
+
+
+@contextmanager
+def _repo_payload_file():
+    """
+    Path of a file holding the current grimoire in the repo's JSON format.
+    In plain JSON mode that is DB_PATH itself; otherwise a temporary export
+    is written (and removed afterwards).
+    """
+    if not SQLITE_MODE and not os.path.exists(JOURNAL_PATH) and os.path.exists(DB_PATH):
+        # El snapshot ya tiene exactamente el formato del repo
+        yield DB_PATH
+        return
+    ordinances = load_ordinances()
+    fd, tmp_path = tempfile.mkstemp(suffix=".json", prefix=".arcana_sync_")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(_grimoire_json(ordinances))
+        yield tmp_path
+    finally:
+        os.remove(tmp_path)
+
+
+def _sync_repo_now(paths: Set[str]) -> None:
+    """
+    Commit whatever is on disk right now (called by the sync worker).
+    In SHARD_MODE only the shard files in `paths` (all of them if empty) and
+    the manifest go into the commit.
+    """
+    if SHARD_MODE:
+        _commit_shards_to_github_repo(paths)
+        return
+    with _repo_payload_file() as local_path:
+        _commit_to_github_repo(local_path)
+
+
+def _github_client() -> arcana_github.GitHubContentsClient:
+    """Shared client: one pooled session and SHA cache per process."""
+    global _GITHUB_CLIENT
+    if _GITHUB_CLIENT is None:
+        _GITHUB_CLIENT = arcana_github.GitHubContentsClient(
+            token=GITHUB_TOKEN,
+            repo=GITHUB_REPO,
+            branch=GITHUB_BRANCH,
+            api_url=GITHUB_API_URL,
+        )
+    return _GITHUB_CLIENT
+
+
+def _commit_to_github_repo(local_path: str) -> None:
+    """
+    Commit the grimoire file at `local_path` to the GitHub repository.
+    Files over the contents-API limit go through the Git Data API with a
+    streamed base64 upload, so the DB is never held in memory as a whole.
+    """
     
-    # Get current file SHA (needed to update existing file)
-    print(f"   Checking if file exists...")
-    response = requests.get(url, headers=headers)
-    
-    sha = None
-    if response.status_code == 200:
-        sha = response.json()["sha"]
-        print(f"   File exists, SHA: {sha[:7]}...")
-    else:
-        print(f"   File doesn't exist, will create new")
+    file_path = "ordinances_db.json"
     
-    # Prepare commit data
     commit_message = f"💾 Auto-save ordinances from HF Space [{datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')}]"
     
-    data = {
-        "message": commit_message,
-        "content": content_base64,
-        "branch": GITHUB_BRANCH
-    }
-    
-    if sha:
-        data["sha"] = sha  # Required to update existing file
-    
-    # Commit to GitHub
     print(f"   Committing to GitHub...")
-    response = requests.put(url, headers=headers, json=data)
-    
-    if response.status_code in [200, 201]:
-        print(f"   ✓ Successfully committed to GitHub!")
-        result = response.json()
-        print(f"   Commit URL: {result['commit']['html_url']}")
-    else:
-        print(f"   ✗ GitHub API error: {response.status_code}")
-        print(f"   Response: {response.text}")
-        raise Exception(f"GitHub commit failed: {response.status_code} - {response.text}")
+    try:
+        commit = _github_client().commit_file(file_path, local_path, commit_message)
+    except arcana_github.GitHubError as e:
+        print(f"   ✗ GitHub API error: {e.status_code}")
+        print(f"   Response: {e.text}")
+        raise
+    print(f"   ✓ Successfully committed to GitHub!")
+    print(f"   Commit URL: {commit['html_url']}")
+
+def _commit_shards_to_github_repo(paths: Set[str]) -> None:
+    """Commit the changed shard files (and the manifest) in a single commit."""
+    if not paths:
+        manifest = arcana_shards.load_manifest(SHARD_DIR)
+        paths = {f"{SHARD_REPO_DIR}/{e['file']}" for e in manifest["shards"].values()}
+        paths.add(f"{SHARD_REPO_DIR}/{arcana_shards.MANIFEST_NAME}")
+
+    files: Dict[str, str | None] = {}
+    for repo_path in sorted(paths):
+        local_path = os.path.join(SHARD_DIR, repo_path.split("/", 1)[1])
+        # Un shard que se ha quedado vacío se borra también en el repo
+        files[repo_path] = local_path if os.path.exists(local_path) else None
+
+    commit_message = f"💾 Auto-save {len(files)} grimoire shard(s) from HF Space [{datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')}]"
+    print(f"   Committing {len(files)} shard file(s) to GitHub...")
+    commit = _github_client().commit_files_git_data(files, commit_message)
+    print(f"   ✓ Successfully committed to GitHub!")
+    print(f"   Commit URL: {commit['html_url']}")
 
 def export_ordinances_json_bytes(ordinances: Dict[str, Ordinance]) -> bytes:
     """Export ordinances as JSON bytes"""
-    raw: Dict[str, Any] = {oid: asdict(ord_obj) for oid, ord_obj in ordinances.items()}
-    return json.dumps(raw, ensure_ascii=False, indent=2).encode("utf-8")
+    return _grimoire_json(ordinances).encode("utf-8")
+
+
+# ---------- Exportación en streaming ----------
+
+EXPORT_FORMATS = ["json", "ndjson", "csv", "json.gz", "ndjson.gz", "csv.gz"]
+EXPORT_CACHE_SIZE = 4
+
+_EXPORT_CACHE: Dict[Tuple, bytes] = {}
+_EXPORT_CACHE_LOCK = threading.Lock()
+
+
+def _iter_json_export(ordinances: Dict[str, Ordinance], ids: List[str]) -> Iterator[str]:
+    # Mismo texto que export_ordinances_json_bytes, pero por trozos
+    if not ids:
+        yield "{}"
+        return
+    yield "{\n"
+    for n, oid in enumerate(ids):
+        sep = ",\n" if n else ""
+        fragment = ordinances.fragment(oid) if isinstance(ordinances, Grimoire) else _ordinance_fragment(ordinances[oid])
+        yield f"{sep}  {json.dumps(oid, ensure_ascii=False)}: {fragment}"
+    yield "\n}"
+
+
+def iter_export(
+    ordinances: Dict[str, Ordinance],
+    fmt: str = "json",
+    ids: List[str] | None = None,
+) -> Iterator[bytes]:
+    """
+    Stream the grimoire (or only `ids`, in that order) as byte chunks.
+    fmt is one of EXPORT_FORMATS; see arcana_export for the layouts.
+    """
+    base, gz = arcana_export.split_format(fmt)
+    ids = list(ordinances.keys()) if ids is None else ids
+    if isinstance(ordinances, SqliteGrimoire):
+        # Por lotes: una consulta por registro costaría una conexión cada uno
+        ordinances = ordinances.subset(ids)
+    if base == "json":
+        chunks = arcana_export.batched(_iter_json_export(ordinances, ids))
+    else:
+        records = (ordinances[oid].to_dict() for oid in ids)
+        chunks = arcana_export.iter_ndjson(records) if base == "ndjson" else arcana_export.iter_csv(records)
+    return arcana_export.gzip_chunks(chunks) if gz else chunks
+
+
+def export_ordinances_bytes(
+    ordinances: Dict[str, Ordinance],
+    fmt: str = "json",
+    ids: List[str] | None = None,
+) -> bytes:
+    """
+    Whole export as bytes, cached by (DB version, format, ids): reruns that
+    ask for the same export again get it for free until the next save.
+    """
+    version = getattr(ordinances, "version", None)
+    if version is None:  # dict normal: sin versión no hay forma de invalidar
+        return b"".join(iter_export(ordinances, fmt, ids))
+    key = (id(ordinances), version, len(ordinances), fmt, None if ids is None else tuple(ids))
+    with _EXPORT_CACHE_LOCK:
+        data = _EXPORT_CACHE.get(key)
+    if data is not None:
+        return data
+    data = b"".join(iter_export(ordinances, fmt, ids))
+    with _EXPORT_CACHE_LOCK:
+        if len(_EXPORT_CACHE) >= EXPORT_CACHE_SIZE:
+            _EXPORT_CACHE.pop(next(iter(_EXPORT_CACHE)))
+        _EXPORT_CACHE[key] = data
+    return data
@@ -0,0 +1,206 @@
+# arcana_export.py
+#
+# Streaming writers for grimoire exports. Every writer is a generator of
+# byte chunks, so an export never needs the whole file in memory and can be
+# fed straight into a download, a file or gzip.
+#
+#   ndjson   one compact JSON record per line
+#   csv      one row per ordinance; modifiers encoded as MOD[:rN][:xN],...
+#   *.gz     any of the above, gzip-compressed on the fly
+#
+# iter_records() reads any of those files back (used by
+# arcana_core.import_ordinances).
+#
+# Like arcana_sqlite/arcana_shards it works on plain record dicts;
+# arcana_core.iter_export() adds the pretty JSON format and the Ordinance
+# objects.
+
+from __future__ import annotations
+from typing import Any, Dict, Iterable, Iterator, List, TextIO
+import csv
+import gzip
+import io
+import json
+import os
+import zlib
+
+
+CHUNK_BYTES = 64 * 1024
+
+CSV_COLUMNS = [
+    "id", "canonical_key", "name", "precept_id", "numen_ids",
+    "modifiers", "tier", "mechanical", "cost", "meta",
+]
+
+MIME_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def encode_modifiers(modifiers: Iterable[Dict[str, Any]]) -> str:
+    """[{"modifier_id": "X", "rank": 2, "extra_instances": 1}] -> "X:r2:x1" (as in canonical keys)."""
+    parts = []
+    for m in modifiers:
+        part = m["modifier_id"]
+        if m.get("rank", 1) != 1:
+            part += f":r{m['rank']}"
+        if m.get("extra_instances", 0) > 0:
+            part += f":x{m['extra_instances']}"
+        parts.append(part)
+    return ",".join(parts)
+
+
+def decode_modifiers(text: str) -> List[Dict[str, Any]]:
+    """Inverse of encode_modifiers."""
+    modifiers = []
+    for part in filter(None, text.split(",")):
+        modifier_id, *flags = part.split(":")
+        m = {"modifier_id": modifier_id, "rank": 1, "extra_instances": 0}
+        for flag in flags:
+            if flag.startswith("r"):
+                m["rank"] = int(flag[1:])
+            elif flag.startswith("x"):
+                m["extra_instances"] = int(flag[1:])
+        modifiers.append(m)
+    return modifiers
+
+
+def batched(pieces: Iterable[str]) -> Iterator[bytes]:
+    """Join small text pieces into ~CHUNK_BYTES byte chunks."""
+    buf: List[str] = []
+    size = 0
+    for piece in pieces:
+        buf.append(piece)
+        size += len(piece)
+        if size >= CHUNK_BYTES:
+            yield "".join(buf).encode("utf-8")
+            buf, size = [], 0
+    if buf:
+        yield "".join(buf).encode("utf-8")
+
+
+def iter_ndjson(records: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    return batched(
+        json.dumps(data, ensure_ascii=False, separators=(",", ":")) + "\n" for data in records
+    )
+
+
+def _csv_lines(records: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(CSV_COLUMNS)
+    for data in records:
+        writer.writerow([
+            data["id"],
+            data["canonical_key"],
+            data["name"],
+            data["precept_id"],
+            "+".join(data["numen_ids"]),
+            encode_modifiers(data["modifiers"]),
+            data["tier"],
+            json.dumps(data["mechanical"], ensure_ascii=False, separators=(",", ":")),
+            json.dumps(data["cost"], ensure_ascii=False, separators=(",", ":")),
+            json.dumps(data["meta"], ensure_ascii=False, separators=(",", ":")),
+        ])
+        yield out.getvalue()
+        out.seek(0)
+        out.truncate()
+    yield out.getvalue()
+
+
+def iter_csv(records: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    # BOM para que Excel abra los acentos bien
+    yield "\ufeff".encode("utf-8")
+    yield from batched(_csv_lines(records))
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """gzip-compress a stream of chunks without buffering it."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31 = cabecera gzip
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def split_format(fmt: str) -> tuple[str, bool]:
+    """'csv.gz' -> ('csv', True)."""
+    base, _, ext = fmt.partition(".")
+    if base not in MIME_TYPES or ext not in ("", "gz"):
+        raise ValueError(f"Unknown export format: {fmt}")
+    return base, ext == "gz"
+
+
+def mime_type(fmt: str) -> str:
+    base, gz = split_format(fmt)
+    return "application/gzip" if gz else MIME_TYPES[base]
+
+
+# ---------- Lectura (importación) ----------
+
+def _detect_format(name: str) -> tuple[str, bool]:
+    name = name.lower()
+    gz = name.endswith(".gz")
+    if gz:
+        name = name[:-3]
+    if name.endswith((".ndjson", ".jsonl")):
+        return "ndjson", gz
+    if name.endswith(".csv"):
+        return "csv", gz
+    return "json", gz
+
+
+def _records_from_json(f: TextIO) -> Iterator[Dict[str, Any]]:
+    # El JSON "bonito" es un único objeto: hay que leerlo entero
+    raw = json.load(f)
+    yield from (raw.values() if isinstance(raw, dict) else raw)
+
+
+def _records_from_ndjson(f: TextIO) -> Iterator[Dict[str, Any]]:
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def _records_from_csv(f: TextIO) -> Iterator[Dict[str, Any]]:
+    for row in csv.DictReader(f):
+        yield {
+            "id": row["id"],
+            "canonical_key": row.get("canonical_key", ""),
+            "name": row["name"],
+            "precept_id": row["precept_id"],
+            "numen_ids": [n for n in row["numen_ids"].split("+") if n],
+            "modifiers": decode_modifiers(row["modifiers"]),
+            "tier": int(row["tier"]),
+            "mechanical": json.loads(row["mechanical"] or "{}"),
+            "cost": json.loads(row["cost"] or "{}"),
+            "meta": json.loads(row["meta"] or "{}"),
+        }
+
+
+_READERS = {"json": _records_from_json, "ndjson": _records_from_ndjson, "csv": _records_from_csv}
+
+
+def iter_records(source: str | os.PathLike | Any, fmt: str | None = None) -> Iterator[Dict[str, Any]]:
+    """
+    Records from an export file: a path or a binary file-like object
+    (e.g. a Streamlit upload). The format comes from `fmt` ("csv.gz", ...)
+    or from the file name; gzip is also recognised by its magic bytes.
+    """
+    name = os.fspath(source) if isinstance(source, (str, os.PathLike)) else getattr(source, "name", "")
+    base, gz = split_format(fmt) if fmt else _detect_format(name)
+    f = open(source, "rb") if isinstance(source, (str, os.PathLike)) else source
+    try:
+        if not gz and hasattr(f, "peek"):
+            gz = f.peek(2)[:2] == b"\x1f\x8b"
+        binary = gzip.GzipFile(fileobj=f) if gz else f
+        # utf-8-sig: el CSV exportado lleva BOM
+        text = io.TextIOWrapper(binary, encoding="utf-8-sig", newline="" if base == "csv" else None)
+        yield from _READERS[base](text)
+    finally:
+        if f is not source:
+            f.close()
@@ -0,0 +1,344 @@
+# arcana_github.py
+#
+# Minimal GitHub storage client used to push the grimoire to the repo.
+# Keeps one pooled keep-alive session, remembers the blob SHA returned by
+# every write, and backs off politely when GitHub rate-limits us.
+
+from __future__ import annotations
+from typing import Any, Dict
+from requests.adapters import HTTPAdapter
+import requests
+import base64
+import random
+import time
+import os
+
+
+# El contents API rechaza ficheros de más de 1 MB (y el base64 engorda un 33%)
+CONTENTS_API_MAX_BYTES = 900_000
+
+
+class _Base64BlobBody:
+    """
+    File-like request body for POST /git/blobs:
+        {"encoding":"base64","content":"<base64 of the file>"}
+    The file is read and encoded in chunks while the request is being sent,
+    so memory stays bounded by CHUNK whatever the file size. The file is
+    opened once, so a concurrent os.replace() of the path does not change
+    what we upload.
+    """
+
+    CHUNK = 3 * 64 * 1024  # múltiplo de 3: los trozos de base64 se concatenan sin padding
+
+    PREFIX = b'{"encoding":"base64","content":"'
+    SUFFIX = b'"}'
+
+    def __init__(self, path: str):
+        self._f = open(path, "rb")
+        size = os.fstat(self._f.fileno()).st_size
+        self._len = len(self.PREFIX) + 4 * ((size + 2) // 3) + len(self.SUFFIX)
+        self.seek(0)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        # Solo rebobinar (requests/reintentos); suficiente para reenviar el cuerpo
+        if offset != 0 or whence != 0:
+            raise OSError("only seek(0) is supported")
+        self._f.seek(0)
+        self._stage = 0
+        self._buf = b""
+        return 0
+
+    def _next_piece(self) -> bytes:
+        if self._stage == 0:
+            self._stage = 1
+            return self.PREFIX
+        if self._stage == 1:
+            chunk = self._f.read(self.CHUNK)
+            if chunk:
+                return base64.b64encode(chunk)
+            self._stage = 2
+            return self.SUFFIX
+        return b""
+
+    def read(self, size: int = -1) -> bytes:
+        out = []
+        need = size if size is not None and size >= 0 else float("inf")
+        while need > 0:
+            if not self._buf:
+                self._buf = self._next_piece()
+                if not self._buf:
+                    break
+            piece = self._buf[:need] if need != float("inf") else self._buf
+            self._buf = self._buf[len(piece):]
+            out.append(piece)
+            need -= len(piece)
+        return b"".join(out)
+
+    def close(self) -> None:
+        self._f.close()
+
+
+class GitHubError(Exception):
+    """GitHub API answered with an unexpected status code."""
+
+    def __init__(self, status_code: int, text: str):
+        super().__init__(f"GitHub API error: {status_code} - {text}")
+        self.status_code = status_code
+        self.text = text
+
+
+class GitHubContentsClient:
+    """
+    Client for the contents and Git Data APIs of a single repo/branch.
+
+    - One `requests.Session` with a connection pool, so consecutive commits
+      reuse the TLS connection.
+    - The blob SHA of every path is cached (from GETs *and* from the PUT
+      response), so a save normally costs one PUT. If the cached SHA is
+      stale GitHub answers 409/422 and we refetch it once.
+    - GETs are conditional (If-None-Match with the last ETag); a 304 keeps
+      the cached SHA and does not count against the rate limit.
+    - 429/403 rate-limit answers and 5xx/connection errors are retried with
+      exponential backoff, honouring Retry-After and X-RateLimit-Reset.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        repo: str,
+        branch: str = "main",
+        api_url: str = "https://api.github.com",
+        pool_size: int = 4,
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        max_backoff: float = 60.0,
+        timeout: float = 30.0,
+    ):
+        self.repo = repo
+        self.branch = branch
+        self.api_url = api_url.rstrip("/")
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Authorization": f"token {token}",
+            "Accept": "application/vnd.github.v3+json",
+            "User-Agent": "arcana-dataviz",
+        })
+
+        self._sha: Dict[str, str | None] = {}
+        self._etag: Dict[str, str] = {}
+
+    # ---------- HTTP con reintentos ----------
+
+    def _retry_delay(self, response: requests.Response | None, attempt: int) -> float | None:
+        """Seconds to wait before retrying, or None if the answer is final."""
+        backoff = min(self.max_backoff, self.backoff_base * (2 ** attempt))
+        backoff *= 0.5 + random.random() / 2  # jitter
+
+        if response is None:  # error de conexión
+            return backoff
+
+        status = response.status_code
+        headers = response.headers
+        rate_limited = status == 429 or (
+            status == 403
+            and (headers.get("X-RateLimit-Remaining") == "0" or "Retry-After" in headers)
+        )
+        if rate_limited:
+            if "Retry-After" in headers:
+                try:
+                    return float(headers["Retry-After"])
+                except ValueError:
+                    pass
+            if headers.get("X-RateLimit-Remaining") == "0" and "X-RateLimit-Reset" in headers:
+                try:
+                    return max(0.0, float(headers["X-RateLimit-Reset"]) - time.time()) + 1.0
+                except ValueError:
+                    pass
+            return backoff
+        if status >= 500:
+            return backoff
+        return None
+
+    def _request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            if hasattr(kwargs.get("data"), "seek"):
+                kwargs["data"].seek(0)
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                response = None
+                error: Exception | None = e
+            else:
+                error = None
+
+            delay = self._retry_delay(response, attempt)
+            if delay is None:
+                return response
+            if attempt >= self.max_retries:
+                if response is None:
+                    raise error
+                return response
+            if delay > self.max_backoff * 10:
+                # Reset del rate limit demasiado lejos: mejor fallar y que el worker reintente
+                return response
+            print(f"   ⏳ GitHub {method} retry in {delay:.1f}s (attempt {attempt + 1})")
+            time.sleep(delay)
+            attempt += 1
+
+    # ---------- Contents API ----------
+
+    def _contents_url(self, path: str) -> str:
+        return f"{self.api_url}/repos/{self.repo}/contents/{path}"
+
+    def get_sha(self, path: str, refresh: bool = False) -> str | None:
+        """Blob SHA of `path` on the branch (None if the file does not exist)."""
+        if not refresh and path in self._sha:
+            return self._sha[path]
+
+        headers = {}
+        if path in self._etag:
+            headers["If-None-Match"] = self._etag[path]
+        response = self._request(
+            "GET", self._contents_url(path), params={"ref": self.branch}, headers=headers
+        )
+        if response.status_code == 304 and path in self._sha:
+            return self._sha[path]
+        if response.status_code == 200:
+            self._sha[path] = response.json()["sha"]
+            if "ETag" in response.headers:
+                self._etag[path] = response.headers["ETag"]
+            return self._sha[path]
+        if response.status_code == 404:
+            self._sha[path] = None
+            self._etag.pop(path, None)
+            return None
+        raise GitHubError(response.status_code, response.text)
+
+    def put_file(self, path: str, content: bytes, message: str) -> Dict[str, Any]:
+        """Create or update `path` with `content`. Returns the API response."""
+        body: Dict[str, Any] = {
+            "message": message,
+            "content": base64.b64encode(content).decode("ascii"),
+            "branch": self.branch,
+        }
+
+        for attempt in range(2):
+            sha = self.get_sha(path, refresh=attempt > 0)
+            if sha:
+                body["sha"] = sha
+            else:
+                body.pop("sha", None)
+
+            response = self._request("PUT", self._contents_url(path), json=body)
+            if response.status_code in (200, 201):
+                result = response.json()
+                self._sha[path] = result["content"]["sha"]
+                # El ETag anterior ya no describe el fichero
+                self._etag.pop(path, None)
+                return result
+            if response.status_code in (409, 422) and attempt == 0:
+                print(f"   SHA for {path} is stale, refetching...")
+                continue
+            raise GitHubError(response.status_code, response.text)
+
+        raise GitHubError(response.status_code, response.text)
+
+    # ---------- Git Data API (ficheros grandes / varios ficheros) ----------
+
+    def _git_url(self, suffix: str) -> str:
+        return f"{self.api_url}/repos/{self.repo}/git/{suffix}"
+
+    def _json_or_raise(self, response: requests.Response, ok=(200, 201)) -> Dict[str, Any]:
+        if response.status_code not in ok:
+            raise GitHubError(response.status_code, response.text)
+        return response.json()
+
+    def create_blob_from_file(self, local_path: str) -> str:
+        """Upload `local_path` as a git blob, streaming the base64. Returns its SHA."""
+        body = _Base64BlobBody(local_path)
+        try:
+            response = self._request(
+                "POST",
+                self._git_url("blobs"),
+                data=body,
+                headers={"Content-Type": "application/json"},
+            )
+        finally:
+            body.close()
+        return self._json_or_raise(response)["sha"]
+
+    def commit_files_git_data(self, files: Dict[str, str | None], message: str) -> Dict[str, Any]:
+        """
+        Commit several files in a single commit through the Git Data API:
+        blobs -> tree -> commit -> move the branch ref.
+        `files` maps repo path -> local file path (None deletes the path).
+        No size limit applies and only one chunk of each file is in memory
+        at a time.
+        """
+        blobs = {
+            path: self.create_blob_from_file(local) if local is not None else None
+            for path, local in files.items()
+        }
+
+        for attempt in range(3):
+            ref = self._json_or_raise(
+                self._request("GET", self._git_url(f"ref/heads/{self.branch}")), ok=(200,)
+            )
+            parent_sha = ref["object"]["sha"]
+            parent = self._json_or_raise(
+                self._request("GET", self._git_url(f"commits/{parent_sha}")), ok=(200,)
+            )
+            tree = self._json_or_raise(self._request("POST", self._git_url("trees"), json={
+                "base_tree": parent["tree"]["sha"],
+                "tree": [
+                    {"path": path, "mode": "100644", "type": "blob", "sha": sha}
+                    for path, sha in blobs.items()
+                ],
+            }))
+            commit = self._json_or_raise(self._request("POST", self._git_url("commits"), json={
+                "message": message,
+                "tree": tree["sha"],
+                "parents": [parent_sha],
+            }))
+            response = self._request(
+                "PATCH", self._git_url(f"refs/heads/{self.branch}"), json={"sha": commit["sha"]}
+            )
+            if response.status_code == 422 and attempt < 2:
+                # La rama avanzó mientras tanto (no fast-forward): rehacemos sobre la nueva punta
+                print("   Branch moved during commit, retrying on top of the new head...")
+                continue
+            self._json_or_raise(response, ok=(200,))
+            break
+
+        # El SHA del contents API es el SHA del blob
+        for path, sha in blobs.items():
+            self._sha[path] = sha  # None = ya no existe
+            self._etag.pop(path, None)
+        return {"sha": commit["sha"], "html_url": commit.get("html_url", "")}
+
+    def commit_file(self, path: str, local_path: str, message: str) -> Dict[str, Any]:
+        """
+        Commit one file from disk, choosing the API by size: the contents API
+        for small files (one PUT), the Git Data API above CONTENTS_API_MAX_BYTES.
+        Returns {"sha", "html_url"} of the new commit.
+        """
+        if os.path.getsize(local_path) > CONTENTS_API_MAX_BYTES:
+            print(f"   Large file, using Git Data API (streamed upload)...")
+            return self.commit_files_git_data({path: local_path}, message)
+        with open(local_path, "rb") as f:
+            content = f.read()
+        result = self.put_file(path, content, message)
+        return {"sha": result["commit"].get("sha", ""), "html_url": result["commit"]["html_url"]}
@@ -0,0 +1,178 @@
+# arcana_lazy.py
+#
+# Lightweight index over a grimoire snapshot (ordinances_db.json as written
+# by arcana_core._grimoire_json), so the app can start without building an
+# Ordinance per record. One pass over the memory-mapped file, locating each
+# record's closing brace and field lines with bytes.find(), keeps per
+# ordinance its id, canonical_key, name, precept, Numen, tier and the byte
+# spans of its JSON object and of its modifiers list; the full record is
+# only parsed when asked for (SnapshotIndex.record).
+#
+# The scan relies on the writer's fixed layout (indent=2, fields in
+# Ordinance order, one key per line). A JSON string cannot hold a raw
+# newline, so every line start in the file is structure, never text. A file
+# that does not match (hand-edited, reordered fields, CRLF line ends) makes
+# scan_snapshot() return None and the caller loads it eagerly.
+#
+# Each field is found by its fixed line prefix; find() runs at memchr speed,
+# where a regex would walk every line of every record.
+#
+# The index only reads the mapped bytes. When the file is atomically
+# replaced (os.replace) the map keeps the old contents alive, so the spans
+# stay valid for as long as the index lives.
+#
+# Like arcana_columns it does not depend on arcana_core.
+
+from __future__ import annotations
+from array import array
+from typing import Any, Dict, List, Tuple
+import json
+import mmap
+import re
+import sys
+
+_STR_RE = re.compile(rb'"(?:[^"\\\n]|\\.)*"')
+_MODIFIER_RE = re.compile(
+    rb'"modifier_id": ("(?:[^"\\\n]|\\.)*"),\n        "rank": (-?\d+),\n        "extra_instances": (-?\d+)'
+)
+# Prefijo de la línea de cada campo de primer nivel de un registro. Solo
+# ellos empiezan una línea con 4 espacios + comilla (lo anidado va más
+# indentado y un string JSON no puede contener un salto de línea)
+_ID, _KEY, _NAME, _PRECEPT, _NUMEN, _MODIFIERS, _MECHANICAL, _TIER, _META = (
+    b'\n    "' + field + b'": '
+    for field in (b"id", b"canonical_key", b"name", b"precept_id", b"numen_ids", b"modifiers", b"mechanical", b"tier", b"meta")
+)
+
+
+def _text(token: bytes) -> str:
+    # Sin escapes (lo normal) basta con quitar las comillas
+    return json.loads(token) if b"\\" in token else token[1:-1].decode("utf-8")
+
+
+class SnapshotIndex:
+    """
+    Header fields of every record of a snapshot, in file order, plus the
+    byte spans of each record's JSON object and modifiers list in the
+    mapped file.
+    """
+
+    def __init__(self, buf: Any):
+        self._buf = buf
+        self.ids: List[str] = []
+        self.canonical_keys: List[str] = []
+        self.names: List[str] = []
+        self.precept_ids: List[str] = []
+        self.numen_ids: List[Tuple[str, ...]] = []  # tuplas compartidas entre registros
+        self.tiers = array("q")
+        self._starts = array("q")
+        self._ends = array("q")
+        self._modifier_spans = array("q")  # inicio, fin de cada lista de modificadores
+        self._modifiers: Dict[Tuple[bytes, bytes, bytes], Tuple[str, int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def raw(self, row: int) -> bytes:
+        """The record's JSON object as stored in the file."""
+        return self._buf[self._starts[row] : self._ends[row]]
+
+    def fragment(self, row: int) -> str:
+        """raw() as text: the record's fragment inside the grimoire JSON."""
+        return self.raw(row).decode("utf-8")
+
+    def record(self, row: int) -> Dict[str, Any]:
+        return json.loads(self.raw(row))
+
+    def modifiers(self, row: int) -> List[Tuple[str, int, int]]:
+        """(modifier_id, rank, extra_instances) of the record, without parsing the rest."""
+        block = self._buf[self._modifier_spans[2 * row] : self._modifier_spans[2 * row + 1]]
+        out = []
+        for raw in _MODIFIER_RE.findall(block):
+            # Hay pocas combinaciones (id, rango, instancias) distintas
+            parsed = self._modifiers.get(raw)
+            if parsed is None:
+                mid, rank, extra = raw
+                parsed = self._modifiers[raw] = (_text(mid), int(rank), int(extra))
+            out.append(parsed)
+        return out
+
+    def close(self) -> None:
+        if isinstance(self._buf, mmap.mmap):
+            self._buf.close()
+
+
+def _scan(buf: Any, index: SnapshotIndex) -> bool:
+    # Recorre los registros con find() (memchr en C) en vez de una regex
+    find, rfind = buf.find, buf.rfind
+    numen_shared: Dict[bytes, Tuple[str, ...]] = {}
+    precept_shared: Dict[bytes, str] = {}
+    ids, keys, names = index.ids, index.canonical_keys, index.names
+    precepts, numen, tiers = index.precept_ids, index.numen_ids, index.tiers
+    starts, ends, modifier_spans = index._starts, index._ends, index._modifier_spans
+    pos = 2
+    while True:
+        # '  "ORD_x": {' ... '\n  }': solo el cierre del registro va con 2 espacios
+        head = find(b": {\n", pos)
+        end = find(b"\n  }", head)
+        if head < 0 or end < 0 or buf[pos : pos + 3] != b'  "' or buf[head + 3 : head + 3 + len(_ID)] != _ID:
+            return False
+        start, end = head + 2, end + 4
+        # Valor de un campo: tras su prefijo y hasta la coma antes del siguiente
+        k = find(_KEY, start, end)
+        n = find(_NAME, k, end)
+        p = find(_PRECEPT, n, end)
+        u = find(_NUMEN, p, end)
+        m = find(_MODIFIERS, u, end)
+        c = find(_MECHANICAL, m, end)
+        t = rfind(_TIER, c, end)  # tier va casi al final, tras mechanical/cost
+        e = find(_META, t, end)
+        if min(k, n, p, u, m, c, t, e) < 0:
+            return False
+        ids.append(_text(buf[pos + 2 : head]))
+        keys.append(_text(buf[k + len(_KEY) : n - 1]))
+        names.append(_text(buf[n + len(_NAME) : p - 1]))
+        raw = buf[p + len(_PRECEPT) : u - 1]
+        pid = precept_shared.get(raw)
+        if pid is None:
+            pid = precept_shared[raw] = sys.intern(_text(raw))
+        precepts.append(pid)
+        raw = buf[u + len(_NUMEN) : m - 1]
+        nids = numen_shared.get(raw)
+        if nids is None:
+            nids = numen_shared[raw] = tuple(_text(token) for token in _STR_RE.findall(raw))
+        numen.append(nids)
+        try:
+            tiers.append(int(buf[t + len(_TIER) : e - 1]))
+        except ValueError:
+            return False
+        starts.append(start)
+        ends.append(end)
+        modifier_spans.append(m + len(_MODIFIERS))
+        modifier_spans.append(c - 1)
+        pos = end
+        sep = buf[pos : pos + 2]
+        if sep == b",\n":
+            pos += 2
+        elif sep == b"\n}" and not buf[pos + 2 :].strip():
+            return True
+        else:
+            return False
+
+
+def scan_snapshot(path: str) -> SnapshotIndex | None:
+    """
+    Index the snapshot at `path` in one pass, or None if the file is empty
+    or not in the writer's layout (see the module comment).
+    """
+    with open(path, "rb") as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # fichero vacío
+            return None
+    index = SnapshotIndex(buf)
+    if len(buf) <= 16 and buf[:].strip() == b"{}":  # grimorio vacío
+        return index
+    if buf[:2] == b"{\n" and _scan(buf, index):
+        return index
+    index.close()
+    return None
@@ -0,0 +1,346 @@
+# arcana_rules.py
+#
+# Compiled, integer-indexed views of the arcana_data rule tables.
+#
+# compile_cost_tables() turns PRECEPTS/MODIFIERS into flat per-index
+# coefficient lists, so the complexity of a modifier set is a handful of
+# list lookups and additions instead of dict lookups and id comparisons:
+#
+#   complexity = precept_base[p]
+#              + sum(base[i] + long[i]*long_duration
+#                    + rank[i]*max(1, rank_i) + instance[i]*extra_i)
+#              + efficiency_total  (once, if any modifier has the flag)
+#   (minimum 1)
+#
+# iter_selections() walks the (precept, modifier selection) space depth
+# first with that same cost, pruning branches that are already over budget;
+# count_selections() counts the same space by dynamic programming.
+#
+# Like arcana_export it does not depend on arcana_core: it works on ids and
+# (modifier_index, rank, extra_instances) tuples. arcana_core keeps the
+# readable reference implementation (calculate_complexity) and
+# recompiles the tables when the rules fingerprint changes.
+
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+# Casos especiales de calculate_complexity, por id de modificador
+RANK_COST_IDS = ("INTENSIDAD_POTENCIADO",)
+INSTANCE_COST_IDS = ("INTENSIDAD_MULTIPLICADO",)
+LONG_DURATION_IDS = ("DURACION_PERSISTENTE",)
+EFFICIENCY_ID = "INTENSIDAD_EFICIENCIA"
+
+EncodedModifiers = Sequence[Tuple[int, int, int]]  # (modifier_index, rank, extra_instances)
+
+
+@dataclass(frozen=True)
+class CostTables:
+    """Dense cost coefficients, indexed by precept_index / modifier_index."""
+    precept_ids: Tuple[str, ...]
+    modifier_ids: Tuple[str, ...]
+    precept_index: Dict[str, int]
+    modifier_index: Dict[str, int]
+    precept_base: Tuple[int, ...]
+    base: Tuple[int, ...]            # base_cost
+    base_long: Tuple[int, ...]       # base_cost + extra_long_duration_cost
+    rank: Tuple[int, ...]            # por rango (mínimo 1)
+    instance: Tuple[int, ...]        # por instancia extra
+    efficiency: Tuple[bool, ...]     # aplica efficiency_total una vez
+    efficiency_total: int
+
+    def encode(self, modifiers: Iterable[Tuple[str, int, int]]) -> Tuple[Tuple[int, int, int], ...]:
+        """(modifier_id, rank, extra_instances) triples -> index triples. KeyError if unknown."""
+        index = self.modifier_index
+        return tuple((index[mid], rank, extra) for mid, rank, extra in modifiers)
+
+    def complexity(self, precept_index: int, modifiers: EncodedModifiers, long_duration: bool = False) -> int:
+        base = self.base_long if long_duration else self.base
+        rank_cost = self.rank
+        instance_cost = self.instance
+        efficiency = self.efficiency
+        total = self.precept_base[precept_index]
+        has_efficiency = False
+        for i, rank, extra in modifiers:
+            total += base[i] + rank_cost[i] * (rank if rank > 1 else 1) + instance_cost[i] * extra
+            has_efficiency = has_efficiency or efficiency[i]
+        if has_efficiency:
+            total += self.efficiency_total
+        return total if total > 1 else 1
+
+    def complexity_batch(
+        self,
+        precept_indices: Sequence[int],
+        modifier_sets: Sequence[EncodedModifiers],
+        long_durations: Sequence[bool] | None = None,
+    ) -> List[int]:
+        """complexity() for many sets in one call, with the lookups hoisted out of the loop."""
+        precept_base = self.precept_base
+        base_short, base_long = self.base, self.base_long
+        rank_cost = self.rank
+        instance_cost = self.instance
+        efficiency = self.efficiency
+        efficiency_total = self.efficiency_total
+        if long_durations is None:
+            long_durations = [False] * len(modifier_sets)
+        out: List[int] = []
+        append = out.append
+        for p, mods, long_duration in zip(precept_indices, modifier_sets, long_durations):
+            base = base_long if long_duration else base_short
+            total = precept_base[p]
+            has_efficiency = False
+            for i, rank, extra in mods:
+                total += base[i] + rank_cost[i] * (rank if rank > 1 else 1) + instance_cost[i] * extra
+                has_efficiency = has_efficiency or efficiency[i]
+            if has_efficiency:
+                total += efficiency_total
+            append(total if total > 1 else 1)
+        return out
+
+
+def compile_cost_tables(precepts: Dict[str, Dict[str, Any]], modifiers: Dict[str, Dict[str, Any]]) -> CostTables:
+    """Build the CostTables for the given PRECEPTS / MODIFIERS tables."""
+    precept_ids = tuple(precepts)
+    modifier_ids = tuple(modifiers)
+    base, base_long, rank, instance, efficiency = [], [], [], [], []
+    for mid in modifier_ids:
+        mod = modifiers[mid]
+        cost = mod.get("base_cost", 1)
+        base.append(cost)
+        base_long.append(cost + (mod.get("extra_long_duration_cost", 1) if mid in LONG_DURATION_IDS else 0))
+        rank.append(mod.get("rank_cost", 1) if mid in RANK_COST_IDS else 0)
+        instance.append(mod.get("per_extra_instance_cost", 1) if mid in INSTANCE_COST_IDS else 0)
+        efficiency.append(mid == EFFICIENCY_ID)
+    efficiency_total = modifiers[EFFICIENCY_ID].get("cost_modifier_total", -1) if EFFICIENCY_ID in modifiers else 0
+    return CostTables(
+        precept_ids=precept_ids,
+        modifier_ids=modifier_ids,
+        precept_index={pid: i for i, pid in enumerate(precept_ids)},
+        modifier_index={mid: i for i, mid in enumerate(modifier_ids)},
+        precept_base=tuple(precepts[pid].get("base_complexity", 1) for pid in precept_ids),
+        base=tuple(base),
+        base_long=tuple(base_long),
+        rank=tuple(rank),
+        instance=tuple(instance),
+        efficiency=tuple(efficiency),
+        efficiency_total=efficiency_total,
+    )
+
+
+# ---------- Enumeración del espacio de combinaciones ----------
+
+# Modificadores con rango elegible en el Constructor (1..max_rank)
+RANKED_IDS = ("INTENSIDAD_POTENCIADO", "ALCANCE_EXTENDIDO", "DURACION_PERSISTENTE")
+
+# Restricciones de familia: como mucho N modificadores de la familia,
+# pares incompatibles, y familias que exigen otro modificador
+FAMILY_LIMITS = {"FORMA": 1, "INTENCION": 1}
+EXCLUSIVE_MODIFIERS = (("DURACION_INSTANTANEO", "DURACION_PERSISTENTE"),)
+FAMILY_REQUIRES = {"CONDICION": "INTENCION_CONDICIONAL"}
+
+
+def modifier_variants(
+    tables: CostTables,
+    modifiers: Dict[str, Dict[str, Any]],
+    max_extra_instances: int = 3,
+) -> List[List[Tuple[int, int]]]:
+    """
+    (rank, extra_instances) options per modifier index: 1..max_rank for
+    RANKED_IDS, 0..max_extra_instances for INSTANCE_COST_IDS, else (1, 0).
+    """
+    variants = []
+    for mid in tables.modifier_ids:
+        if mid in RANKED_IDS:
+            variants.append([(r, 0) for r in range(1, modifiers[mid].get("max_rank", 3) + 1)])
+        elif mid in INSTANCE_COST_IDS:
+            variants.append([(1, x) for x in range(max_extra_instances + 1)])
+        else:
+            variants.append([(1, 0)])
+    return variants
+
+
+def iter_selections(
+    tables: CostTables,
+    modifiers: Dict[str, Dict[str, Any]],
+    variants: List[List[Tuple[int, int]]],
+    max_complexity: int,
+    min_complexity: int = 1,
+    long_duration: bool = False,
+    precept_indices: Sequence[int] | None = None,
+    max_modifiers: int | None = None,
+    after: Tuple[int, Tuple[int, ...]] | None = None,
+) -> Iterable[Tuple[int, Tuple[int, ...], int]]:
+    """
+    Depth-first over precept x (per modifier: absent or one of its
+    variants), yielding (precept_index, choices, complexity) for every
+    selection within [min_complexity, max_complexity] that respects the
+    family constraints. choices[i] is -1 (absent) or an index into
+    variants[i]; the order is lexicographic on (precept_index, choices).
+
+    A branch is cut as soon as its running cost plus the most the
+    remaining modifiers could subtract (EFICIENCIA) exceeds the budget.
+    `after` resumes strictly after a previously yielded position.
+    """
+    n = len(tables.modifier_ids)
+    base = tables.base_long if long_duration else tables.base
+    costs = [
+        [
+            base[i] + tables.rank[i] * max(1, r) + tables.instance[i] * x
+            + (tables.efficiency_total if tables.efficiency[i] else 0)
+            for r, x in variants[i]
+        ]
+        for i in range(n)
+    ]
+    # Lo más que pueden restar los modificadores i.. (cota inferior)
+    suffix_min = [0] * (n + 1)
+    for i in range(n - 1, -1, -1):
+        suffix_min[i] = suffix_min[i + 1] + min(0, min(costs[i]))
+
+    family = [modifiers[mid].get("family") for mid in tables.modifier_ids]
+    limit = [FAMILY_LIMITS.get(f) for f in family]
+    exclusive: List[List[int]] = [[] for _ in range(n)]
+    for a, b in EXCLUSIVE_MODIFIERS:
+        if a in tables.modifier_index and b in tables.modifier_index:
+            ia, ib = tables.modifier_index[a], tables.modifier_index[b]
+            exclusive[ia].append(ib)
+            exclusive[ib].append(ia)
+    requires = [
+        tables.modifier_index.get(FAMILY_REQUIRES[f], -1) if f in FAMILY_REQUIRES else None
+        for f in family
+    ]
+    max_modifiers = n if max_modifiers is None else max_modifiers
+
+    choices = [-1] * n
+    family_count: Dict[str, int] = {}
+
+    def dfs(i: int, running: int, chosen: int, resume: Tuple[int, ...] | None):
+        if max(1, running + suffix_min[i]) > max_complexity:
+            return
+        if i == n:
+            if resume is not None:  # es la posición de `after`: ya se emitió
+                return
+            complexity = max(1, running)
+            if complexity < min_complexity:
+                return
+            for j in range(n):
+                req = requires[j]
+                if choices[j] != -1 and req is not None and (req < 0 or choices[req] == -1):
+                    return
+            yield tuple(choices), complexity
+            return
+
+        first = -1 if resume is None else resume[i]
+        if first == -1:
+            yield from dfs(i + 1, running, chosen, resume)
+            first = 0
+            resume = None
+        fam = family[i]
+        if chosen >= max_modifiers or (limit[i] is not None and family_count.get(fam, 0) >= limit[i]):
+            return
+        if any(choices[k] != -1 for k in exclusive[i]):
+            return
+        family_count[fam] = family_count.get(fam, 0) + 1
+        for v in range(first, len(variants[i])):
+            choices[i] = v
+            yield from dfs(i + 1, running + costs[i][v], chosen + 1, resume if v == first else None)
+        choices[i] = -1
+        family_count[fam] -= 1
+
+    if precept_indices is None:
+        precept_indices = range(len(tables.precept_ids))
+    for p in precept_indices:
+        resume = None
+        if after is not None:
+            if p < after[0]:
+                continue
+            if p == after[0]:
+                resume = tuple(after[1])
+        for selection, complexity in dfs(0, tables.precept_base[p], 0, resume):
+            yield p, selection, complexity
+
+
+# ---------- Conteo sin enumerar ----------
+
+def count_selections(
+    tables: CostTables,
+    modifiers: Dict[str, Dict[str, Any]],
+    variants: List[List[Tuple[int, int]]],
+    long_duration: bool = False,
+    max_modifiers: int | None = None,
+    group_family: str = "INTENCION",
+) -> Dict[Tuple[int, Tuple[str, ...]], int]:
+    """
+    Number of modifier selections iter_selections() would produce, by
+    (modifier cost, ids chosen from `group_family`), via dynamic
+    programming over the modifiers instead of enumeration. The modifier
+    cost excludes the precept base: complexity = max(1, base + cost).
+
+    The DP state is (cost, family counts, chosen ids that constraints
+    look at, chosen requiring families, modifier count), so the state
+    space stays in the hundreds whatever the size of the product.
+    """
+    n = len(tables.modifier_ids)
+    base = tables.base_long if long_duration else tables.base
+    costs = [
+        [
+            base[i] + tables.rank[i] * max(1, r) + tables.instance[i] * x
+            + (tables.efficiency_total if tables.efficiency[i] else 0)
+            for r, x in variants[i]
+        ]
+        for i in range(n)
+    ]
+    family = [modifiers[mid].get("family") for mid in tables.modifier_ids]
+    limited = sorted({f for f in family if f in FAMILY_LIMITS})
+    requiring = sorted({f for f in family if f in FAMILY_REQUIRES})
+
+    # Ids cuyo estado hay que recordar: exclusiones, requisitos y el grupo
+    tracked_ids = {mid for pair in EXCLUSIVE_MODIFIERS for mid in pair}
+    tracked_ids |= set(FAMILY_REQUIRES.values())
+    tracked_ids |= {mid for mid, f in zip(tables.modifier_ids, family) if f == group_family}
+    tracked = [mid for mid in tables.modifier_ids if mid in tracked_ids]
+    bit = {mid: 1 << k for k, mid in enumerate(tracked)}
+    exclusive_mask = {mid: 0 for mid in tracked}
+    for a, b in EXCLUSIVE_MODIFIERS:
+        if a in bit and b in bit:
+            exclusive_mask[a] |= bit[b]
+            exclusive_mask[b] |= bit[a]
+
+    # estado: (cost, family_counts, tracked_mask, requiring_mask, count) -> nº de selecciones
+    states: Dict[Tuple, int] = {(0, (0,) * len(limited), 0, 0, 0): 1}
+    for i, mid in enumerate(tables.modifier_ids):
+        fam = family[i]
+        fam_pos = limited.index(fam) if fam in limited else None
+        req_bit = 1 << requiring.index(fam) if fam in requiring else 0
+        my_bit = bit.get(mid, 0)
+        excl = exclusive_mask.get(mid, 0)
+        new_states: Dict[Tuple, int] = {}
+        for state, count in states.items():
+            new_states[state] = new_states.get(state, 0) + count  # ausente
+            cost, fam_counts, mask, req_mask, chosen = state
+            if max_modifiers is not None and chosen >= max_modifiers:
+                continue
+            if fam_pos is not None and fam_counts[fam_pos] >= FAMILY_LIMITS[fam]:
+                continue
+            if mask & excl:
+                continue
+            if fam_pos is not None:
+                fam_counts = fam_counts[:fam_pos] + (fam_counts[fam_pos] + 1,) + fam_counts[fam_pos + 1:]
+            mask |= my_bit
+            req_mask |= req_bit
+            for c in costs[i]:
+                key = (cost + c, fam_counts, mask, req_mask, chosen + 1)
+                new_states[key] = new_states.get(key, 0) + count
+        states = new_states
+
+    group_ids = [mid for mid in tracked if family[tables.modifier_index[mid]] == group_family]
+    out: Dict[Tuple[int, Tuple[str, ...]], int] = {}
+    for (cost, _, mask, req_mask, _), count in states.items():
+        valid = all(
+            not (req_mask >> k) & 1 or (FAMILY_REQUIRES[f] in bit and mask & bit[FAMILY_REQUIRES[f]])
+            for k, f in enumerate(requiring)
+        )
+        if not valid:
+            continue
+        key = (cost, tuple(mid for mid in group_ids if mask & bit[mid]))
+        out[key] = out.get(key, 0) + count
+    return out
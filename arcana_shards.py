@@ -0,0 +1,109 @@
+# arcana_shards.py
+#
+# Sharded JSON storage: one file per precept_id plus a small manifest.
+#
+#   ordinances_db/
+#       manifest.json        {"version": 1, "shard_key": "precept_id",
+#                             "shards": {"ENCENDER": {"file": "ENCENDER.json", "count": 3}, ...}}
+#       ENCENDER.json        {oid: record, ...}  (same layout as ordinances_db.json)
+#
+# Like arcana_sqlite it works on plain record dicts; arcana_core builds the
+# Ordinance objects.
+
+from __future__ import annotations
+from typing import Any, Dict, Iterable, Iterator, List
+import json
+import os
+import re
+
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def shard_name(record: Dict[str, Any]) -> str:
+    """Shard a record belongs to (its precept)."""
+    return record["precept_id"]
+
+
+def _shard_file(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_-]", "_", name) + ".json"
+
+
+def _write_json(path: str, data: Any, indent: int | None = 2) -> None:
+    # tmp + fsync + rename: un crash deja el fichero viejo o el nuevo, nunca uno truncado
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def manifest_path(shard_dir: str) -> str:
+    return os.path.join(shard_dir, MANIFEST_NAME)
+
+
+def load_manifest(shard_dir: str) -> Dict[str, Any]:
+    path = manifest_path(shard_dir)
+    if not os.path.exists(path):
+        return {"version": MANIFEST_VERSION, "shard_key": "precept_id", "shards": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_shard(shard_dir: str, name: str, manifest: Dict[str, Any] | None = None) -> Dict[str, Any]:
+    manifest = manifest or load_manifest(shard_dir)
+    entry = manifest["shards"].get(name)
+    if entry is None:
+        return {}
+    with open(os.path.join(shard_dir, entry["file"]), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_records(shard_dir: str, shard_names: Iterable[str] | None = None) -> Iterator[Dict[str, Any]]:
+    """Records of the given shards only (all shards if None)."""
+    manifest = load_manifest(shard_dir)
+    names = manifest["shards"].keys() if shard_names is None else shard_names
+    for name in names:
+        yield from read_shard(shard_dir, name, manifest).values()
+
+
+def write_shards(shard_dir: str, shards: Dict[str, Dict[str, Any]]) -> List[str]:
+    """
+    Rewrite only the given shards ({name: {oid: record}}) and the manifest.
+    Empty shards are removed. Returns the file names written or removed
+    (manifest included), relative to shard_dir.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    manifest = load_manifest(shard_dir)
+    touched: List[str] = []
+    for name, raw in shards.items():
+        file_name = _shard_file(name)
+        path = os.path.join(shard_dir, file_name)
+        if raw:
+            _write_json(path, raw)
+            manifest["shards"][name] = {"file": file_name, "count": len(raw)}
+        else:
+            if os.path.exists(path):
+                os.remove(path)
+            manifest["shards"].pop(name, None)
+        touched.append(file_name)
+    _write_json(manifest_path(shard_dir), manifest)
+    touched.append(MANIFEST_NAME)
+    return touched
+
+
+def group_by_shard(records: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    shards: Dict[str, Dict[str, Any]] = {}
+    for data in records:
+        shards.setdefault(shard_name(data), {})[data["id"]] = data
+    return shards
+
+
+def migrate_json(json_path: str, shard_dir: str) -> int:
+    """One-shot split of a monolithic ordinances_db.json into shards."""
+    with open(json_path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    write_shards(shard_dir, group_by_shard(raw.values()))
+    return len(raw)
@@ -0,0 +1,304 @@
+# arcana_sqlite.py
+#
+# SQLite backend for the ordinances "DB". Works on plain record dicts (the
+# same shape that lives in ordinances_db.json) so it does not depend on
+# arcana_core; arcana_core converts records <-> Ordinance objects.
+
+from __future__ import annotations
+from typing import Any, Dict, Iterable, Iterator, List, Set, Tuple
+from contextlib import contextmanager
+import sqlite3
+import json
+import sys
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ordinances (
+    id            TEXT PRIMARY KEY,
+    num           INTEGER,            -- parte numérica de ORD_000123
+    canonical_key TEXT NOT NULL,
+    precept_id    TEXT NOT NULL,
+    tier          INTEGER NOT NULL,
+    effect_type   TEXT NOT NULL,      -- derivado: damage / heal / control / utility
+    name          TEXT NOT NULL,
+    data          TEXT NOT NULL       -- registro completo en JSON
+);
+CREATE INDEX IF NOT EXISTS idx_ordinances_canonical_key ON ordinances(canonical_key);
+CREATE INDEX IF NOT EXISTS idx_ordinances_precept ON ordinances(precept_id);
+CREATE INDEX IF NOT EXISTS idx_ordinances_tier ON ordinances(tier);
+CREATE INDEX IF NOT EXISTS idx_ordinances_effect_type ON ordinances(effect_type);
+CREATE INDEX IF NOT EXISTS idx_ordinances_num ON ordinances(num);
+
+CREATE TABLE IF NOT EXISTS ordinance_numen (
+    numen_id      TEXT NOT NULL,
+    ordinance_id  TEXT NOT NULL REFERENCES ordinances(id) ON DELETE CASCADE,
+    PRIMARY KEY (numen_id, ordinance_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_ordinance_numen_ord ON ordinance_numen(ordinance_id);
+"""
+
+
+@contextmanager
+def _connect(path: str):
+    """
+    One short-lived connection per call: sqlite3 connections cannot be shared
+    between the threads Streamlit uses for each session.
+    """
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        # lower() de SQLite solo entiende ASCII; usamos el de Python para acentos
+        conn.create_function("py_lower", 1, lambda s: s.lower() if s else s, deterministic=True)
+        yield conn
+    finally:
+        conn.close()
+
+
+def init_db(path: str) -> None:
+    with _connect(path) as conn:
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+
+def _ordinance_number(oid: str) -> int | None:
+    if oid.startswith("ORD_"):
+        try:
+            return int(oid.split("_")[-1])
+        except ValueError:
+            return None
+    return None
+
+
+def upsert_records(path: str, records: Iterable[Tuple[Dict[str, Any], str]]) -> int:
+    """
+    Insert or replace (record, effect_type) pairs in a single transaction.
+    Returns the number of records written.
+    """
+    count = 0
+    with _connect(path) as conn:
+        with conn:
+            for data, effect_type in records:
+                oid = data["id"]
+                conn.execute(
+                    "INSERT OR REPLACE INTO ordinances "
+                    "(id, num, canonical_key, precept_id, tier, effect_type, name, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        oid,
+                        _ordinance_number(oid),
+                        data["canonical_key"],
+                        data["precept_id"],
+                        data["tier"],
+                        effect_type,
+                        data["name"],
+                        json.dumps(data, ensure_ascii=False, separators=(",", ":")),
+                    ),
+                )
+                conn.execute("DELETE FROM ordinance_numen WHERE ordinance_id = ?", (oid,))
+                conn.executemany(
+                    "INSERT OR IGNORE INTO ordinance_numen (numen_id, ordinance_id) VALUES (?, ?)",
+                    [(nid, oid) for nid in data["numen_ids"]],
+                )
+                count += 1
+    return count
+
+
+def load_records(path: str) -> Iterator[Dict[str, Any]]:
+    with _connect(path) as conn:
+        for (data,) in conn.execute("SELECT data FROM ordinances ORDER BY id"):
+            yield json.loads(data)
+
+
+def iter_ids(path: str) -> Iterator[str]:
+    with _connect(path) as conn:
+        for (oid,) in conn.execute("SELECT id FROM ordinances ORDER BY id"):
+            yield oid
+
+
+# Ids por consulta en los IN (...): por debajo del límite de variables de SQLite
+_IN_CHUNK = 500
+
+
+def get_records(path: str, ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """{id: record} of the given ids that exist."""
+    ids = list(ids)
+    out: Dict[str, Dict[str, Any]] = {}
+    with _connect(path) as conn:
+        for i in range(0, len(ids), _IN_CHUNK):
+            chunk = ids[i : i + _IN_CHUNK]
+            rows = conn.execute(
+                f"SELECT id, data FROM ordinances WHERE id IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            out.update((oid, json.loads(data)) for oid, data in rows)
+    return out
+
+
+def existing_ids(path: str, ids: Iterable[str]) -> Set[str]:
+    """The subset of `ids` stored in the database."""
+    ids = list(ids)
+    found: Set[str] = set()
+    with _connect(path) as conn:
+        for i in range(0, len(ids), _IN_CHUNK):
+            chunk = ids[i : i + _IN_CHUNK]
+            found.update(
+                oid for (oid,) in conn.execute(
+                    f"SELECT id FROM ordinances WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+            )
+    return found
+
+
+def delete_records(path: str, ids: Iterable[str]) -> int:
+    """Delete the given ids (and their Numen rows) in one transaction."""
+    count = 0
+    with _connect(path) as conn:
+        with conn:
+            for oid in ids:
+                count += conn.execute("DELETE FROM ordinances WHERE id = ?", (oid,)).rowcount
+    return count
+
+
+def count_records(path: str) -> int:
+    with _connect(path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM ordinances").fetchone()[0]
+
+
+def find_by_canonical_key(path: str, canonical_key: str) -> Dict[str, Any] | None:
+    with _connect(path) as conn:
+        # Con duplicados gana la de menor id, como al cargar en orden
+        row = conn.execute(
+            "SELECT data FROM ordinances WHERE canonical_key = ? ORDER BY id LIMIT 1",
+            (canonical_key,),
+        ).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def ids_by_canonical_keys(path: str, canonical_keys: Iterable[str]) -> Dict[str, str]:
+    """{canonical_key: id} of the given keys that exist (the lowest id if repeated)."""
+    keys = list(dict.fromkeys(canonical_keys))
+    out: Dict[str, str] = {}
+    with _connect(path) as conn:
+        for i in range(0, len(keys), _IN_CHUNK):
+            chunk = keys[i : i + _IN_CHUNK]
+            rows = conn.execute(
+                "SELECT canonical_key, MIN(id) FROM ordinances "
+                f"WHERE canonical_key IN ({','.join('?' * len(chunk))}) GROUP BY canonical_key",
+                chunk,
+            )
+            out.update(rows)
+    return out
+
+
+def max_ordinance_number(path: str) -> int:
+    with _connect(path) as conn:
+        row = conn.execute("SELECT MAX(num) FROM ordinances").fetchone()
+    return row[0] or 0
+
+
+def _where(
+    precept_ids: List[str] | None,
+    numen_ids: List[str] | None,
+    tiers: List[int] | None,
+    effect_type: str | None,
+    name_contains: str | None,
+) -> Tuple[str, List[Any]]:
+    """WHERE clause (or "") and parameters of the Grimorio filters, over `ordinances o`."""
+    where: List[str] = []
+    params: List[Any] = []
+
+    if precept_ids:
+        where.append(f"o.precept_id IN ({','.join('?' * len(precept_ids))})")
+        params.extend(precept_ids)
+    if tiers:
+        where.append(f"o.tier IN ({','.join('?' * len(tiers))})")
+        params.extend(tiers)
+    if effect_type:
+        where.append("o.effect_type = ?")
+        params.append(effect_type)
+    if numen_ids:
+        where.append(
+            "o.id IN (SELECT ordinance_id FROM ordinance_numen "
+            f"WHERE numen_id IN ({','.join('?' * len(numen_ids))}))"
+        )
+        params.extend(numen_ids)
+    if name_contains:
+        where.append("instr(py_lower(o.name), ?) > 0")
+        params.append(name_contains.lower())
+
+    return (" WHERE " + " AND ".join(where) if where else ""), params
+
+
+def query_records(
+    path: str,
+    precept_ids: List[str] | None = None,
+    numen_ids: List[str] | None = None,
+    tiers: List[int] | None = None,
+    effect_type: str | None = None,
+    name_contains: str | None = None,
+) -> List[Dict[str, Any]]:
+    """
+    Grimorio filters pushed down to SQL. Semantics match the Python filters:
+    numen_ids matches ordinances with ANY of the given numen, the rest are
+    plain IN / equality predicates, name_contains is case-insensitive.
+    """
+    where, params = _where(precept_ids, numen_ids, tiers, effect_type, name_contains)
+    sql = f"SELECT o.data FROM ordinances o{where} ORDER BY o.id"
+
+    with _connect(path) as conn:
+        return [json.loads(data) for (data,) in conn.execute(sql, params)]
+
+
+def query_ids(
+    path: str,
+    precept_ids: List[str] | None = None,
+    numen_ids: List[str] | None = None,
+    tiers: List[int] | None = None,
+    effect_type: str | None = None,
+    name_contains: str | None = None,
+) -> List[str]:
+    """Ids of the query_records() results, sorted by (tier, lowercased name, id)."""
+    where, params = _where(precept_ids, numen_ids, tiers, effect_type, name_contains)
+    sql = f"SELECT o.id FROM ordinances o{where} ORDER BY o.tier, py_lower(o.name), o.id"
+
+    with _connect(path) as conn:
+        return [oid for (oid,) in conn.execute(sql, params)]
+
+
+def count_by_tier_effect(
+    path: str,
+    precept_ids: List[str] | None = None,
+    numen_ids: List[str] | None = None,
+    tiers: List[int] | None = None,
+    effect_type: str | None = None,
+    name_contains: str | None = None,
+) -> Dict[Tuple[int, str], int]:
+    """{(tier, effect_type): count} of the query_records() results."""
+    where, params = _where(precept_ids, numen_ids, tiers, effect_type, name_contains)
+    sql = f"SELECT o.tier, o.effect_type, COUNT(*) FROM ordinances o{where} GROUP BY o.tier, o.effect_type"
+
+    with _connect(path) as conn:
+        return {(tier, effect): n for tier, effect, n in conn.execute(sql, params)}
+
+
+def facets(path: str) -> Tuple[List[str], List[str], List[int]]:
+    """Sorted distinct precept ids, Numen ids and tiers in the database."""
+    with _connect(path) as conn:
+        precept_ids = [p for (p,) in conn.execute("SELECT DISTINCT precept_id FROM ordinances ORDER BY precept_id")]
+        numen_ids = [n for (n,) in conn.execute("SELECT DISTINCT numen_id FROM ordinance_numen ORDER BY numen_id")]
+        tiers = [t for (t,) in conn.execute("SELECT DISTINCT tier FROM ordinances ORDER BY tier")]
+    return precept_ids, numen_ids, tiers
+
+
+if __name__ == "__main__":
+    # One-shot migrator:  python arcana_sqlite.py ordinances_db.json ordinances_db.sqlite
+    if len(sys.argv) != 3:
+        print("Usage: python arcana_sqlite.py <source.json> <target.sqlite>")
+        sys.exit(1)
+    from arcana_core import migrate_json_to_sqlite
+
+    n = migrate_json_to_sqlite(sys.argv[1], sys.argv[2])
+    print(f"✓ Migrated {n} ordinances to {sys.argv[2]}")
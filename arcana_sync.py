@@ -0,0 +1,241 @@
+# arcana_sync.py
+#
+# Background worker that pushes the grimoire to GitHub without blocking the
+# Streamlit form submit. Saves only *request* a sync; the worker waits for a
+# quiet period (debounce) and then makes a single commit with the current
+# on-disk state, so N saves in a row become one commit.
+
+from __future__ import annotations
+from typing import Any, Callable, Dict, Iterable, List, Set
+from datetime import datetime, timezone
+import threading
+import glob
+import json
+import time
+import os
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # existe, pero es de otro usuario
+        return True
+    return True
+
+
+class GitHubSyncWorker:
+    """
+    Debouncing, coalescing sync queue running in a daemon thread.
+
+    - request_sync() is O(1) and never touches the network.
+    - Pending work is persisted to a queue file of this process, derived
+      from `pending_path` (ordinances_db.json.<pid>.sync_pending), so
+      several processes never overwrite each other's queue. On start the
+      queues of dead processes (and a legacy `pending_path`) are adopted,
+      so a restart (e.g. a Space rebuild) resumes their sync.
+    - `commit_fn(paths)` must push the *current* state; `paths` is the union
+      of the paths passed to the coalesced request_sync() calls, or empty
+      when the whole grimoire should be pushed (any request_sync() without
+      paths since the last commit). It is retried with exponential backoff
+      when it raises.
+    """
+
+    def __init__(
+        self,
+        commit_fn: Callable[[Set[str]], None],
+        pending_path: str,
+        debounce_seconds: float = 5.0,
+        max_delay_seconds: float = 60.0,
+        max_backoff_seconds: float = 300.0,
+    ):
+        self.commit_fn = commit_fn
+        self.base_pending_path = pending_path
+        root, ext = os.path.splitext(pending_path)
+        self.pending_path = f"{root}.{os.getpid()}{ext}"
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+
+        self._cond = threading.Condition()
+        self._pending = 0                    # saves not yet pushed
+        self._paths: Set[str] = set()        # ficheros tocados por esos saves
+        self._all = False                    # algún save pidió subirlo todo
+        self._first_request: float | None = None
+        self._last_request: float | None = None
+        self._syncing = False
+        self._failures = 0
+        self._retry_at: float | None = None
+        self._last_success: str | None = None
+        self._last_error: str | None = None
+
+        self._restore_pending()
+        self._thread = threading.Thread(target=self._run, name="arcana-github-sync", daemon=True)
+        self._thread.start()
+
+    # ---------- Persistencia de la cola ----------
+
+    def _orphan_queues(self) -> List[str]:
+        """Queue files no live process owns: ours from a previous run, dead processes', the legacy one."""
+        root, ext = os.path.splitext(self.base_pending_path)
+        found = [self.base_pending_path] if os.path.exists(self.base_pending_path) else []
+        for path in glob.glob(f"{glob.escape(root)}.*{ext}"):
+            pid = path[len(root) + 1 : len(path) - len(ext)]
+            if pid.isdigit() and (int(pid) == os.getpid() or not _pid_alive(int(pid))):
+                found.append(path)
+        return found
+
+    def _restore_pending(self) -> None:
+        adopted = self._orphan_queues()
+        for path in adopted:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                paths = set(data.get("paths", []))
+                self._pending += int(data.get("pending", 1)) or 1
+                self._paths |= paths
+                # Las colas antiguas no guardaban "all": sin paths era todo
+                self._all = self._all or bool(data.get("all", not paths))
+            except FileNotFoundError:
+                continue  # otro proceso que arrancaba a la vez la adoptó antes
+            except (OSError, ValueError) as e:
+                print(f"⚠️  Unreadable sync queue {path} ({e}); assuming 1 pending full sync")
+                self._pending += 1
+                self._all = True
+        if not self._pending:
+            return
+        now = time.monotonic()
+        self._first_request = self._last_request = now
+        self._persist_pending()
+        for path in adopted:
+            if path != self.pending_path:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        print(f"🔁 Resuming {self._pending} pending GitHub sync(s) from {len(adopted)} queue file(s)")
+
+    def _persist_pending(self) -> None:
+        try:
+            if self._pending:
+                tmp_path = self.pending_path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(
+                        {
+                            "pending": self._pending,
+                            "all": self._all,
+                            "paths": sorted(self._paths),
+                            "updated": datetime.now(timezone.utc).isoformat(),
+                        },
+                        f,
+                    )
+                os.replace(tmp_path, self.pending_path)
+            elif os.path.exists(self.pending_path):
+                os.remove(self.pending_path)
+        except OSError as e:
+            print(f"⚠️  Could not persist sync queue: {e}")
+
+    # ---------- API pública ----------
+
+    def request_sync(self, paths: Iterable[str] = ()) -> None:
+        """Mark the grimoire (or just `paths`) as changed; the worker commits it later."""
+        with self._cond:
+            now = time.monotonic()
+            self._pending += 1
+            paths = set(paths)
+            if paths:
+                self._paths |= paths
+            else:
+                self._all = True
+            if self._first_request is None:
+                self._first_request = now
+            self._last_request = now
+            self._persist_pending()
+            self._cond.notify_all()
+
+    def status(self) -> Dict[str, Any]:
+        with self._cond:
+            if self._syncing:
+                state = "syncing"
+            elif self._pending and self._last_error:
+                state = "error"
+            elif self._pending:
+                state = "pending"
+            else:
+                state = "idle"
+            return {
+                "state": state,
+                "pending": self._pending,
+                "last_success": self._last_success,
+                "last_error": self._last_error,
+            }
+
+    def wait_idle(self, timeout: float | None = None) -> bool:
+        """Block until nothing is pending (used by scripts before exiting)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._syncing:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    # ---------- Hilo de fondo ----------
+
+    def _due_at(self) -> float:
+        """When the next commit should start (debounce, capped, or backoff)."""
+        due = min(
+            self._last_request + self.debounce_seconds,
+            self._first_request + self.max_delay_seconds,
+        )
+        if self._retry_at is not None:
+            due = max(due, self._retry_at)
+        return due
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                delay = self._due_at() - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                batch = self._pending
+                paths, self._paths = self._paths, set()
+                push_all, self._all = self._all, False
+                self._syncing = True
+
+            print(f"🚀 Syncing {batch} coalesced save(s) to GitHub...")
+            try:
+                self.commit_fn(set() if push_all else paths)
+                error = None
+            except Exception as e:
+                error = e
+
+            with self._cond:
+                self._syncing = False
+                if error is None:
+                    # Lo que llegó durante el commit sigue pendiente
+                    self._pending -= batch
+                    self._failures = 0
+                    self._retry_at = None
+                    self._last_error = None
+                    self._last_success = datetime.now(timezone.utc).strftime("%H:%M:%S UTC")
+                    if self._pending:
+                        self._first_request = time.monotonic()
+                    else:
+                        self._first_request = self._last_request = None
+                    print(f"✓ GitHub sync done ({batch} save(s) in one commit)")
+                else:
+                    self._paths |= paths
+                    self._all = self._all or push_all
+                    self._failures += 1
+                    backoff = min(self.max_backoff_seconds, 2 ** self._failures)
+                    self._retry_at = time.monotonic() + backoff
+                    self._last_error = str(error)
+                    print(f"✗ GitHub sync failed: {error} — retrying in {backoff:.0f}s")
+                self._persist_pending()
+                self._cond.notify_all()
@@ -0,0 +1,288 @@
+# GitHubContentsClient against a local stand-in for the parts of the GitHub
+# API it uses (contents API and Git Data API), served from 127.0.0.1.
+
+from __future__ import annotations
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+import base64
+import hashlib
+import json
+import threading
+import time
+
+import pytest
+
+import arcana_github
+
+
+REPO = "arcana/grimoire"
+
+
+def blob_sha(content: bytes) -> str:
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+
+class StandIn:
+    """
+    Minimal GitHub API on a random port. `faults` holds canned answers
+    (method, path prefix, status, headers), each returned once instead of
+    the real one to the first matching request. Every request is logged as
+    (method, status).
+    """
+
+    def __init__(self):
+        self.files: Dict[str, bytes] = {}
+        self.blobs: Dict[str, bytes] = {}
+        self.trees: Dict[str, Dict[str, Any]] = {}
+        self.commits: Dict[str, str] = {"c0": ""}  # commit -> tree
+        self.head = "c0"
+        self.conflict_status = 409
+        self.faults: List[tuple] = []
+        self.log: List[tuple] = []
+        self.lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, como api.github.com
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def _handle(self) -> None:
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                with stand_in.lock:
+                    status, headers, payload = stand_in.answer(self.command, self.path, self.headers, body)
+                data = json.dumps(payload).encode("utf-8") if payload is not None else b""
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_PUT = do_POST = do_PATCH = _handle
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def statuses(self, start: int = 0) -> List[tuple]:
+        return self.log[start:]
+
+    def answer(self, method: str, raw_path: str, headers: Any, body: bytes) -> tuple:
+        path = raw_path.split("?", 1)[0].split(f"/repos/{REPO}/", 1)[1]
+        for fault in self.faults:
+            if fault[0] == method and path.startswith(fault[1]):
+                self.faults.remove(fault)
+                self.log.append((method, fault[2]))
+                return fault[2], fault[3], {"message": "canned fault"}
+        status, out_headers, payload = self._route(method, path, headers, json.loads(body) if body else None)
+        self.log.append((method, status))
+        return status, out_headers, payload
+
+    def _route(self, method: str, path: str, headers: Any, data: Any) -> tuple:
+        if path.startswith("contents/"):
+            name = path[len("contents/"):]
+            current = blob_sha(self.files[name]) if name in self.files else None
+            if method == "GET":
+                if current is None:
+                    return 404, {}, {"message": "Not Found"}
+                etag = f'"{current}"'
+                if headers.get("If-None-Match") == etag:
+                    return 304, {"ETag": etag}, None
+                return 200, {"ETag": etag}, {"sha": current}
+            if data.get("sha") != current:
+                return self.conflict_status, {}, {"message": f"{name} does not match {data.get('sha')}"}
+            self.files[name] = base64.b64decode(data["content"])
+            commit = f"c{len(self.commits)}"
+            self.commits[commit] = ""
+            self.head = commit
+            payload = {
+                "content": {"sha": blob_sha(self.files[name])},
+                "commit": {"sha": commit, "html_url": f"{self.url}/{commit}"},
+            }
+            return (200 if current else 201), {}, payload
+        if path == "git/blobs":
+            content = base64.b64decode(data["content"])
+            self.blobs[blob_sha(content)] = content
+            return 201, {}, {"sha": blob_sha(content)}
+        if path.startswith("git/ref/heads/"):
+            return 200, {}, {"object": {"sha": self.head}}
+        if path.startswith("git/commits/"):
+            return 200, {}, {"tree": {"sha": self.commits[path[len("git/commits/"):]]}}
+        if path == "git/trees":
+            tree = f"t{len(self.trees)}"
+            self.trees[tree] = {entry["path"]: entry["sha"] for entry in data["tree"]}
+            return 201, {}, {"sha": tree}
+        if path == "git/commits":
+            if data["parents"] != [self.head]:
+                return 422, {}, {"message": "parent is not the branch head"}
+            commit = f"c{len(self.commits)}"
+            self.commits[commit] = data["tree"]
+            return 201, {}, {"sha": commit, "html_url": f"{self.url}/{commit}"}
+        if path.startswith("git/refs/heads/"):
+            commit = data["sha"]
+            # Solo aplicamos los cambios del árbol (sin árbol base completo)
+            for name, sha in self.trees[self.commits[commit]].items():
+                if sha is None:
+                    self.files.pop(name, None)
+                else:
+                    self.files[name] = self.blobs[sha]
+            self.head = commit
+            return 200, {}, {"object": {"sha": commit}}
+        return 404, {}, {"message": f"no route for {method} {path}"}
+
+
+@pytest.fixture
+def server():
+    stand_in = StandIn()
+    yield stand_in
+    stand_in.close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Delays the client waits for, without actually sleeping."""
+    waited: List[float] = []
+    monkeypatch.setattr(arcana_github.time, "sleep", waited.append)
+    return waited
+
+
+@pytest.fixture
+def client(server):
+    c = arcana_github.GitHubContentsClient("token", REPO, api_url=server.url, backoff_base=0.05, max_backoff=1.0)
+    yield c
+    c.session.close()
+
+
+def test_put_reuses_sha_from_response(server, client):
+    client.put_file("a.json", b'{"v": 1}', "create")
+    assert server.statuses() == [("GET", 404), ("PUT", 201)]
+
+    mark = len(server.log)
+    client.put_file("a.json", b'{"v": 2}', "update")
+    assert server.statuses(mark) == [("PUT", 200)]
+    assert client.get_sha("a.json") == blob_sha(server.files["a.json"])
+
+
+@pytest.mark.parametrize("status", [409, 422])
+def test_stale_sha_is_refetched_and_put_retried(server, client, status):
+    client.put_file("a.json", b'{"v": 1}', "create")
+    server.conflict_status = status
+    server.files["a.json"] = b"written elsewhere"
+
+    mark = len(server.log)
+    client.put_file("a.json", b'{"v": 2}', "update")
+    assert server.statuses(mark) == [("PUT", status), ("GET", 200), ("PUT", 200)]
+    assert server.files["a.json"] == b'{"v": 2}'
+
+
+def test_stale_sha_twice_raises(server, client):
+    client.put_file("a.json", b'{"v": 1}', "create")
+    server.files["a.json"] = b"written elsewhere"
+    server.faults.append(("PUT", "contents/", 409, {}))
+    server.faults.append(("PUT", "contents/", 409, {}))
+    with pytest.raises(arcana_github.GitHubError) as exc:
+        client.put_file("a.json", b'{"v": 2}', "update")
+    assert exc.value.status_code == 409
+
+
+def test_conditional_get_304_keeps_sha(server, client):
+    client.put_file("a.json", b'{"v": 1}', "create")
+
+    mark = len(server.log)
+    first = client.get_sha("a.json", refresh=True)
+    second = client.get_sha("a.json", refresh=True)
+    assert server.statuses(mark) == [("GET", 200), ("GET", 304)]
+    assert first == second == blob_sha(server.files["a.json"])
+
+
+def test_retry_after_then_exponential_backoff(server, client, sleeps):
+    server.files["a.json"] = b"{}"
+    server.faults += [
+        ("GET", "contents/", 429, {"Retry-After": "3"}),
+        ("GET", "contents/", 503, {}),
+        ("GET", "contents/", 503, {}),
+    ]
+    assert client.get_sha("a.json") == blob_sha(b"{}")
+    assert server.statuses() == [("GET", 429), ("GET", 503), ("GET", 503), ("GET", 200)]
+    # Retry-After tal cual; después base * 2^intento con jitter de hasta el 50%
+    assert sleeps[0] == 3.0
+    assert 0.05 <= sleeps[1] <= 0.1
+    assert 0.1 <= sleeps[2] <= 0.2
+
+
+def test_rate_limit_reset_backoff(server, client, sleeps):
+    server.files["a.json"] = b"{}"
+    reset = time.time() + 5
+    server.faults.append(
+        ("GET", "contents/", 403, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(int(reset))})
+    )
+    assert client.get_sha("a.json") == blob_sha(b"{}")
+    assert len(sleeps) == 1
+    # Hasta el reset, más un segundo de margen
+    assert 4.0 <= sleeps[0] <= 6.5
+
+
+def test_rate_limit_reset_too_far_returns_answer(server, client, sleeps):
+    server.faults.append(
+        ("GET", "contents/", 403, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(int(time.time()) + 3600)})
+    )
+    with pytest.raises(arcana_github.GitHubError) as exc:
+        client.get_sha("a.json")
+    assert exc.value.status_code == 403
+    assert sleeps == []
+
+
+def test_git_data_commit_streams_blob(server, client, sleeps, tmp_path, monkeypatch):
+    reads: List[int] = []
+    body_read = arcana_github._Base64BlobBody.read
+
+    def counting_read(self, size=-1):
+        piece = body_read(self, size)
+        reads.append(len(piece))
+        return piece
+
+    monkeypatch.setattr(arcana_github._Base64BlobBody, "read", counting_read)
+    client.put_file("a.json", b"{}", "create")
+    content = bytes(range(256)) * 8 * 1024  # 2 MB, por encima de CONTENTS_API_MAX_BYTES
+    local = tmp_path / "big.json"
+    local.write_bytes(content)
+    # El primer envío del blob falla (se reenvía el cuerpo desde el principio)
+    # y la rama se mueve durante el primer commit
+    server.faults += [("POST", "git/blobs", 502, {}), ("PATCH", "git/refs/", 422, {})]
+
+    mark = len(server.log)
+    result = client.commit_files_git_data({"big.json": str(local), "a.json": None}, "big commit")
+    assert server.statuses(mark) == [
+        ("POST", 502), ("POST", 201),
+        ("GET", 200), ("GET", 200), ("POST", 201), ("POST", 201), ("PATCH", 422),
+        ("GET", 200), ("GET", 200), ("POST", 201), ("POST", 201), ("PATCH", 200),
+    ]
+    assert server.files["big.json"] == content
+    assert "a.json" not in server.files
+    assert result["sha"] == server.head
+    assert client.get_sha("big.json") == blob_sha(content)
+    assert client.get_sha("a.json") is None
+    # Leído por trozos, nunca el fichero entero de una vez
+    assert len(reads) > 2
+    assert max(reads) < len(content)
+
+
+def test_commit_file_picks_api_by_size(server, client, tmp_path):
+    small = tmp_path / "small.json"
+    small.write_bytes(b"{}")
+    client.commit_file("small.json", str(small), "small")
+    assert [method for method, _ in server.statuses()] == ["GET", "PUT"]
+
+    big = tmp_path / "big.json"
+    big.write_bytes(b"x" * (arcana_github.CONTENTS_API_MAX_BYTES + 1))
+    mark = len(server.log)
+    client.commit_file("big.json", str(big), "big")
+    assert [method for method, _ in server.statuses(mark)][0] == "POST"
+    assert server.files["big.json"] == big.read_bytes()
@@ -0,0 +1,103 @@
+# Sharded storage (ARCANA_DB_SHARDED): a save rewrites only the touched
+# shards, including the one a record leaves when its precept changes.
+
+from __future__ import annotations
+import importlib
+import os
+import sys
+
+import pytest
+
+
+@pytest.fixture
+def core(tmp_path, monkeypatch):
+    # arcana_core lee la configuración al importarse
+    monkeypatch.setenv("ARCANA_DB_SHARDED", "1")
+    monkeypatch.setenv("ARCANA_DB_PATH", str(tmp_path / "ordinances_db.json"))
+    monkeypatch.setenv("ARCANA_JSON_DB_PATH", str(tmp_path / "ordinances_db.json"))
+    monkeypatch.setenv("ARCANA_SHARD_DIR", str(tmp_path / "ordinances_db"))
+    monkeypatch.setenv("ARCANA_BACKUP_DIR", str(tmp_path / "grimoire_h"))
+    monkeypatch.delenv("GITHUB_TOKEN_ARCANA", raising=False)
+    sys.modules.pop("arcana_core", None)
+    module = importlib.import_module("arcana_core")
+    yield module
+    sys.modules.pop("arcana_core", None)
+
+
+def make(core, oid, precept_id, rank=1):
+    modifiers = [core.ModifierSelection("INTENSIDAD_POTENCIADO", rank)]
+    return core.Ordinance(
+        id=oid,
+        canonical_key=core.build_canonical_key(precept_id, ["IGNIS"], modifiers),
+        name=f"{precept_id} {rank}",
+        precept_id=precept_id,
+        numen_ids=["IGNIS"],
+        modifiers=modifiers,
+        mechanical={},
+        cost={},
+        tier=1,
+        meta={},
+    )
+
+
+def save(core, grimoire, changed_ids):
+    core.save_ordinances(grimoire, make_backup=False, commit_to_repo=False, changed_ids=changed_ids)
+
+
+def on_disk(core):
+    """{oid: [precept_id of every shard holding it]}"""
+    found = {}
+    for data in core.arcana_shards.load_records(core.SHARD_DIR):
+        found.setdefault(data["id"], []).append(data["precept_id"])
+    return found
+
+
+def test_precept_change_leaves_old_shard(core):
+    grimoire = core.load_ordinances()
+    grimoire["ORD_000001"] = make(core, "ORD_000001", "ENCENDER", 1)
+    grimoire["ORD_000002"] = make(core, "ORD_000002", "ENCENDER", 2)
+    save(core, grimoire, ["ORD_000001", "ORD_000002"])
+
+    grimoire["ORD_000001"] = make(core, "ORD_000001", "ENFRIAR", 1)
+    save(core, grimoire, ["ORD_000001"])
+    assert on_disk(core) == {"ORD_000001": ["ENFRIAR"], "ORD_000002": ["ENCENDER"]}
+
+
+def test_precept_change_after_reload(core):
+    grimoire = core.load_ordinances()
+    grimoire["ORD_000001"] = make(core, "ORD_000001", "ENCENDER")
+    save(core, grimoire, ["ORD_000001"])
+
+    # Otro proceso: solo sabe dónde está cada id por lo que carga del disco
+    core._SHARD_OF.clear()
+    grimoire = core.load_ordinances()
+    grimoire["ORD_000001"] = make(core, "ORD_000001", "ENFRIAR")
+    save(core, grimoire, ["ORD_000001"])
+    assert on_disk(core) == {"ORD_000001": ["ENFRIAR"]}
+    # El shard vacío desaparece del manifest y del disco
+    manifest = core.arcana_shards.load_manifest(core.SHARD_DIR)
+    assert list(manifest["shards"]) == ["ENFRIAR"]
+    assert not os.path.exists(os.path.join(core.SHARD_DIR, "ENCENDER.json"))
+
+
+def test_deleted_ordinance_leaves_its_shard(core):
+    grimoire = core.load_ordinances()
+    grimoire["ORD_000001"] = make(core, "ORD_000001", "ENCENDER", 1)
+    grimoire["ORD_000002"] = make(core, "ORD_000002", "ENCENDER", 2)
+    save(core, grimoire, ["ORD_000001", "ORD_000002"])
+
+    del grimoire["ORD_000001"]
+    save(core, grimoire, ["ORD_000001"])
+    assert on_disk(core) == {"ORD_000002": ["ENCENDER"]}
+
+
+def test_full_rewrite_removes_emptied_shards(core):
+    grimoire = core.load_ordinances()
+    grimoire["ORD_000001"] = make(core, "ORD_000001", "ENCENDER")
+    save(core, grimoire, ["ORD_000001"])
+
+    core._SHARD_OF.clear()
+    grimoire["ORD_000001"] = make(core, "ORD_000001", "ENFRIAR")
+    save(core, grimoire, None)
+    assert on_disk(core) == {"ORD_000001": ["ENFRIAR"]}
+    assert core.load_ordinances()["ORD_000001"].precept_id == "ENFRIAR"
@@ -0,0 +1,135 @@
+# SQLite backend (ARCANA_DB_PATH=*.sqlite): the grimoire is a SqliteGrimoire,
+# so startup reads no rows and duplicate checks and Grimorio queries are
+# answered by the indexed tables.
+
+from __future__ import annotations
+import importlib
+import json
+import sys
+
+import pytest
+
+
+@pytest.fixture
+def core(tmp_path, monkeypatch):
+    # arcana_core lee la configuración al importarse
+    monkeypatch.setenv("ARCANA_DB_PATH", str(tmp_path / "ordinances.sqlite"))
+    monkeypatch.setenv("ARCANA_JSON_DB_PATH", str(tmp_path / "ordinances_db.json"))
+    monkeypatch.setenv("ARCANA_BACKUP_DIR", str(tmp_path / "grimoire_h"))
+    monkeypatch.delenv("ARCANA_DB_SHARDED", raising=False)
+    monkeypatch.delenv("GITHUB_TOKEN_ARCANA", raising=False)
+    sys.modules.pop("arcana_core", None)
+    module = importlib.import_module("arcana_core")
+    assert module.SQLITE_MODE
+    yield module
+    sys.modules.pop("arcana_core", None)
+
+
+def make(core, precept_id, numen_ids, rank=1, tier=1, name=None):
+    modifiers = [core.ModifierSelection("INTENSIDAD_POTENCIADO", rank)]
+    return core.Ordinance(
+        id="",
+        canonical_key=core.build_canonical_key(precept_id, numen_ids, modifiers),
+        name=name or f"{precept_id} {rank}",
+        precept_id=precept_id,
+        numen_ids=numen_ids,
+        modifiers=modifiers,
+        mechanical={},
+        cost={},
+        tier=tier,
+        meta={},
+    )
+
+
+def insert(core, grimoire, ord_obj):
+    return core.insert_ordinance(grimoire, ord_obj, commit_to_repo=False)
+
+
+def fill(core, grimoire):
+    insert(core, grimoire, make(core, "ENCENDER", ["IGNIS"], 1, tier=1, name="Llama"))
+    insert(core, grimoire, make(core, "ENCENDER", ["IGNIS", "AQUA"], 2, tier=2, name="vapor"))
+    insert(core, grimoire, make(core, "ENFRIAR", ["AQUA"], 1, tier=2, name="Escarcha"))
+    insert(core, grimoire, make(core, "ENFRIAR", ["AQUA"], 3, tier=3, name="Glaciar"))
+
+
+def test_startup_reads_no_rows(core, monkeypatch):
+    fill(core, core.load_ordinances())
+
+    def full_load(path):
+        raise AssertionError("every row loaded")
+
+    monkeypatch.setattr(core.arcana_sqlite, "load_records", full_load)
+    grimoire = core.load_ordinances()
+    assert isinstance(grimoire, core.SqliteGrimoire)
+    assert len(grimoire) == 4
+    assert core.grimoire_facets(grimoire) == (["ENCENDER", "ENFRIAR"], ["AQUA", "IGNIS"], [1, 2, 3])
+    assert grimoire.hydration_stats()["size"] == 0
+
+
+def test_duplicate_check_sees_other_writers(core):
+    mine = core.load_ordinances()
+    theirs = core.load_ordinances()
+    saved = insert(core, theirs, make(core, "ENCENDER", ["IGNIS"]))
+
+    # Lo que hace el Constructor de la app con el grimorio compartido
+    found = core.find_by_canonical_key(mine, saved.canonical_key)
+    assert found is not None and found.id == saved.id
+    again = insert(core, mine, make(core, "ENCENDER", ["IGNIS"]))
+    assert again.id == saved.id
+    assert insert(core, mine, make(core, "ENFRIAR", ["AQUA"])).id == "ORD_000002"
+    assert len(mine) == len(theirs) == 2
+
+
+def test_queries_match_plain_grimoire(core):
+    grimoire = core.load_ordinances()
+    fill(core, grimoire)
+    plain = dict(grimoire.items())
+    assert list(plain) == ["ORD_000001", "ORD_000002", "ORD_000003", "ORD_000004"]
+
+    for filters in (
+        {},
+        {"precept_ids": ["ENFRIAR"]},
+        {"numen_ids": ["AQUA"], "tiers": [2]},
+        {"name_contains": "VAP"},
+    ):
+        expected = sorted(
+            (o for o in plain.values() if o.id in {m.id for m in core.query_ordinances(plain, **filters)}),
+            key=lambda o: (o.tier, o.name.lower()),
+        )
+        assert core.query_ordinance_ids(grimoire, **filters) == [o.id for o in expected]
+        counts = {}
+        for o in expected:
+            key = (o.tier, core._effect_type_for(o))
+            counts[key] = counts.get(key, 0) + 1
+        assert core.grimoire_distribution(grimoire, **filters) == counts
+
+
+def test_delete_and_stale_writer(core):
+    grimoire = core.load_ordinances()
+    fill(core, grimoire)
+    del grimoire["ORD_000002"]
+    assert "ORD_000002" not in grimoire and len(grimoire) == 3
+    core.save_ordinances(grimoire, commit_to_repo=False, changed_ids=["ORD_000002"])
+    assert core.load_ordinances().get("ORD_000002") is None
+
+    # Sesión con id elegido sin lock: otra se lo quitó entre medias
+    stale = core.load_ordinances()
+    ord_obj = make(core, "ENCENDER", ["IGNIS"], 5)
+    ord_obj.id = stale.next_id()
+    insert(core, core.load_ordinances(), make(core, "ENFRIAR", ["AQUA"], 5))
+    stale[ord_obj.id] = ord_obj
+    core.save_ordinances(stale, commit_to_repo=False, changed_ids=[ord_obj.id])
+    final = core.load_ordinances()
+    assert len(final) == 5
+    assert final.find_by_canonical_key(ord_obj.canonical_key).id == "ORD_000006"
+
+
+def test_export_matches_plain_grimoire(core):
+    grimoire = core.load_ordinances()
+    fill(core, grimoire)
+    plain = core.Grimoire(dict(grimoire.items()))
+    for fmt in ("json", "ndjson", "csv"):
+        assert core.export_ordinances_bytes(grimoire, fmt) == b"".join(core.iter_export(plain, fmt))
+    only = ["ORD_000003", "ORD_000001"]
+    assert core.export_ordinances_bytes(grimoire, "ndjson", only) == b"".join(core.iter_export(plain, "ndjson", only))
+    assert list(json.loads(core.export_ordinances_bytes(grimoire, "json", only))) == only
@@ -0,0 +1,102 @@
+# GitHubSyncWorker: coalescing of sync requests and the per-process queue file.
+
+from __future__ import annotations
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import arcana_sync
+
+
+class Recorder:
+    """commit_fn that records the paths it was called with; fails `fail` times first."""
+
+    def __init__(self, fail: int = 0):
+        self.calls = []
+        self.fail = fail
+        self.done = threading.Event()
+
+    def __call__(self, paths):
+        self.calls.append(set(paths))
+        if self.fail:
+            self.fail -= 1
+            raise RuntimeError("GitHub is down")
+        self.done.set()
+
+
+def worker(tmp_path, commit_fn, debounce=0.05):
+    return arcana_sync.GitHubSyncWorker(
+        commit_fn,
+        str(tmp_path / "ordinances_db.json.sync_pending"),
+        debounce_seconds=debounce,
+        max_delay_seconds=60,
+        max_backoff_seconds=0.05,
+    )
+
+
+def dead_pid() -> int:
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+def test_full_sync_is_not_narrowed_by_later_paths(tmp_path):
+    commit = Recorder()
+    w = worker(tmp_path, commit, debounce=0.2)
+    w.request_sync()
+    w.request_sync(["ordinances_db/ENCENDER.json"])
+    assert w.wait_idle(5)
+    assert commit.calls == [set()]
+
+
+def test_paths_are_coalesced(tmp_path):
+    commit = Recorder()
+    w = worker(tmp_path, commit, debounce=0.2)
+    w.request_sync(["ordinances_db/ENCENDER.json"])
+    w.request_sync(["ordinances_db/ENFRIAR.json"])
+    assert w.wait_idle(5)
+    assert commit.calls == [{"ordinances_db/ENCENDER.json", "ordinances_db/ENFRIAR.json"}]
+
+
+def test_full_sync_survives_a_failed_commit(tmp_path):
+    commit = Recorder(fail=1)
+    w = worker(tmp_path, commit)
+    w.request_sync()
+    assert commit.done.wait(5)
+    assert w.wait_idle(5)
+    assert commit.calls == [set(), set()]
+
+
+def test_queue_file_is_per_process_and_keeps_the_full_flag(tmp_path):
+    w = worker(tmp_path, Recorder(), debounce=3600)
+    w.request_sync()
+    assert w.pending_path == str(tmp_path / f"ordinances_db.json.{os.getpid()}.sync_pending")
+    with open(w.pending_path, encoding="utf-8") as f:
+        assert json.load(f)["all"] is True
+
+
+def test_adopts_queues_of_dead_processes_only(tmp_path):
+    dead = tmp_path / f"ordinances_db.json.{dead_pid()}.sync_pending"
+    alive = tmp_path / f"ordinances_db.json.{os.getppid()}.sync_pending"
+    legacy = tmp_path / "ordinances_db.json.sync_pending"
+    dead.write_text(json.dumps({"pending": 2, "all": False, "paths": ["ordinances_db/ENCENDER.json"]}))
+    alive.write_text(json.dumps({"pending": 1, "all": True, "paths": []}))
+    legacy.write_text(json.dumps({"pending": 1, "paths": ["ordinances_db/ENFRIAR.json"]}))
+
+    commit = Recorder()
+    w = worker(tmp_path, commit)
+    assert w.wait_idle(5)
+    assert commit.calls == [{"ordinances_db/ENCENDER.json", "ordinances_db/ENFRIAR.json"}]
+    assert not dead.exists() and not legacy.exists()
+    assert alive.exists()  # su proceso sigue vivo: la subirá él
+    assert not os.path.exists(w.pending_path)
+
+
+def test_legacy_queue_without_paths_means_full_sync(tmp_path):
+    (tmp_path / "ordinances_db.json.sync_pending").write_text(json.dumps({"pending": 3, "paths": []}))
+    commit = Recorder()
+    w = worker(tmp_path, commit)
+    assert w.wait_idle(5)
+    assert commit.calls == [set()]